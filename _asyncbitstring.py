@@ -0,0 +1,58 @@
+"""
+The asyncio bitstream reader, for Python 3.5 and later
+"""
+
+__licence__ = """
+The MIT License
+
+Copyright (c) 2006-2014 Scott Griffiths (dr.scottgriffiths@gmail.com)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+__author__ = "Scott Griffiths"
+
+try:
+    from _cbitstring import BufferedConstBitStream
+except ImportError:
+    from _pybitstring import BufferedConstBitStream
+
+
+class AsyncConstBitStream(BufferedConstBitStream):
+    """Reads bits from an asyncio.StreamReader.
+
+    It's created in the same way as a BufferedConstBitStream, but from an
+    asyncio.StreamReader or anything else with a read(n) coroutine that
+    returns up to n bytes. The methods are the same as for
+    BufferedConstBitStream, except that they are coroutines and so have to
+    be awaited.
+
+    >>> s = AsyncConstBitStream(reader)
+    >>> length = await s.read('uint:12')
+    >>> payload = await s.read('bytes:{0}'.format(length))
+
+    """
+
+    __slots__ = ()
+
+    async def _run(self, steps):
+        for step in steps:
+            if step is not None:
+                return step[0]
+            self._received(await self._recv(self._wanted()))
@@ -38,6 +38,11 @@ import os
 import struct
 import operator
 import collections
+import itertools
+import array
+import bisect
+import json
+import keyword
 
 byteorder = sys.byteorder
 
@@ -47,6 +52,10 @@ MAX_CHARS = 250
 # Maximum size of caches used for speed optimisations.
 CACHE_SIZE = 1000
 
+# Sparse bitstrings are converted to ordinary ones once more than one
+# in this many of their bytes are nonzero.
+SPARSE_DENSITY_THRESHOLD = 32
+
 class Settings(object):
     """Container for module-wide settings. This class is private,
     and the instance below is used to get / set settings."""
@@ -55,12 +64,20 @@ class Settings(object):
     def getbytealigned(self):
         return self._bytealigned
     bytealigned = property(getbytealigned, setbytealigned)
+    def setcacheindex(self, val):
+        self._cacheindex = val
+    def getcacheindex(self):
+        return self._cacheindex
+    cacheindex = property(getcacheindex, setcacheindex)
 
 settings = Settings()
 
 """Determines whether a number of methods default to working only on byte boundaries."""
 settings.bytealigned = False
 
+"""Determines whether the index of a compressed file is saved next to it."""
+settings.cacheindex = False
+
 
 class Error(Exception):
     """Base class for errors in the bitstring module."""
@@ -131,10 +148,31 @@ class ConstByteStore(object):
         return self._rawarray[pos]
 
     def getbyteslice(self, start, end):
-        """Direct access to byte data."""
+        """Direct access to byte data.
+
+        This is a new bytearray, except for file-based data where it's a
+        read-only memoryview of the file.
+
+        """
         c = self._rawarray[start:end]
         return c
 
+    def getbytes(self, start, end):
+        """Return a slice of the byte data as bytes, copying it only once if possible."""
+        try:
+            return memoryview(self._rawarray)[start:end].tobytes()
+        except TypeError:
+            return bytes(self._rawarray[start:end])
+
+    def getbyteview(self, start, end):
+        """Return a memoryview of a slice of the byte data, or None if it isn't in a buffer."""
+        try:
+            return memoryview(self._rawarray)[start:end]
+        except TypeError:
+            if isinstance(self._rawarray, MmapByteArray) and self._rawarray.view is not None:
+                return self._rawarray.view[start:end]
+            return None
+
     @property
     def bytelength(self):
         if not self.bitlength:
@@ -144,7 +182,7 @@ class ConstByteStore(object):
         return eb - sb + 1
 
     def __copy__(self):
-        return ByteStore(self._rawarray[:], self.bitlength, self.offset)
+        return ByteStore(tobytearray(self._rawarray[:]), self.bitlength, self.offset)
 
     def _appendstore(self, store):
         """Join another store on to the end of this one."""
@@ -213,6 +251,81 @@ class ByteStore(ConstByteStore):
         byte, bit = divmod(self.offset + pos, 8)
         self._rawarray[byte] ^= (128 >> bit)
 
+    def setbits(self, positions):
+        """Set the bits at each of the (already validated) positions to 1."""
+        d = self._rawarray
+        offset = self.offset
+        for pos in positions:
+            pos += offset
+            d[pos >> 3] |= 128 >> (pos & 7)
+
+    def unsetbits(self, positions):
+        """Set the bits at each of the (already validated) positions to 0."""
+        d = self._rawarray
+        offset = self.offset
+        for pos in positions:
+            pos += offset
+            d[pos >> 3] &= ~(128 >> (pos & 7))
+
+    def invertbits(self, positions):
+        """Flip the bits at each of the (already validated) positions."""
+        d = self._rawarray
+        offset = self.offset
+        for pos in positions:
+            pos += offset
+            d[pos >> 3] ^= 128 >> (pos & 7)
+
+    def setbitrange(self, start, end):
+        """Set every bit in the range [start, end) to 1."""
+        self._fillbitrange(start, end, True)
+
+    def unsetbitrange(self, start, end):
+        """Set every bit in the range [start, end) to 0."""
+        self._fillbitrange(start, end, False)
+
+    def invertbitrange(self, start, end):
+        """Flip every bit in the range [start, end)."""
+        assert 0 <= start <= end <= self.bitlength
+        if start == end:
+            return
+        startbyte, startbit = divmod(self.offset + start, 8)
+        endbyte, endbit = divmod(self.offset + end, 8)
+        d = self._rawarray
+        firstmask = 0xff >> startbit
+        lastmask = (0xff << (8 - endbit)) & 0xff
+        if startbyte == endbyte:
+            d[startbyte] ^= firstmask & lastmask
+            return
+        d[startbyte] ^= firstmask
+        # The whole bytes are done in one go with a translation table.
+        d[startbyte + 1:endbyte] = d[startbyte + 1:endbyte].translate(INVERT_TABLE)
+        if endbit:
+            d[endbyte] ^= lastmask
+
+    def _fillbitrange(self, start, end, value):
+        """Set every bit in the range [start, end) to value."""
+        assert 0 <= start <= end <= self.bitlength
+        if start == end:
+            return
+        startbyte, startbit = divmod(self.offset + start, 8)
+        endbyte, endbit = divmod(self.offset + end, 8)
+        d = self._rawarray
+        firstmask = 0xff >> startbit
+        lastmask = (0xff << (8 - endbit)) & 0xff
+        if startbyte == endbyte:
+            firstmask &= lastmask
+            lastmask = 0
+        if value:
+            d[startbyte] |= firstmask
+            d[startbyte + 1:endbyte] = b'\xff' * (endbyte - startbyte - 1)
+            if lastmask:
+                d[endbyte] |= lastmask
+        else:
+            d[startbyte] &= ~firstmask
+            d[startbyte + 1:endbyte] = b'\x00' * (endbyte - startbyte - 1)
+            if lastmask:
+                d[endbyte] &= ~lastmask
+
     def setbyte(self, pos, value):
         self._rawarray[pos] = value
 
@@ -220,6 +333,112 @@ class ByteStore(ConstByteStore):
         self._rawarray[start:end] = value
 
 
+class BufferByteStore(ConstByteStore):
+    """A ConstByteStore over a buffer that will be resized, so no views of it can be kept.
+
+    Used internally - not part of public interface.
+    """
+    __slots__ = ()
+
+    def getbyteview(self, start, end):
+        return None
+
+
+class SparseByteStore(ByteStore):
+    """A ByteStore whose data is held in a SparseByteArray.
+
+    Once too large a proportion of the bytes are nonzero the data is
+    converted to a bytearray and the store becomes an ordinary ByteStore.
+
+    Used internally - not part of public interface.
+    """
+    __slots__ = ()
+
+    def __copy__(self):
+        return SparseByteStore(self._rawarray.copy(), self.bitlength, self.offset)
+
+    def setbit(self, pos):
+        ByteStore.setbit(self, pos)
+        self._checkdensity()
+
+    def invertbit(self, pos):
+        ByteStore.invertbit(self, pos)
+        self._checkdensity()
+
+    def setbits(self, positions):
+        ByteStore.setbits(self, positions)
+        self._checkdensity()
+
+    def invertbits(self, positions):
+        ByteStore.invertbits(self, positions)
+        self._checkdensity()
+
+    def invertbitrange(self, start, end):
+        # Inverting a range of whole bytes will make almost all of them nonzero.
+        if self._toodensefor(end - start):
+            self._densify()
+            self.invertbitrange(start, end)
+            return
+        ByteStore.invertbitrange(self, start, end)
+        self._checkdensity()
+
+    def _fillbitrange(self, start, end, value):
+        assert 0 <= start <= end <= self.bitlength
+        if value:
+            if self._toodensefor(end - start):
+                self._densify()
+                self._fillbitrange(start, end, True)
+                return
+            ByteStore._fillbitrange(self, start, end, True)
+            self._checkdensity()
+            return
+        # Only the nonzero bytes need to be cleared.
+        offset = self.offset
+        for i, _ in self._rawarray.nonzero((offset + start) // 8, (offset + end + 7) // 8):
+            ByteStore._fillbitrange(self, max(start, i * 8 - offset),
+                                    min(end, i * 8 + 8 - offset), False)
+
+    def setbyte(self, pos, value):
+        ByteStore.setbyte(self, pos, value)
+        self._checkdensity()
+
+    def setbyteslice(self, start, end, value):
+        ByteStore.setbyteslice(self, start, end, value)
+        self._checkdensity()
+
+    def _appendstore(self, store):
+        ByteStore._appendstore(self, store)
+        self._checkdensity()
+
+    def _prependstore(self, store):
+        self._densify()
+        ByteStore._prependstore(self, store)
+
+    def _checkdensity(self):
+        """Convert to a dense store if there are too many nonzero bytes."""
+        if self._rawarray.nonzerocount() * SPARSE_DENSITY_THRESHOLD > len(self._rawarray):
+            self._densify()
+
+    def _toodensefor(self, bits):
+        """Return whether setting this many more bits would make the store too dense."""
+        return (self._rawarray.nonzerocount() + bits // 8) * SPARSE_DENSITY_THRESHOLD > len(self._rawarray)
+
+    def _densify(self):
+        self._rawarray = self._rawarray.todense()
+        # The slots are the same, so it can simply become an ordinary ByteStore.
+        self.__class__ = ByteStore
+
+
+def tobytearray(data):
+    """Return data as a bytearray, only copying it if it isn't one already.
+
+    Not part of public interface.
+    """
+    if isinstance(data, bytearray):
+        return data
+    return bytearray(data)
+
+
 def offsetcopy(s, newoffset):
     """Return a copy of a ByteStore with the newoffset.
 
@@ -230,7 +449,8 @@ def offsetcopy(s, newoffset):
         return copy.copy(s)
     else:
         if newoffset == s.offset % 8:
-            return ByteStore(s.getbyteslice(s.byteoffset, s.byteoffset + s.bytelength), s.bitlength, newoffset)
+            return ByteStore(tobytearray(s.getbyteslice(s.byteoffset, s.byteoffset + s.bytelength)),
+                             s.bitlength, newoffset)
         newdata = bytearray()
         d = s._rawarray
         assert newoffset != s.offset % 8
@@ -262,6 +482,47 @@ def offsetcopy(s, newoffset):
         return new_s
 
 
+def copyfilerange(source, f, offset, count):
+    """Copy bytes from the file source to the file object f without reading them.
+
+    Uses os.copy_file_range or os.sendfile where they are available and
+    work for the two files, and returns the number of bytes copied, which
+    can be less than count.
+
+    Not part of public interface.
+    """
+    try:
+        infd = source.fileno()
+        outfd = f.fileno()
+        f.flush()
+    except (AttributeError, IOError, OSError, ValueError):
+        return 0
+    calls = []
+    if hasattr(os, 'copy_file_range'):
+        calls.append(lambda pos, n: os.copy_file_range(infd, outfd, n, pos))
+    if hasattr(os, 'sendfile'):
+        calls.append(lambda pos, n: os.sendfile(outfd, infd, pos, n))
+    copied = 0
+    for call in calls:
+        try:
+            while copied < count:
+                n = call(offset + copied, count - copied)
+                if not n:
+                    break
+                copied += n
+        except OSError:
+            # Not supported for these files, so try the next way.
+            continue
+        break
+    if copied:
+        # The bytes went straight to the file descriptor, so resync f with it.
+        try:
+            f.seek(0, os.SEEK_CUR)
+        except (IOError, OSError, ValueError):
+            pass
+    return copied
+
+
 def equal(a, b):
     """Return True if ByteStores a == b.
 
@@ -369,10 +630,14 @@ def equal(a, b):
 class MmapByteArray(object):
     """Looks like a bytearray, but from an mmap.
 
+    Only the part of the file that's used is mapped, so a small piece of a
+    huge file doesn't take up a huge amount of address space.
+
     Not part of public interface.
     """
 
-    __slots__ = ('filemap', 'filelength', 'source', 'byteoffset', 'bytelength')
+    __slots__ = ('filemap', 'filelength', 'source', 'byteoffset', 'bytelength', 'mapoffset', 'view',
+                 'advisedfrom', 'nextadvice', 'droppedto')
 
     def __init__(self, source, bytelength=None, byteoffset=None):
         self.source = source
@@ -384,19 +649,38 @@ class MmapByteArray(object):
             bytelength = self.filelength - byteoffset
         self.byteoffset = byteoffset
         self.bytelength = bytelength
-        self.filemap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        # A mapping has to start on a multiple of the allocation granularity.
+        mapstart = byteoffset - byteoffset % mmap.ALLOCATIONGRANULARITY
+        maplength = min(byteoffset + bytelength, self.filelength) - mapstart
+        # The offset of the first byte in the mapping.
+        self.mapoffset = byteoffset - mapstart
+        if maplength > 0:
+            self.filemap = mmap.mmap(source.fileno(), maplength, access=mmap.ACCESS_READ,
+                                     offset=mapstart)
+        else:
+            # A length of zero would map the whole file.
+            self.filemap = b''
+        try:
+            self.view = memoryview(self.filemap)[self.mapoffset:self.mapoffset + bytelength]
+        except TypeError:
+            # Python 2 can't make a memoryview of an mmap.
+            self.view = None
+        self.advisedfrom = self.nextadvice = self.droppedto = 0
 
     def __getitem__(self, key):
+        # Indexing gives an int and slicing a read-only memoryview, without copying.
+        if self.view is not None:
+            return self.view[key]
         try:
             start = key.start
             stop = key.stop
         except AttributeError:
             try:
                 assert 0 <= key < self.bytelength
-                return ord(self.filemap[key + self.byteoffset])
+                return ord(self.filemap[key + self.mapoffset])
             except TypeError:
                 # for Python 3
-                return self.filemap[key + self.byteoffset]
+                return self.filemap[key + self.mapoffset]
         else:
             if start is None:
                 start = 0
@@ -405,12 +689,324 @@ class MmapByteArray(object):
             assert key.step is None
             assert 0 <= start < self.bytelength
             assert 0 <= stop <= self.bytelength
-            s = slice(start + self.byteoffset, stop + self.byteoffset)
+            s = slice(start + self.mapoffset, stop + self.mapoffset)
             return bytearray(self.filemap.__getitem__(s))
 
     def __len__(self):
         return self.bytelength
 
+    def find(self, sub, start, end):
+        """Return the lowest index of sub between start and end, or -1 if not found."""
+        p = self.filemap.find(sub, start + self.mapoffset, end + self.mapoffset)
+        if p == -1:
+            return p
+        return p - self.mapoffset
+
+    def advise(self, pattern):
+        """Tell the OS how the mapping will be read. Return False if it can't be told."""
+        advice = getattr(mmap, ACCESS_PATTERNS[pattern], None)
+        if advice is None or not hasattr(self.filemap, 'madvise'):
+            # madvise needs Python 3.8, and isn't available on Windows.
+            return False
+        self.filemap.madvise(advice)
+        self.advisedfrom = self.nextadvice = self.droppedto = 0
+        return True
+
+    def readahead(self, bytepos):
+        """Ask for the bytes after bytepos to be read in, and drop those before it.
+
+        This only makes a system call when bytepos has moved out of the part
+        that was last asked for, so it's cheap to call before every read.
+
+        """
+        if self.advisedfrom <= bytepos < self.nextadvice:
+            return
+        # madvise needs a page aligned start, and the mapping starts on one.
+        start = bytepos + self.mapoffset
+        start -= start % mmap.PAGESIZE
+        end = min(start + READAHEAD_SIZE, len(self.filemap))
+        if end > start:
+            self.filemap.madvise(mmap.MADV_WILLNEED, start, end - start)
+        if start > self.droppedto:
+            self.filemap.madvise(mmap.MADV_DONTNEED, self.droppedto, start - self.droppedto)
+            self.droppedto = start
+        self.advisedfrom = start - self.mapoffset
+        # Ask again half way through, so the next part is read in before it's needed.
+        self.nextadvice = self.advisedfrom + READAHEAD_SIZE // 2
+
+
+class CompressedByteArray(object):
+    """Looks like a bytearray, but decompresses from a gzip, bz2 or xz file.
+
+    The whole file is decompressed once when it's opened to find its length.
+    Places where decompressing can be started again are kept as seek points,
+    so reading from part way through the file doesn't decompress it from
+    the beginning. Each compressed stream in the file starts one, and for
+    gzip files a copy of the decompressor is kept every SEEK_POINT_SPACING
+    bytes. The length and the stream seek points can be saved in an index
+    file next to the compressed one, so it's only decompressed once.
+
+    Not part of public interface.
+    """
+
+    __slots__ = ('source', 'module', 'filelength', 'pointpos', 'points', 'decompressor',
+                 'pending', 'compressedpos', 'outpos', 'block')
+
+    def __init__(self, source, module):
+        self.source = source
+        self.module = module
+        # The decompressed positions of the seek points, and their compressed
+        # positions and decompressor states (None at the start of a stream).
+        self.pointpos = []
+        self.points = []
+        self.seek(0, 0, None)
+        self.filelength = self.loadindex()
+        if self.filelength is None:
+            while self.decompressnext() is not None:
+                pass
+            self.filelength = self.outpos
+            if settings.cacheindex:
+                self.saveindex()
+
+    def __getitem__(self, key):
+        try:
+            start, stop, step = key.indices(self.filelength)
+        except AttributeError:
+            if key < 0:
+                key += self.filelength
+            assert 0 <= key < self.filelength
+            return self.read(key, key + 1)[0]
+        assert step == 1
+        return self.read(start, max(start, stop))
+
+    def __len__(self):
+        return self.filelength
+
+    def read(self, start, stop):
+        """Return the decompressed bytes from start to stop as a bytearray."""
+        i = bisect.bisect_right(self.pointpos, start) - 1
+        if i >= 0 and (start < self.outpos - len(self.block) or self.pointpos[i] > self.outpos):
+            # Going back, or there's a seek point nearer than the current position.
+            self.seek(self.pointpos[i], *self.points[i])
+        blockstart = self.outpos - len(self.block)
+        data = bytearray(self.block[max(start - blockstart, 0):max(stop - blockstart, 0)])
+        while self.outpos < stop:
+            chunk = self.decompressnext()
+            assert chunk is not None
+            chunkstart = self.outpos - len(chunk)
+            if self.outpos > start:
+                data += chunk[max(start - chunkstart, 0):stop - chunkstart]
+        return data
+
+    def seek(self, outpos, compressedpos, state):
+        """Start decompressing from a seek point."""
+        self.source.seek(compressedpos)
+        self.compressedpos = compressedpos
+        self.outpos = outpos
+        self.decompressor = None if state is None else state.copy()
+        self.pending = b''
+        self.block = b''
+
+    def addpoint(self, state):
+        """Add a seek point at the current position, if there isn't one near it."""
+        i = bisect.bisect_right(self.pointpos, self.outpos)
+        if i and self.outpos - self.pointpos[i - 1] < (1 if state is None else SEEK_POINT_SPACING):
+            return
+        self.pointpos.insert(i, self.outpos)
+        self.points.insert(i, (self.compressedpos, None if state is None else state.copy()))
+
+    def newdecompressor(self):
+        """Return a decompressor for one compressed stream."""
+        if self.module.__name__ == 'zlib':
+            # Add 16 to the window bits for a gzip header.
+            return self.module.decompressobj(16 + self.module.MAX_WBITS)
+        if self.module.__name__ == 'bz2':
+            return self.module.BZ2Decompressor()
+        return self.module.LZMADecompressor()
+
+    def decompressnext(self):
+        """Decompress the next chunk of the file and return it, or None at the end."""
+        while True:
+            data = self.pending or self.source.read(DECOMPRESS_CHUNK_SIZE)
+            self.pending = b''
+            if self.decompressor is not None:
+                break
+            # Streams can be followed by zero bytes of padding.
+            stripped = data.lstrip(b'\x00')
+            self.compressedpos += len(data) - len(stripped)
+            if stripped:
+                data = stripped
+                self.addpoint(None)
+                self.decompressor = self.newdecompressor()
+                break
+            if not data:
+                return None
+        # Before Python 3.3 decompressors don't say when a stream has ended,
+        # so it's only seen from the data after it, or from the end of the file.
+        knowseof = hasattr(self.decompressor, 'eof')
+        if not data:
+            if knowseof:
+                raise CreationError("The compressed file '{0}' ends part way through a stream.",
+                                    self.source.name)
+            chunk = self.decompressor.flush() if hasattr(self.decompressor, 'flush') else b''
+            self.decompressor = None
+            self.outpos += len(chunk)
+            if chunk:
+                self.block = chunk
+            return chunk
+        try:
+            chunk = self.decompressor.decompress(data)
+        except EOFError as e:
+            if knowseof:
+                raise CreationError("Couldn't decompress '{0}': {1}", self.source.name, e)
+            # An old bz2 decompressor given the start of the next stream.
+            self.pending = data
+            self.decompressor = None
+            return b''
+        except (IOError, OSError, getattr(self.module, 'error', IOError),
+                getattr(self.module, 'LZMAError', IOError)) as e:
+            # zlib, bz2 and lzma each raise their own kind of error for bad data.
+            raise CreationError("Couldn't decompress '{0}': {1}", self.source.name, e)
+        self.compressedpos += len(data)
+        self.outpos += len(chunk)
+        if self.decompressor.eof if knowseof else self.decompressor.unused_data:
+            self.pending = self.decompressor.unused_data
+            self.compressedpos -= len(self.pending)
+            self.decompressor = None
+        elif hasattr(self.decompressor, 'copy'):
+            self.addpoint(self.decompressor)
+        if chunk:
+            self.block = chunk
+        return chunk
+
+    def loadindex(self):
+        """Read the seek points from an index file and return the length, or None."""
+        stat = os.fstat(self.source.fileno())
+        try:
+            with open(self.source.name + INDEX_SUFFIX, 'r') as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            if index['size'] != stat.st_size or index['mtime'] != stat.st_mtime:
+                # The compressed file has been changed since the index was saved.
+                return None
+            points = [(int(outpos), int(compressedpos)) for outpos, compressedpos in index['points']]
+            length = int(index['length'])
+        except (KeyError, TypeError, ValueError):
+            # Treat an index that isn't as expected as out of date.
+            return None
+        for outpos, compressedpos in points:
+            self.pointpos.append(outpos)
+            self.points.append((compressedpos, None))
+        return length
+
+    def saveindex(self):
+        """Save the length and the stream seek points in an index file."""
+        stat = os.fstat(self.source.fileno())
+        index = {'size': stat.st_size, 'mtime': stat.st_mtime, 'length': self.filelength,
+                 'points': [[outpos, compressedpos] for outpos, (compressedpos, state)
+                            in zip(self.pointpos, self.points) if state is None]}
+        try:
+            with open(self.source.name + INDEX_SUFFIX, 'w') as f:
+                json.dump(index, f)
+        except (IOError, OSError):
+            # It's only saved to make opening faster next time.
+            pass
+
+
+class SparseByteArray(object):
+    """Looks like a bytearray, but only stores the bytes that aren't zero.
+
+    Not part of public interface.
+    """
+
+    __slots__ = ('_bytes', 'length')
+
+    def __init__(self, length, nonzero=None):
+        self.length = length
+        if nonzero is None:
+            nonzero = {}
+        self._bytes = nonzero
+
+    def __getitem__(self, key):
+        try:
+            start, stop, step = key.indices(self.length)
+        except AttributeError:
+            if key < 0:
+                key += self.length
+            if not 0 <= key < self.length:
+                raise IndexError("SparseByteArray index out of range")
+            return self._bytes.get(key, 0)
+        assert step == 1
+        data = bytearray(max(stop - start, 0))
+        for i, byte in self.nonzero(start, stop):
+            data[i - start] = byte
+        return data
+
+    def __setitem__(self, key, value):
+        try:
+            start, stop, step = key.indices(self.length)
+        except AttributeError:
+            if key < 0:
+                key += self.length
+            assert 0 <= key < self.length
+            if value:
+                self._bytes[key] = value
+            else:
+                self._bytes.pop(key, None)
+            return
+        assert step == 1
+        stop = max(start, stop)
+        assert len(value) == stop - start
+        for i, _ in self.nonzero(start, stop):
+            del self._bytes[i]
+        for m in NONZERO_BYTE_RE.finditer(value):
+            i = m.start()
+            self._bytes[start + i] = value[i]
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        d = self._bytes
+        for i in xrange(self.length):
+            yield d.get(i, 0)
+
+    def append(self, value):
+        self.length += 1
+        self[-1] = value
+
+    def extend(self, data):
+        start = self.length
+        self.length += len(data)
+        for m in NONZERO_BYTE_RE.finditer(data):
+            i = m.start()
+            self._bytes[start + i] = data[i]
+
+    def pop(self):
+        self.length -= 1
+        return self._bytes.pop(self.length, 0)
+
+    def nonzero(self, start, stop):
+        """Return sorted list of (index, byte) for nonzero bytes in [start, stop)."""
+        d = self._bytes
+        if stop - start < len(d):
+            return [(i, d[i]) for i in xrange(start, stop) if i in d]
+        return sorted((i, byte) for i, byte in d.items() if start <= i < stop)
+
+    def nonzerocount(self):
+        return len(self._bytes)
+
+    def copy(self):
+        return SparseByteArray(self.length, dict(self._bytes))
+
+    def todense(self):
+        data = bytearray(self.length)
+        for i, byte in self._bytes.items():
+            data[i] = byte
+        return data
+
 
 # This creates a dictionary for every possible byte with the value being
 # the key with its bits reversed.
@@ -429,6 +1025,9 @@ except NameError:
     xrange = range
     basestring = str
 
+# Translation table that inverts every bit of a byte, for bytearray.translate.
+INVERT_TABLE = bytes(bytearray(255 - i for i in xrange(256)))
+
 # Python 2.x octals start with '0', in Python 3 it's '0o'
 LEADING_OCT_CHARS = len(oct(1)) - 1
 
@@ -439,12 +1038,15 @@ def tidy_input_string(s):
 
 INIT_NAMES = ('uint', 'int', 'ue', 'se', 'sie', 'uie', 'hex', 'oct', 'bin', 'bits',
               'uintbe', 'intbe', 'uintle', 'intle', 'uintne', 'intne',
-              'float', 'floatbe', 'floatle', 'floatne', 'bytes', 'bool', 'pad')
+              'float', 'floatbe', 'floatle', 'floatne', 'bytes', 'bytesview', 'bool', 'pad')
 
 TOKEN_RE = re.compile(r'(?P<name>' + '|'.join(INIT_NAMES) +
                       r')((:(?P<len>[^=]+)))?(=(?P<value>.*))?$', re.IGNORECASE)
 DEFAULT_UINT = re.compile(r'(?P<len>[^=]+)?(=(?P<value>.*))?$', re.IGNORECASE)
 
+# Tokens whose lengths are given in bytes.
+BYTES_TOKENS = ('bytes', 'bytesview')
+
 MULTIPLICATIVE_RE = re.compile(r'(?P<factor>.*)\*(?P<token>.+)')
 
 # Hex, oct or binary literals
@@ -474,9 +1076,38 @@ REPLACEMENTS_LE = {'b': 'intle:8', 'B': 'uintle:8',
 PACK_CODE_SIZE = {'b': 1, 'B': 1, 'h': 2, 'H': 2, 'l': 4, 'L': 4,
                   'q': 8, 'Q': 8, 'f': 4, 'd': 8}
 
+# The struct endianness and code for each whole-byte token name and length,
+# so that runs of byte-aligned tokens can be handled with a single struct
+# call. Single bytes have no endianness so can join any run.
+STRUCT_CODES = {}
+for _names, _endian in ((('uint', 'int', 'uintbe', 'intbe', 'float', 'floatbe'), '>'),
+                        (('uintle', 'intle', 'floatle'), '<'),
+                        (('uintne', 'intne', 'floatne'), '<' if byteorder == 'little' else '>')):
+    for _name in _names:
+        for _code in ('fd' if _name.startswith('float') else 'bhlq'):
+            _length = 8 * PACK_CODE_SIZE[_code]
+            if _name.startswith('u'):
+                _code = _code.upper()
+            STRUCT_CODES[(_name, _length)] = (None if _length == 8 else _endian, _code)
+del _names, _endian, _name, _code, _length
+
+def structcode(name, length):
+    """Return the struct endianness and code for a token, or None if it has none.
+
+    Not part of public interface.
+
+    """
+    try:
+        return STRUCT_CODES[(name, length)]
+    except KeyError:
+        if name in ('bytes', 'pad') and length and not length % 8:
+            return None, '{0}{1}'.format(length // 8, 's' if name == 'bytes' else 'x')
+        return None
+
 _tokenname_to_initialiser = {'hex': 'hex', '0x': 'hex', '0X': 'hex', 'oct': 'oct',
                              '0o': 'oct', '0O': 'oct', 'bin': 'bin', '0b': 'bin',
-                             '0B': 'bin', 'bits': 'auto', 'bytes': 'bytes', 'pad': 'pad'}
+                             '0B': 'bin', 'bits': 'auto', 'bytes': 'bytes', 'bytesview': 'bytes',
+                             'pad': 'pad'}
 
 def structparser(token):
     """Parse struct-like format string token into sub-token list."""
@@ -587,8 +1218,8 @@ def tokenparser(fmt, keys=None, token_cache={}):
                     length = int(length)
                     if length < 0:
                         raise Error
-                    # For the 'bytes' token convert length to bits.
-                    if name == 'bytes':
+                    # For the 'bytes' tokens convert length to bits.
+                    if name in BYTES_TOKENS:
                         length *= 8
                 except Error:
                     raise ValueError("Can't read a token with a negative length.")
@@ -648,6 +1279,150 @@ OCT_TO_BITS = ['{0:03b}'.format(i) for i in xrange(8)]
 # A dictionary of number of 1 bits contained in binary representation of any byte
 BIT_COUNT = dict(zip(xrange(256), [bin(i).count('1') for i in xrange(256)]))
 
+# The bit positions (0 is the most significant bit) of the 1 bits in any byte.
+SET_BIT_POSITIONS = [tuple(b for b in xrange(8) if i & (128 >> b)) for i in xrange(256)]
+
+# Every byte as a tuple of eight bools, used for fast iteration.
+BYTE_TO_BOOLS = [tuple(bool(i & (128 >> b)) for b in xrange(8)) for i in xrange(256)]
+
+# Used to skip over bytes that have no bits set to 1 (or to 0) when searching for bits.
+NONZERO_BYTE_RE = re.compile(b'[^\x00]')
+NONFF_BYTE_RE = re.compile(b'[^\xff]')
+
+# Size in bytes of the chunks used when scanning through the data.
+SCAN_CHUNK_SIZE = 65536
+
+# Translation table that replaces every byte with the number of 1 bits it contains.
+POPCOUNT_TABLE = bytes(bytearray(BIT_COUNT[i] for i in xrange(256)))
+
+# Number of bits in each block of the rank / select index.
+RANK_BLOCK_SIZE = 512
+
+# The rank index can hold counts of more than 2**32 bits if the platform allows.
+try:
+    array.array('Q')
+    RANK_TYPECODE = 'Q'
+except ValueError:
+    RANK_TYPECODE = 'L'
+
+# The array.array integer type codes that are available, smallest first.
+ARRAY_TYPECODES = {True: [], False: []}
+for _code in 'bBhHiIlLqQ':
+    try:
+        ARRAY_TYPECODES[_code.islower()].append((array.array(_code).itemsize * 8, _code))
+    except ValueError:
+        pass
+del _code
+
+# The number of bits peeked at when looking for the end of an exponential-Golomb code.
+EXPGOLOMB_WINDOW = 32
+
+# The number of bits decoded at a time when reading arrays of exponential-Golomb codes.
+EXPGOLOMB_BLOCK_SIZE = 4096
+
+# Masks for each window size with the bits set that could end an interleaved
+# exponential-Golomb code, i.e. every other bit starting from the top bit.
+UIE_FLAG_MASKS = [int(('10' * EXPGOLOMB_WINDOW)[:n] or '0', 2) for n in xrange(EXPGOLOMB_WINDOW + 1)]
+
+# For each byte, its bits spread out to every other bit of a 16 bit int.
+SPREAD_BITS = [sum(((i >> k) & 1) << (2 * k) for k in xrange(8)) for i in xrange(256)]
+
+def uecode(i):
+    """Return the unsigned exponential-Golomb code for i as an int and a length.
+
+    The code is i + 1 preceded by one fewer zeros than it has bits.
+    Not part of public interface.
+
+    """
+    i += 1
+    return i, 2 * len(bin(i)) - 5
+
+def uiecode(i):
+    """Return the unsigned interleaved exponential-Golomb code for i as an int and a length.
+
+    The bits of i + 1 after the leading 1 each follow a 0 flag bit, and a
+    1 flag bit ends the code. Not part of public interface.
+
+    """
+    i += 1
+    databits = len(bin(i)) - 3
+    data = i - (1 << databits)
+    code = 0
+    shift = 0
+    while data:
+        code |= SPREAD_BITS[data & 0xff] << shift
+        data >>= 8
+        shift += 16
+    return (code << 1) | 1, 2 * databits + 1
+
+# The number of bytes a BufferedConstBitStream asks its source for at a time.
+STREAM_CHUNK_SIZE = 65536
+
+# A valid name for a field of a Record.
+RECORD_FIELD_RE = re.compile(r'[A-Za-z]\w*$')
+
+# A BitWriter moves whole bytes into its buffer once it has this many bits.
+BITWRITER_FLUSH_BITS = 1024
+
+# The number of bytes a BitWriter buffers before sending them to a file.
+BITWRITER_BUFFER_SIZE = 1 << 20
+
+# The number of bits taken at a time when reading many codes with a VLCTable.
+VLC_BLOCK_SIZE = 4096
+
+# The number of fields converted at a time by the NumPy methods. It's a
+# multiple of 8 so that each chunk is a whole number of bytes.
+NUMPY_CHUNK_SIZE = 65536
+
+# The access patterns a ConstBitStream can be given, and the names of the
+# madvise advice that each gives for a file.
+ACCESS_PATTERNS = {'normal': 'MADV_NORMAL', 'sequential': 'MADV_SEQUENTIAL',
+                   'random': 'MADV_RANDOM'}
+
+# The number of bytes of a file ahead of the position that a sequential
+# ConstBitStream asks to have read in.
+READAHEAD_SIZE = 1 << 22
+
+# The extensions of the compressed files that can be read from, and the
+# modules that decompress them.
+COMPRESSED_EXTENSIONS = {'.gz': 'zlib', '.bz2': 'bz2', '.xz': 'lzma'}
+
+# The number of bytes read from a compressed file at a time.
+DECOMPRESS_CHUNK_SIZE = 65536
+
+# The number of decompressed bytes between the copies of the decompressor
+# that are kept for a gzip file.
+SEEK_POINT_SPACING = 1 << 24
+
+# Added to the name of a compressed file for the name of its index file.
+INDEX_SUFFIX = '.bsidx'
+
+def import_decompressor(filename):
+    """Return the module that decompresses a file, or None if it isn't compressed."""
+    name = COMPRESSED_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+    if name is None:
+        return None
+    try:
+        return __import__(name)
+    except ImportError:
+        raise CreationError("The {0} module is needed to read '{1}', but it couldn't be imported.",
+                            name, filename)
+
+def import_numpy():
+    """Return the numpy module, which is imported only when it's first needed."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("NumPy is needed for this method, but it couldn't be imported.")
+    return numpy
+
+def array_typecode(length, signed):
+    """Return the smallest array.array type code for integers of length bits, or None."""
+    for bits, code in ARRAY_TYPECODES[bool(signed)]:
+        if bits >= length:
+            return code
+    return None
+
 
 class Bits(object):
     """A container holding an immutable sequence of bits.
@@ -663,13 +1438,21 @@ class Bits(object):
     endswith() -- Return whether the bitstring ends with a sub-string.
     find() -- Find a sub-bitstring in the current bitstring.
     findall() -- Find all occurrences of a sub-bitstring in the current bitstring.
+    from_numpy() -- Create a bitstring from a NumPy array of packed fields.
+    iter_set() -- Create generator of the positions of bits set to 1 or 0.
     join() -- Join bitstrings together using current bitstring.
+    rank() -- Count the number of 1 bits before a position.
     rfind() -- Seek backwards to find a sub-bitstring.
+    select() -- Find the position of the nth 1 bit.
     split() -- Create generator of chunks split by a delimiter.
     startswith() -- Return whether the bitstring starts with a sub-bitstring.
+    to_numpy() -- Interpret bits as packed fields and return a NumPy array.
     tobytes() -- Return bitstring as bytes, padding if needed.
+    tomemoryview() -- Return a read-only memoryview of the bitstring as bytes.
     tofile() -- Write bitstring to file, padding if needed.
     unpack() -- Interpret bits using format string.
+    unpack_array() -- Interpret bits as consecutive items of one fixed-length token.
+    unpack_many() -- Interpret bits as repeated records, returning arrays of fields.
 
     Special methods:
 
@@ -702,7 +1485,7 @@ class Bits(object):
 
     """
 
-    __slots__ = ('_datastore')
+    __slots__ = ('_datastore', '_rankindex')
 
     def __init__(self, auto=None, length=None, offset=None, **kwargs):
         """Either specify an 'auto' initialiser:
@@ -732,6 +1515,7 @@ class Bits(object):
         uie -- an unsigned interleaved exponential-Golomb code.
         bool -- a boolean (True or False).
         filename -- a file which will be opened in binary read-only mode.
+                    Files ending in .gz, .bz2 or .xz are decompressed.
 
         Other keyword arguments:
         length -- length of the bitstring in bits, if needed and appropriate.
@@ -739,6 +1523,8 @@ class Bits(object):
         offset -- bit offset to the data. These offset bits are
                   ignored and this is mainly intended for use when
                   initialising using 'bytes' or 'filename'.
+        sparse -- if True, create a bitstring of zeros that only stores
+                  its nonzero bytes. Use with just a length.
 
         """
         pass
@@ -776,6 +1562,9 @@ class Bits(object):
             raise CreationError("bitstring length cannot be negative.")
         if offset is not None and offset < 0:
             raise CreationError("offset must be >= 0.")
+        if kwargs.pop('sparse', False):
+            self._initialise_sparse(auto, length, offset, kwargs)
+            return
         if auto is not None:
             self._initialise_from_auto(auto, length, offset)
             return
@@ -805,6 +1594,19 @@ class Bits(object):
                 except KeyError:
                     raise CreationError("Unrecognised keyword '{0}' used to initialise.", k)
 
+    def _initialise_sparse(self, auto, length, offset, kwargs):
+        if kwargs or offset:
+            raise CreationError("A sparse bitstring can only be initialised with a length.")
+        if auto is not None:
+            if length is not None or not isinstance(auto, numbers.Integral):
+                raise CreationError("A sparse bitstring can only be initialised with a length.")
+            if auto < 0:
+                raise CreationError("Can't create bitstring of negative length {0}.", auto)
+            length = auto
+        if length is None:
+            length = 0
+        self._datastore = SparseByteStore(SparseByteArray((length + 7) // 8), length, 0)
+
     def _initialise_from_auto(self, auto, length, offset):
         if offset is None:
             offset = 0
@@ -903,6 +1705,21 @@ class Bits(object):
         """Return the length of the bitstring in bits."""
         return self._getlength()
 
+    def __iter__(self):
+        """Return an iterator over the bits as bools."""
+        length = self.len
+        if not length:
+            return iter(())
+        store = self._datastore
+        firstbyte = store.byteoffset
+        lastbyte = firstbyte + store.bytelength
+        # Each byte becomes a tuple of bools, which are then flattened at C speed.
+        chunks = (store.getbyteslice(i, min(i + SCAN_CHUNK_SIZE, lastbyte))
+                  for i in xrange(firstbyte, lastbyte, SCAN_CHUNK_SIZE))
+        bools = itertools.chain.from_iterable(BYTE_TO_BOOLS[b] for chunk in chunks for b in chunk)
+        bitoffset = self._offset % 8
+        return itertools.islice(bools, bitoffset, bitoffset + length)
+
     def __str__(self):
         """Return approximate string representation of bitstring for printing.
 
@@ -1272,6 +2089,21 @@ class Bits(object):
         source = open(filename, 'rb')
         if offset is None:
             offset = 0
+        module = import_decompressor(filename)
+        if module is not None:
+            try:
+                m = CompressedByteArray(source, module)
+                if length is None:
+                    length = m.filelength * 8 - offset
+                if length + offset > m.filelength * 8:
+                    raise CreationError("File is not long enough for specified "
+                                        "length and offset.")
+            except Exception:
+                # Don't leave the file open if it can't be used.
+                source.close()
+                raise
+            self._datastore = ConstByteStore(m, length, offset)
+            return
         if length is None:
             length = os.path.getsize(source.name) * 8 - offset
         byteoffset, offset = divmod(offset, 8)
@@ -1300,7 +2132,7 @@ class Bits(object):
 
     def _setbytes_unsafe(self, data, length, offset):
         """Unchecked version of _setbytes_safe."""
-        self._datastore = ByteStore(data[:], length, offset)
+        self._datastore = ByteStore(tobytearray(data[:]), length, offset)
         assert self._assertsanity()
 
     def _readbytes(self, length, start):
@@ -1308,10 +2140,26 @@ class Bits(object):
         assert length % 8 == 0
         assert start + length <= self.len
         if not (start + self._offset) % 8:
-            return bytes(self._datastore.getbyteslice((start + self._offset) // 8,
-                                                      (start + self._offset + length) // 8))
+            return self._datastore.getbytes((start + self._offset) // 8,
+                                            (start + self._offset + length) // 8)
         return self._slice(start, start + length).tobytes()
 
+    def _readbytesview(self, length, start):
+        """Read bytes and return them as a read-only memoryview, without copying if possible."""
+        assert length % 8 == 0
+        assert start + length <= self.len
+        view = None
+        if not (start + self._offset) % 8:
+            view = self._datastore.getbyteview((start + self._offset) // 8,
+                                               (start + self._offset + length) // 8)
+        if view is None:
+            return memoryview(self._readbytes(length, start))
+        try:
+            return view.toreadonly()
+        except AttributeError:
+            # Before Python 3.8
+            return view
+
     def _getbytes(self):
         """Return the data as an ordinary string."""
         if self.len % 8:
@@ -1365,7 +2213,7 @@ class Bits(object):
         startbyte = (start + offset) // 8
         endbyte = (start + offset + length - 1) // 8
 
-        b = binascii.hexlify(bytes(self._datastore.getbyteslice(startbyte, endbyte + 1)))
+        b = binascii.hexlify(self._datastore.getbyteslice(startbyte, endbyte + 1))
         assert b
         i = int(b, 16)
         final_bits = 8 - ((start + offset + length) % 8)
@@ -1415,6 +2263,69 @@ class Bits(object):
         """Return data as a two's complement signed int."""
         return self._readint(self.len, 0)
 
+    def _readintarray(self, length, start, count, signed, typecode, stride=None):
+        """Read count ints of length bits, each stride bits after the last.
+
+        The ints are returned in an array.array with the typecode given, or
+        in a list if the typecode is None. The stride defaults to the length.
+
+        """
+        values = [] if typecode is None else array.array(typecode)
+        if not count:
+            return values
+        if stride is None:
+            stride = length
+        mask = (1 << length) - 1
+        # Two's complement values are found from the unsigned ones by
+        # flipping the sign bit and subtracting it.
+        signbit = 1 << (length - 1) if signed else 0
+        # Each group of values is converted from a single int. A multiple of
+        # 8 values is a whole number of bytes, so every group has the same offset.
+        groupsize = 8 * max(1, 64 // stride)
+        groupbytes = groupsize * stride // 8
+        absstart = start + self._offset
+        bitoffset = absstart % 8
+        extrabits = (8 - bitoffset) % 8
+        readbytes = groupbytes + (1 if bitoffset else 0)
+        shifts = [stride * (groupsize - 1 - j) + stride - length + extrabits for j in xrange(groupsize)]
+        fullgroups, remainder = divmod(count, groupsize)
+        if fullgroups and start + fullgroups * groupsize * stride > self.len:
+            # The last group would run off the end, as there's nothing after its final value.
+            fullgroups -= 1
+            remainder += groupsize
+        blockgroups = max(1, SCAN_CHUNK_SIZE // groupbytes)
+        getbyteslice = self._datastore.getbyteslice
+        hexlify = binascii.hexlify
+        bytepos = absstart // 8
+        for blockstart in xrange(0, fullgroups, blockgroups):
+            blocklength = min(blockgroups, fullgroups - blockstart) * groupbytes
+            block = bytes(getbyteslice(bytepos, bytepos + blocklength + readbytes - groupbytes))
+            for b in xrange(0, blocklength, groupbytes):
+                x = int(hexlify(block[b:b + readbytes]), 16)
+                if signbit:
+                    values.extend([((x >> shift) & mask ^ signbit) - signbit for shift in shifts])
+                else:
+                    values.extend([(x >> shift) & mask for shift in shifts])
+            bytepos += blocklength
+        if remainder:
+            x = self._readuint((remainder - 1) * stride + length, start + fullgroups * groupsize * stride)
+            values.extend([((x >> (stride * j)) & mask ^ signbit) - signbit
+                           for j in xrange(remainder - 1, -1, -1)])
+        return values
+
+    def _readarraybytes(self, typecode, order, start, length):
+        """Read length bits of packed items with the given byte order into an array."""
+        a = array.array(typecode)
+        data = self._readbytes(length, start)
+        try:
+            a.frombytes(data)
+        except AttributeError:
+            # Python 2.x
+            a.fromstring(data)
+        if order != byteorder:
+            a.byteswap()
+        return a
+
     def _setuintbe(self, uintbe, length=None):
         """Set the bitstring to a big-endian unsigned int interpretation."""
         if length is not None and length % 8 != 0:
@@ -1595,18 +2506,8 @@ class Bits(object):
         if i < 0:
             raise CreationError("Cannot use negative initialiser for unsigned "
                                 "exponential-Golomb.")
-        if not i:
-            self._setbin_unsafe('1')
-            return
-        tmp = i + 1
-        leadingzeros = -1
-        while tmp > 0:
-            tmp >>= 1
-            leadingzeros += 1
-        remainingpart = i + 1 - (1 << leadingzeros)
-        binstring = '0' * leadingzeros + '1' + Bits(uint=remainingpart,
-                                                             length=leadingzeros).bin
-        self._setbin_unsafe(binstring)
+        code, length = uecode(i)
+        self._setuint(code, length)
 
     def _readue(self, pos):
         """Return interpretation of next bits as unsigned exponential-Golomb code.
@@ -1615,23 +2516,29 @@ class Bits(object):
         reading the code.
 
         """
-        oldpos = pos
-        try:
-            while not self[pos]:
-                pos += 1
-        except IndexError:
+        # Peek at a window of bits. The code is the leading zeros, a 1, then
+        # the same number of bits again, and that's one more than the codenum.
+        window = min(EXPGOLOMB_WINDOW, self.len - pos)
+        if window <= 0:
             raise ReadError("Read off end of bitstring trying to read code.")
-        leadingzeros = pos - oldpos
-        codenum = (1 << leadingzeros) - 1
-        if leadingzeros > 0:
-            if pos + leadingzeros + 1 > self.len:
-                raise ReadError("Read off end of bitstring trying to read code.")
-            codenum += self._readuint(leadingzeros, pos + 1)
-            pos += leadingzeros + 1
+        bits = self._readuint(window, pos)
+        if bits:
+            # The bit length of a positive int is len(bin(x)) - 2.
+            leadingzeros = window + 2 - len(bin(bits))
+            codelength = 2 * leadingzeros + 1
+            if codelength <= window:
+                return (bits >> (window - codelength)) - 1, pos + codelength
         else:
-            assert codenum == 0
-            pos += 1
-        return codenum, pos
+            # A long run of zeros - scan quickly for the first 1.
+            for firstone in self._itersetbits(True, pos, self.len):
+                break
+            else:
+                raise ReadError("Read off end of bitstring trying to read code.")
+            leadingzeros = firstone - pos
+            codelength = 2 * leadingzeros + 1
+        if pos + codelength > self.len:
+            raise ReadError("Read off end of bitstring trying to read code.")
+        return self._readuint(codelength, pos) - 1, pos + codelength
 
     def _getue(self):
         """Return data as unsigned exponential-Golomb code.
@@ -1649,11 +2556,7 @@ class Bits(object):
 
     def _setse(self, i):
         """Initialise bitstring with signed exponential-Golomb code for integer i."""
-        if i > 0:
-            u = (i * 2) - 1
-        else:
-            u = -2 * i
-        self._setue(u)
+        self._setuint(*uecode(2 * i - 1 if i > 0 else -2 * i))
 
     def _getse(self):
         """Return data as signed exponential-Golomb code.
@@ -1694,7 +2597,7 @@ class Bits(object):
         if i < 0:
             raise CreationError("Cannot use negative initialiser for unsigned "
                                 "interleaved exponential-Golomb.")
-        self._setbin_unsafe('1' if i == 0 else '0' + '0'.join(bin(i + 1)[3:]) + '1')
+        self._setuint(*uiecode(i))
 
     def _readuie(self, pos):
         """Return interpretation of next bits as unsigned interleaved exponential-Golomb code.
@@ -1703,18 +2606,29 @@ class Bits(object):
         reading the code.
 
         """
-        try:
+        # The code alternates between a flag bit (1 for the end of the code)
+        # and a data bit, so peek at a window and look for the first set flag.
+        window = min(EXPGOLOMB_WINDOW, self.len - pos)
+        if window <= 0:
+            raise ReadError("Read off end of bitstring trying to read code.")
+        bits = self._readuint(window, pos)
+        flags = bits & UIE_FLAG_MASKS[window]
+        if flags:
+            flagpos = window + 2 - len(bin(flags))
             codenum = 1
-            while not self[pos]:
-                pos += 1
-                codenum <<= 1
-                codenum += self[pos]
-                pos += 1
-            pos += 1
-        except IndexError:
+            for shift in xrange(window - 2, window - 2 - flagpos, -2):
+                codenum = (codenum << 1) | ((bits >> shift) & 1)
+            return codenum - 1, pos + flagpos + 1
+        # Longer than the window, so do it a bit at a time.
+        getbit = self._datastore.getbit
+        length = self.len
+        codenum = 1
+        while pos + 1 < length and not getbit(pos):
+            codenum = (codenum << 1) | getbit(pos + 1)
+            pos += 2
+        if pos >= length or not getbit(pos):
             raise ReadError("Read off end of bitstring trying to read code.")
-        codenum -= 1
-        return codenum, pos
+        return codenum - 1, pos + 1
 
     def _getuie(self):
         """Return data as unsigned interleaved exponential-Golomb code.
@@ -1733,10 +2647,11 @@ class Bits(object):
     def _setsie(self, i):
         """Initialise bitstring with signed interleaved exponential-Golomb code for integer i."""
         if not i:
-            self._setbin_unsafe('1')
+            self._setuint(1, 1)
         else:
-            self._setuie(abs(i))
-            self._append(Bits([i < 0]))
+            code, length = uiecode(abs(i))
+            # The sign bit follows the code.
+            self._setuint((code << 1) | (i < 0), length + 1)
 
     def _getsie(self):
         """Return data as signed interleaved exponential-Golomb code.
@@ -1955,6 +2870,9 @@ class Bits(object):
     def _copy(self):
         """Create and return a new copy of the Bits (always in memory)."""
         s_copy = self.__class__()
+        if isinstance(self._datastore, SparseByteStore):
+            s_copy._datastore = copy.copy(self._datastore)
+            return s_copy
         s_copy._setbytes_unsafe(self._datastore.getbyteslice(0, self._datastore.bytelength),
                                 self.len, self._offset)
         return s_copy
@@ -1986,6 +2904,167 @@ class Bits(object):
             # This is for the 'ue', 'se' and 'bool' tokens. They will also return the new pos.
             return name_to_read[name](self, pos)
 
+    @staticmethod
+    def _arraytoken(fmt):
+        """Return the name and length of a single token for reading arrays.
+
+        The length is None for exponential-Golomb codes.
+
+        """
+        _, tokens = tokenparser(fmt)
+        if len(tokens) != 1:
+            raise ValueError("Format string should be a single token, not {0} "
+                             "tokens.".format(len(tokens)))
+        name, length, value = tokens[0]
+        if value is not None:
+            raise ValueError("Format string '{0}' shouldn't have a value.".format(fmt))
+        if not length and name not in ('ue', 'se', 'uie', 'sie'):
+            raise ValueError("Format string '{0}' doesn't have a fixed length.".format(fmt))
+        return name, length
+
+    def _readcodearray(self, name, pos, count):
+        """Read count consecutive exponential-Golomb codes of the same type.
+
+        If count is None then codes are read up to the end of the bitstring.
+        Returns a list of the values and the new position.
+
+        """
+        length = self.len
+        if count is None:
+            count = length - pos
+            toend = True
+        else:
+            toend = False
+        if name not in ('ue', 'se'):
+            read = self._readuie if name == 'uie' else self._readsie
+            values = []
+            while len(values) < count and not (toend and pos == length):
+                value, pos = read(pos)
+                values.append(value)
+            return values, pos
+        window = EXPGOLOMB_WINDOW
+        windowmask = (1 << window) - 1
+        values = []
+        append = values.append
+        n = 0
+        while n < count and not (toend and pos == length):
+            blockbits = min(EXPGOLOMB_BLOCK_SIZE, length - pos)
+            if blockbits < window:
+                # Close to the end, so read the last codes one at a time.
+                codenum, pos = self._readue(pos)
+                append(codenum)
+                n += 1
+                continue
+            # Take the codes from a block of bits held in an int, peeking at
+            # a window of bits for each one as in _readue.
+            block = self._readuint(blockbits, pos)
+            left = blockbits
+            while n < count and left >= window:
+                bits = (block >> (left - window)) & windowmask
+                if not bits:
+                    break
+                codelength = 2 * (window + 2 - len(bin(bits))) + 1
+                if codelength > window:
+                    break
+                left -= codelength
+                append((bits >> (window - codelength)) - 1)
+                n += 1
+            pos += blockbits - left
+            if n < count and left >= window:
+                # A code too long for the window.
+                codenum, pos = self._readue(pos)
+                append(codenum)
+                n += 1
+        if name == 'se':
+            values = [(c + 1) >> 1 if c & 1 else -(c >> 1) for c in values]
+        return values, pos
+
+    def _readarray(self, name, length, start, count):
+        """Read count consecutive items of the same fixed-length token.
+
+        Integers and floats are returned as an array.array where possible,
+        anything else as a list.
+
+        """
+        aligned = not (start + self._offset) % 8
+        if name in ('uint', 'uintbe', 'int', 'intbe', 'uintle', 'intle', 'uintne', 'intne'):
+            signed = name.startswith('int')
+            typecode = array_typecode(length, signed)
+            if name.endswith('le'):
+                order = 'little'
+            elif name.endswith('ne'):
+                order = byteorder
+            else:
+                order = 'big'
+            if typecode is not None and array.array(typecode).itemsize * 8 == length and \
+                    (aligned or order != 'big'):
+                return self._readarraybytes(typecode, order, start, count * length)
+            if order == 'big' or length == 8:
+                return self._readintarray(length, start, count, signed, typecode)
+        elif name in ('float', 'floatbe', 'floatle', 'floatne') and length in (32, 64):
+            if name == 'floatle':
+                order = 'little'
+            elif name == 'floatne':
+                order = byteorder
+            else:
+                order = 'big'
+            return self._readarraybytes('f' if length == 32 else 'd', order, start, count * length)
+        elif name == 'bool':
+            return [bool(v) for v in self._readintarray(1, start, count, False, None)]
+        # Anything else is read an item at a time.
+        try:
+            read = name_to_read[name]
+        except KeyError:
+            raise ValueError("Can't read an array of '{0}' tokens.".format(name))
+        return [read(self, length, start + i * length) for i in xrange(count)]
+
+    def _readstridedarray(self, name, length, start, count, stride):
+        """Read count items of the same fixed-length token, each stride bits after the last.
+
+        Items are returned as for _readarray.
+
+        """
+        if stride == length:
+            return self._readarray(name, length, start, count)
+        if name.startswith('float') and length in (32, 64) or \
+                name in ('uint', 'uintbe', 'int', 'intbe', 'uintle', 'intle', 'uintne', 'intne'):
+            if name.endswith('le'):
+                order = 'little'
+            elif name.endswith('ne'):
+                order = byteorder
+            else:
+                order = 'big'
+            signed = name.startswith('int')
+            if name.startswith('float'):
+                typecode = 'f' if length == 32 else 'd'
+            else:
+                typecode = array_typecode(length, signed)
+            if not name.startswith('float') and (order == 'big' or length == 8):
+                return self._readintarray(length, start, count, signed, typecode, stride)
+            if typecode is not None and array.array(typecode).itemsize * 8 == length:
+                # Read the bits as big-endian unsigned ints of the same size, then
+                # swap the bytes if needed and reinterpret them.
+                ints = self._readintarray(length, start, count, False, typecode.upper()
+                                          if typecode not in 'fd' else array_typecode(length, False),
+                                          stride)
+                if order == 'little':
+                    ints.byteswap()
+                values = array.array(typecode)
+                try:
+                    values.frombytes(ints.tobytes())
+                except AttributeError:
+                    # Python 2.x
+                    values.fromstring(ints.tostring())
+                return values
+        elif name == 'bool':
+            return [bool(v) for v in self._readintarray(1, start, count, False, None, stride)]
+        # Anything else is read an item at a time.
+        try:
+            read = name_to_read[name]
+        except KeyError:
+            raise ValueError("Can't read an array of '{0}' tokens.".format(name))
+        return [read(self, length, start + i * stride) for i in xrange(count)]
+
     def _append(self, bs):
         """Append a bitstring to the current bitstring."""
         self._datastore._appendstore(bs._datastore)
@@ -2140,12 +3219,22 @@ class Bits(object):
         assert 0 <= pos < self.len
         self._datastore.invertbit(pos)
 
+    def _setrange(self, value, start, end):
+        """Set bits in [start, end) to 1 if value is True, otherwise to 0."""
+        assert 0 <= start <= end <= self.len
+        if value:
+            self._datastore.setbitrange(start, end)
+        else:
+            self._datastore.unsetbitrange(start, end)
+
+    def _invertrange(self, start, end):
+        """Flip bits in [start, end) 1<->0."""
+        assert 0 <= start <= end <= self.len
+        self._datastore.invertbitrange(start, end)
+
     def _invert_all(self):
         """Invert every bit."""
-        set = self._datastore.setbyte
-        get = self._datastore.getbyte
-        for p in xrange(self._datastore.byteoffset, self._datastore.byteoffset + self._datastore.bytelength):
-            set(p, 256 + ~get(p))
+        self._datastore.invertbitrange(0, self.len)
 
     def _ilshift(self, n):
         """Shift bits by n to the left in place. Return self."""
@@ -2177,6 +3266,10 @@ class Bits(object):
 
     def _inplace_logical_helper(self, bs, f):
         """Helper function containing most of the __ior__, __iand__, __ixor__ code."""
+        if self._offset == bs._offset and self._sparselogical(bs, f):
+            return self
+        if isinstance(self._datastore, SparseByteStore):
+            self._datastore._densify()
         # Give the two bitstrings the same offset (modulo 8)
         self_byteoffset, self_bitoffset = divmod(self._offset, 8)
         bs_byteoffset, bs_bitoffset = divmod(bs._offset, 8)
@@ -2191,6 +3284,37 @@ class Bits(object):
             a[i] = f(a[i + self_byteoffset], b[i + bs_byteoffset])
         return self
 
+    def _sparselogical(self, bs, f):
+        """Do the logical operation by visiting only the nonzero bytes if possible.
+
+        Both bitstrings must have the same offset. Returns False if neither
+        bitstring is sparse enough to help.
+
+        """
+        a = self._datastore.rawbytes
+        b = bs._datastore.rawbytes
+        # Only the bytes that hold the bitstrings are visited.
+        start = self._offset // 8
+        end = (self._offset + self.len + 7) // 8
+        if f is operator.iand and isinstance(a, SparseByteArray):
+            for i, byte in a.nonzero(start, end):
+                a[i] = byte & b[i]
+        elif f is not operator.iand and isinstance(b, SparseByteArray):
+            # Bits of the end bytes that aren't part of bs mustn't be copied.
+            startmask = 0xff >> (self._offset % 8)
+            endmask = (0xff << (-(self._offset + self.len) % 8)) & 0xff
+            for i, byte in b.nonzero(start, end):
+                if i == start:
+                    byte &= startmask
+                if i == end - 1:
+                    byte &= endmask
+                a[i] = f(a[i], byte)
+            if isinstance(a, SparseByteArray):
+                self._datastore._checkdensity()
+        else:
+            return False
+        return True
+
     def _ior(self, bs):
         return self._inplace_logical_helper(bs, operator.ior)
 
@@ -2239,6 +3363,92 @@ class Bits(object):
         """
         return self._readlist(fmt, 0, **kwargs)[0]
 
+    def unpack_many(self, fmt, count=None, stride=None, astuples=False):
+        """Interpret the bitstring as repeated records with the same layout.
+
+        fmt -- A format string of fixed-length tokens describing one record.
+        count -- The number of records. Defaults to as many as will fit in
+                 the bitstring.
+        stride -- The number of bits from the start of one record to the
+                  start of the next. Defaults to the length of the record.
+        astuples -- If True return a list with a tuple for each record.
+
+        By default a list with an array of values for each field is returned.
+        Integers of up to 64 bits and 32 or 64 bit floats are in an
+        array.array, and other tokens in a list. Pad tokens are skipped. Each
+        field is extracted from all of the records at once, which is much
+        faster than using cut() and unpack() on every record.
+
+        Raises ValueError if the format is not understood or the stride is
+        shorter than a record.
+        Raises ReadError if there are too few bits for count records.
+
+        >>> Bits('0x1a2b3c').unpack_many('hex:4, uint:4')
+        [['1', '2', '3'], array('B', [10, 11, 12])]
+
+        """
+        _, tokens = tokenparser(fmt)
+        fields = []
+        reclength = 0
+        for name, length, value in tokens:
+            if value is not None:
+                raise ValueError("Format string '{0}' shouldn't have values.".format(fmt))
+            if not length:
+                raise ValueError("Format string '{0}' doesn't have a fixed length.".format(fmt))
+            if name != 'pad':
+                fields.append((name, length, reclength))
+            reclength += length
+        if stride is None:
+            stride = reclength
+        if stride < reclength:
+            raise ValueError("stride of {0} bits is shorter than the record length of "
+                             "{1} bits.".format(stride, reclength))
+        if count is None:
+            count = (self.len - reclength) // stride + 1 if reclength <= self.len else 0
+        if count < 0:
+            raise ValueError("Cannot unpack a negative number of records.")
+        if count and (count - 1) * stride + reclength > self.len:
+            raise ReadError("Cannot unpack {0} records of {1} bits, only {2} bits available.",
+                            count, reclength, self.len)
+        columns = [self._readstridedarray(name, length, offset, count, stride)
+                   for name, length, offset in fields]
+        if astuples:
+            return list(zip(*columns)) if columns else [()] * count
+        return columns
+
+    def unpack_array(self, fmt, count=None):
+        """Interpret consecutive items of a single token.
+
+        fmt -- A single fixed-length token such as 'uint:12' or 'floatle:32',
+               an exponential-Golomb code such as 'ue', or a VLCTable.
+        count -- The number of items to interpret. Defaults to as many as
+                 will fit in the bitstring.
+
+        Integers of up to 64 bits and 32 or 64 bit floats are returned as an
+        array.array, and other tokens as a list. This is much faster than
+        using unpack with a repeated token.
+
+        Raises ValueError if the format is not a single suitable token.
+        Raises ReadError if there are too few bits for count items.
+
+        >>> Bits('0x001002003').unpack_array('uint:12')
+        array('H', [1, 2, 3])
+
+        """
+        if count is not None and count < 0:
+            raise ValueError("Cannot unpack a negative number of items.")
+        if isinstance(fmt, VLCTable):
+            return fmt._decodearray(self, 0, count)[0]
+        name, length = self._arraytoken(fmt)
+        if length is None:
+            return self._readcodearray(name, 0, count)[0]
+        if count is None:
+            count = self.len // length
+        if count * length > self.len:
+            raise ReadError("Cannot unpack {0} items of {1} bits, only {2} bits available.",
+                            count, length, self.len)
+        return self._readarray(name, length, 0, count)
+
     def _readlist(self, fmt, pos, **kwargs):
         tokens = []
         stretchy_token = None
@@ -2257,28 +3467,24 @@ class Bits(object):
                 stretchy_token = stretchy
             tokens.extend(tkns)
         if not stretchy_token:
-            lst = []
+            resolved = []
             for name, length, _ in tokens:
                 if length in kwargs:
                     length = kwargs[length]
-                    if name == 'bytes':
+                    if name in BYTES_TOKENS:
                         length *= 8
                 if name in kwargs and length is None:
                     # Using default 'uint' - the name is really the length.
-                    value, pos = self._readtoken('uint', pos, kwargs[name])
-                    lst.append(value)
-                    continue
-                value, pos = self._readtoken(name, pos, length)
-                if value is not None: # Don't append pad tokens
-                    lst.append(value)
-            return lst, pos
+                    name, length = 'uint', kwargs[name]
+                resolved.append((name, length))
+            return self._readtokens(resolved, pos)
         stretchy_token = False
         bits_after_stretchy_token = 0
         for token in tokens:
             name, length, _ = token
             if length in kwargs:
                 length = kwargs[length]
-                if name == 'bytes':
+                if name in BYTES_TOKENS:
                     length *= 8
             if name in kwargs and length is None:
                 # Default 'uint'.
@@ -2296,7 +3502,7 @@ class Bits(object):
                 assert not stretchy_token
                 stretchy_token = token
         bits_left = self.len - pos
-        return_values = []
+        resolved = []
         for token in tokens:
             name, length, _ = token
             if token is stretchy_token:
@@ -2304,17 +3510,57 @@ class Bits(object):
                 length = max(bits_left - bits_after_stretchy_token, 0)
             if length in kwargs:
                 length = kwargs[length]
-                if name == 'bytes':
+                if name in BYTES_TOKENS:
                     length *= 8
             if name in kwargs and length is None:
                 # Default 'uint'
                 length = kwargs[name]
             if length is not None:
                 bits_left -= length
-            value, pos = self._readtoken(name, pos, length)
-            if value is not None:
-                return_values.append(value)
-        return return_values, pos
+            resolved.append((name, length))
+        return self._readtokens(resolved, pos)
+
+    def _readtokens(self, tokens, pos):
+        """Read a list of token names and lengths and return the values and new position.
+
+        Runs of byte-aligned tokens that the struct module understands are
+        read with a single struct call. Pad tokens are not included in the
+        values.
+
+        """
+        values = []
+        i = 0
+        ntokens = len(tokens)
+        while i < ntokens:
+            name, length = tokens[i]
+            code = structcode(name, length) if length else None
+            if code is not None and not (pos + self._offset) % 8:
+                endian, codes = code[0], [code[1]]
+                runlength = length
+                j = i + 1
+                while j < ntokens:
+                    name, length = tokens[j]
+                    code = structcode(name, length) if length else None
+                    if code is None or (code[0] is not None and endian is not None and
+                                        code[0] != endian):
+                        break
+                    endian = endian or code[0]
+                    codes.append(code[1])
+                    runlength += length
+                    j += 1
+                if pos + runlength <= self.len:
+                    start = (pos + self._offset) // 8
+                    data = bytes(self._datastore.getbyteslice(start, start + runlength // 8))
+                    values.extend(struct.unpack((endian or '>') + ''.join(codes), data))
+                    pos += runlength
+                    i = j
+                    continue
+                name, length = tokens[i]
+            value, pos = self._readtoken(name, pos, length)
+            if value is not None:  # Don't append pad tokens
+                values.append(value)
+            i += 1
+        return values, pos
 
     def _findbytes(self, bytes_, start, end, bytealigned):
         """Quicker version of find when everything's whole byte
@@ -2328,6 +3574,11 @@ class Bits(object):
         found = False
         p = bytepos
         finalpos = end // 8
+        rawarray = self._datastore._rawarray
+        if isinstance(rawarray, (bytearray, MmapByteArray)):
+            # Search the data where it is, without copying.
+            p = rawarray.find(bytes_, bytepos, finalpos)
+            return () if p == -1 else (p * 8,)
         increment = max(1024, len(bytes_) * 10)
         buffersize = increment + len(bytes_)
         while p < finalpos:
@@ -2404,6 +3655,8 @@ class Bits(object):
             bytealigned = settings._bytealigned
         if bytealigned and not bs.len % 8 and not self._datastore.offset:
             p = self._findbytes(bs.bytes, start, end, bytealigned)
+        elif bs.len == 1 and not bytealigned:
+            p = tuple(itertools.islice(self._itersetbits(bs[0], start, end), 1))
         else:
             p = self._findregex(re.compile(bs._getbin()), start, end, bytealigned)
         # If called from a class that has a pos, set it
@@ -2437,6 +3690,18 @@ class Bits(object):
         if bytealigned is None:
             bytealigned = settings._bytealigned
         c = 0
+        if bs.len == 1 and not bytealigned:
+            # Finding a single bit is just enumerating the bits set to it.
+            for p in self._itersetbits(bs[0], start, end):
+                if count is not None and c >= count:
+                    return
+                c += 1
+                try:
+                    self._pos = p
+                except AttributeError:
+                    pass
+                yield p
+            return
         if bytealigned and not bs.len % 8 and not self._datastore.offset:
             # Use the quick find method
             f = self._findbytes
@@ -2465,6 +3730,77 @@ class Bits(object):
                 break
         return
 
+    def iter_set(self, value=True, start=None, end=None):
+        """Return generator of the positions of bits set to value.
+
+        value -- If True then the positions of bits set to 1 are generated,
+                 otherwise the positions of bits set to 0 are generated.
+        start -- The bit position to start from. Defaults to 0.
+        end -- The bit position one past the last bit to consider.
+               Defaults to self.len.
+
+        Whole bytes that don't contain a matching bit are skipped over
+        quickly, so this is efficient for sparse bitstrings.
+
+        Raises ValueError if start < 0, if end > self.len or if end < start.
+
+        >>> list(Bits('0b001001').iter_set())
+        [2, 5]
+
+        """
+        start, end = self._validate_slice(start, end)
+        for p in self._itersetbits(bool(value), start, end):
+            yield p
+
+    def _itersetbits(self, value, start, end):
+        """Generator of positions in [start, end) of bits set to value, without checks."""
+        offset = self._offset
+        for bytepos, byte in self._matchingbytes(value, start, end):
+            bitpos = bytepos * 8 - offset
+            for b in SET_BIT_POSITIONS[byte]:
+                yield bitpos + b
+
+    def _matchingbytes(self, value, start, end):
+        """Generator of (byte position, byte) for bytes with bits in [start, end) set to value.
+
+        The bytes are masked and, if value is False, inverted so that their
+        1 bits are the matching bits. Bytes with no matching bits are skipped.
+
+        """
+        if start == end:
+            return
+        offset = self._offset
+        absstart = start + offset
+        absend = end + offset
+        firstbyte = absstart // 8
+        lastbyte = (absend - 1) // 8
+        firstmask = 0xff >> (absstart % 8)
+        lastmask = (0xff << (7 - (absend - 1) % 8)) & 0xff
+        if value and isinstance(self._datastore, SparseByteStore):
+            # Only the stored bytes can have any bits set.
+            for bytepos, byte in self._datastore.rawbytes.nonzero(firstbyte, lastbyte + 1):
+                if bytepos == firstbyte:
+                    byte &= firstmask
+                if bytepos == lastbyte:
+                    byte &= lastmask
+                if byte:
+                    yield bytepos, byte
+            return
+        skip = NONZERO_BYTE_RE if value else NONFF_BYTE_RE
+        getbyteslice = self._datastore.getbyteslice
+        for chunkstart in xrange(firstbyte, lastbyte + 1, SCAN_CHUNK_SIZE):
+            chunk = getbyteslice(chunkstart, min(chunkstart + SCAN_CHUNK_SIZE, lastbyte + 1))
+            for m in skip.finditer(chunk):
+                i = m.start()
+                bytepos = chunkstart + i
+                byte = chunk[i] if value else chunk[i] ^ 0xff
+                if bytepos == firstbyte:
+                    byte &= firstmask
+                if bytepos == lastbyte:
+                    byte &= lastmask
+                if byte:
+                    yield bytepos, byte
+
     def rfind(self, bs, start=None, end=None, bytealigned=None):
         """Find final occurrence of substring bs.
 
@@ -2606,12 +3942,129 @@ class Bits(object):
             pass
         return s
 
+    @classmethod
+    def from_numpy(cls, arr, width=None):
+        """Create a new bitstring from a NumPy array of packed fields.
+
+        arr -- A NumPy array (or anything that NumPy can convert to one) of
+               integers, floats or bools. Multi-dimensional arrays are
+               flattened.
+        width -- The number of bits used for each item. Defaults to 1 for
+                 bools and the size of the array's type for everything else.
+                 Floats can only use their full size.
+
+        Integers are stored as big-endian unsigned or two's complement
+        signed fields, and floats as big-endian floats.
+
+        Raises CreationError if the width is unsuitable or if any of the
+        values don't fit in the width. Raises ImportError if NumPy isn't
+        available.
+
+        """
+        np = import_numpy()
+        arr = np.asarray(arr).ravel()
+        kind, itembits = arr.dtype.kind, arr.dtype.itemsize * 8
+        if kind == 'b':
+            arr = arr.astype(np.uint8)
+            kind, itembits = 'u', 1
+        elif kind not in 'uif':
+            raise CreationError("Can't create a bitstring from a NumPy array of type {0}.", arr.dtype)
+        if width is None:
+            width = itembits
+        if kind == 'f' and width != itembits:
+            raise CreationError("Floats of type {0} must use a width of {1}.", arr.dtype, itembits)
+        if not 0 < width <= max(itembits, 64):
+            raise CreationError("A width of {0} can't be used for type {1}.", width, arr.dtype)
+        if kind != 'f' and len(arr):
+            if kind == 'u':
+                low, high = 0, (1 << width) - 1
+            else:
+                low, high = -(1 << (width - 1)), (1 << (width - 1)) - 1
+            if int(arr.min()) < low or int(arr.max()) > high:
+                raise CreationError("Values in the array don't fit in {0} bits. The allowed "
+                                    "range is [{1}, {2}].", width, low, high)
+        if width % 8 == 0 and width == itembits:
+            # Whole-byte fields can just be byte-swapped to big-endian.
+            return cls(bytes=arr.astype(arr.dtype.newbyteorder('>')).tobytes())
+        # Otherwise build the individual bits and pack them, in chunks of a
+        # multiple of 8 items so that every chunk is a whole number of bytes.
+        arr = arr.astype(np.int64).view(np.uint64) if kind == 'i' else arr.astype(np.uint64)
+        shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+        chunks = []
+        for i in xrange(0, len(arr), NUMPY_CHUNK_SIZE):
+            chunk = arr[i:i + NUMPY_CHUNK_SIZE]
+            bits = ((chunk[:, np.newaxis] >> shifts) & np.uint64(1)).astype(np.uint8)
+            chunks.append(np.packbits(bits.ravel()).tobytes())
+        return cls(bytes=b''.join(chunks), length=len(arr) * width)
+
+    def to_numpy(self, dtype, width=None):
+        """Interpret the bitstring as packed fields and return as a NumPy array.
+
+        dtype -- The NumPy type of the array to return, for example 'uint16',
+                 'int32', 'float64' or 'bool'.
+        width -- The number of bits in each field. Defaults to 1 for bools
+                 and the size of the type for everything else. Floats can
+                 only use their full size.
+
+        Fields are interpreted as big-endian unsigned or two's complement
+        signed integers, or big-endian floats. For bools a field is True if
+        any of its bits are set. Any bits at the end that don't make up a
+        whole field are ignored.
+
+        Raises ValueError if the width is unsuitable for the type. Raises
+        ImportError if NumPy isn't available.
+
+        >>> Bits('0x001002003').to_numpy('uint16', 12)
+        array([1, 2, 3], dtype=uint16)
+
+        """
+        np = import_numpy()
+        dtype = np.dtype(dtype)
+        kind, itembits = dtype.kind, dtype.itemsize * 8
+        if kind not in 'buif':
+            raise ValueError("Can't convert to a NumPy array of type {0}.".format(dtype))
+        if width is None:
+            width = 1 if kind == 'b' else itembits
+        if kind == 'f' and width != itembits:
+            raise ValueError("Floats of type {0} must use a width of {1}.".format(dtype, itembits))
+        if not 0 < width <= (64 if kind == 'b' else itembits):
+            raise ValueError("A width of {0} can't be used for type {1}.".format(width, dtype))
+        count = self.len // width
+        if width % 8 == 0 and width == itembits and kind != 'b':
+            data = self._readbytes(count * width, 0)
+            return np.frombuffer(data, dtype=dtype.newbyteorder('>')).astype(dtype)
+        # Unpack the bits of chunks of a multiple of 8 fields, which will each
+        # start at the same bit offset, and weight them to make the values.
+        weights = np.uint64(1) << np.arange(width - 1, -1, -1, dtype=np.uint64)
+        bitoffset = self._offset % 8
+        bytepos = self._offset // 8
+        chunkbytes = NUMPY_CHUNK_SIZE * width // 8
+        chunks = []
+        for i in xrange(0, count, NUMPY_CHUNK_SIZE):
+            n = min(NUMPY_CHUNK_SIZE, count - i)
+            data = self._datastore.getbyteslice(bytepos, bytepos + (bitoffset + n * width + 7) // 8)
+            bits = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+            bits = bits[bitoffset:bitoffset + n * width].reshape(n, width)
+            chunks.append(np.dot(bits.astype(np.uint64), weights))
+            bytepos += chunkbytes
+        values = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint64)
+        if kind == 'i' and width < 64:
+            values = values.view(np.int64)
+            values -= (values >> (width - 1)) << width
+        elif kind == 'i':
+            values = values.view(np.int64)
+        return values.astype(dtype)
+
     def tobytes(self):
         """Return the bitstring as bytes, padding with zero bits if needed.
 
         Up to seven zero bits will be added at the end to byte align.
 
         """
+        if not self._offset % 8 and not self.len % 8:
+            # Whole bytes can be copied straight out.
+            start = self._datastore.byteoffset
+            return self._datastore.getbytes(start, start + self.len // 8)
         d = offsetcopy(self._datastore, 0).rawbytes
         # Need to ensure that unused bits at end are set to zero
         unusedbits = 8 - self.len % 8
@@ -2619,6 +4072,19 @@ class Bits(object):
             d[-1] &= (0xff << unusedbits)
         return bytes(d)
 
+    def tomemoryview(self):
+        """Return a read-only memoryview of the bitstring as bytes.
+
+        If the bitstring starts and ends on byte boundaries then the view is
+        of its data without any copying, otherwise it is of tobytes().
+
+        >>> sock.sendall(packet[64:].tomemoryview())
+
+        """
+        if self.len % 8:
+            return memoryview(self.tobytes())
+        return self._readbytesview(self.len, 0)
+
     def tofile(self, f):
         """Write the bitstring to a file object, padding with zero bits if needed.
 
@@ -2628,30 +4094,28 @@ class Bits(object):
         # If the bitstring is file based then we don't want to read it all
         # in to memory.
         chunksize = 1024 * 1024 # 1 MB chunks
-        if not self._offset:
-            a = 0
-            bytelen = self._datastore.bytelength
-            p = self._datastore.getbyteslice(a, min(a + chunksize, bytelen - 1))
-            while len(p) == chunksize:
-                f.write(p)
-                a += chunksize
-                p = self._datastore.getbyteslice(a, min(a + chunksize, bytelen - 1))
-            f.write(p)
-            # Now the final byte, ensuring that unused bits at end are set to 0.
-            bits_in_final_byte = self.len % 8
-            if not bits_in_final_byte:
-                bits_in_final_byte = 8
-            f.write(self[-bits_in_final_byte:].tobytes())
+        nbytes = self.len // 8
+        a = 0
+        if not self._offset % 8:
+            start = self._datastore.byteoffset
+            rawarray = self._datastore._rawarray
+            if isinstance(rawarray, MmapByteArray):
+                # Let the OS copy straight from the file if it can.
+                a = copyfilerange(rawarray.source, f, rawarray.byteoffset + start, nbytes)
+            while a < nbytes:
+                b = min(a + chunksize, nbytes)
+                f.write(self._datastore.getbyteslice(start + a, start + b))
+                a = b
         else:
-            # Really quite inefficient...
-            a = 0
-            b = a + chunksize * 8
-            while b <= self.len:
-                f.write(self._slice(a, b)._getbytes())
-                a += chunksize * 8
-                b += chunksize * 8
-            if a != self.len:
-                f.write(self._slice(a, self.len).tobytes())
+            # Realign each chunk by reading it as one integer.
+            while a < nbytes:
+                b = min(a + chunksize, nbytes)
+                f.write(binascii.unhexlify('{0:0{1}x}'.format(self._readuint(8 * (b - a), 8 * a),
+                                                              2 * (b - a))))
+                a = b
+        if self.len % 8:
+            # Now the final bits, ensuring that unused bits at end are set to 0.
+            f.write(self._slice(8 * nbytes, self.len).tobytes())
 
     def startswith(self, prefix, start=None, end=None):
         """Return whether the current bitstring starts with prefix.
@@ -2695,7 +4159,7 @@ class Bits(object):
         value = bool(value)
         length = self.len
         if pos is None:
-            pos = xrange(self.len)
+            return not any(self._matchingbytes(not value, 0, length))
         for p in pos:
             if p < 0:
                 p += length
@@ -2717,7 +4181,7 @@ class Bits(object):
         value = bool(value)
         length = self.len
         if pos is None:
-            pos = xrange(self.len)
+            return any(self._matchingbytes(value, 0, length))
         for p in pos:
             if p < 0:
                 p += length
@@ -2739,6 +4203,9 @@ class Bits(object):
         """
         if not self.len:
             return 0
+        if isinstance(self._datastore, SparseByteStore):
+            count = sum(BIT_COUNT[byte] for _, byte in self._matchingbytes(True, 0, self.len))
+            return count if value else self.len - count
         # count the number of 1s (from which it's easy to work out the 0s).
         # Don't count the final byte yet.
         count = sum(BIT_COUNT[self._datastore.getbyte(i)] for i in xrange(self._datastore.bytelength - 1))
@@ -2750,6 +4217,127 @@ class Bits(object):
         count += BIT_COUNT[self._datastore.getbyte(self._datastore.bytelength - 1) >> endbits]
         return count if value else self.len - count
 
+    def rank(self, pos):
+        """Return the number of bits set to 1 before bit position pos.
+
+        pos -- A bit position from 0 to self.len inclusive. Negative numbers
+               are treated in the same way as slice indices.
+
+        For immutable bitstrings the first call builds an index, which is
+        kept so that later calls are fast. Mutable bitstrings count the bits
+        before pos on every call.
+
+        Raises IndexError if pos < -self.len or pos > self.len.
+
+        >>> Bits('0b10110').rank(3)
+        2
+
+        """
+        length = self.len
+        if pos < 0:
+            pos += length
+        if not 0 <= pos <= length:
+            raise IndexError("Bit position {0} out of range.".format(pos))
+        index = self._getrankindex()
+        if index is None:
+            # Mutable bitstrings don't keep an index, so the bits are just counted.
+            return self._countones(0, pos)
+        block, bits = divmod(pos, RANK_BLOCK_SIZE)
+        r = index[block]
+        if bits:
+            r += bin(self._readuint(bits, pos - bits)).count('1')
+        return r
+
+    def select(self, n):
+        """Return the bit position of the nth bit set to 1.
+
+        n -- The number of 1 bits that precede the one to find, so 0 finds
+             the first 1 bit. Negative numbers count back from the last 1 bit.
+
+        Uses the same index as rank(), so that s.rank(s.select(n)) == n.
+
+        Raises IndexError if there are not enough bits set to 1.
+
+        >>> Bits('0b10110').select(1)
+        2
+
+        """
+        index = self._getrankindex()
+        total = self.count(1) if index is None else index[-1]
+        if n < 0:
+            n += total
+        if not 0 <= n < total:
+            raise IndexError("Cannot select 1 bit number {0} as only {1} bits are set.".format(n, total))
+        if index is None:
+            # Mutable bitstrings don't keep an index, so scan from the start.
+            return self._selectfrom(0, self.len, n)
+        # Find the block containing the 1 bit, then scan through its bytes.
+        block = bisect.bisect_right(index, n) - 1
+        start = block * RANK_BLOCK_SIZE
+        return self._selectfrom(start, min(start + RANK_BLOCK_SIZE, self.len), n - index[block])
+
+    def _popcountbytes(self, start, end):
+        """Return the bits from start to end as a bytearray, and a bytearray of their bit counts.
+
+        The last byte is padded with zero bits.
+
+        """
+        bits = end - start
+        whole = bits - bits % 8
+        data = bytearray(self._readbytes(whole, start))
+        if bits % 8:
+            data.append(self._readuint(bits % 8, start + whole) << (8 - bits % 8))
+        return data, bytearray(data.translate(POPCOUNT_TABLE))
+
+    def _countones(self, start, end):
+        """Return the number of 1 bits from start to end."""
+        chunkbits = RANK_BLOCK_SIZE * 1024
+        return sum(sum(self._popcountbytes(chunkstart, min(chunkstart + chunkbits, end))[1])
+                   for chunkstart in xrange(start, end, chunkbits))
+
+    def _selectfrom(self, start, end, n):
+        """Return the position of the nth 1 bit after start, which must be before end."""
+        chunkbits = RANK_BLOCK_SIZE * 1024
+        for chunkstart in xrange(start, end, chunkbits):
+            data, counts = self._popcountbytes(chunkstart, min(chunkstart + chunkbits, end))
+            c = sum(counts)
+            if n >= c:
+                n -= c
+                continue
+            for i, c in enumerate(counts):
+                if n < c:
+                    return chunkstart + i * 8 + SET_BIT_POSITIONS[data[i]][n]
+                n -= c
+        assert False
+
+    def _getrankindex(self):
+        """Return the rank index, building it if necessary.
+
+        As the bitstring is immutable the index is kept for later use.
+
+        """
+        try:
+            return self._rankindex
+        except AttributeError:
+            self._rankindex = self._buildrankindex()
+            return self._rankindex
+
+    def _buildrankindex(self):
+        """Return array of the number of 1 bits before the start of each block."""
+        index = array.array(RANK_TYPECODE, [0])
+        total = 0
+        length = self.len
+        blockbytes = RANK_BLOCK_SIZE // 8
+        # Work through the data in chunks of whole blocks.
+        chunkbits = RANK_BLOCK_SIZE * 1024
+        for start in xrange(0, length, chunkbits):
+            data = self._slice(start, min(start + chunkbits, length)).tobytes()
+            counts = bytearray(data.translate(POPCOUNT_TABLE))
+            for i in xrange(0, len(counts), blockbytes):
+                total += sum(counts[i:i + blockbytes])
+                index.append(total)
+        return index
+
     # Create native-endian functions as aliases depending on the byteorder
     if byteorder == 'little':
         _setfloatne = _setfloatle
@@ -2863,6 +4451,8 @@ name_to_read = {'uint': Bits._readuint,
                 'bin': Bits._readbin,
                 'bits': Bits._readbits,
                 'bytes': Bits._readbytes,
+                # Looked up on the instance as the mutable classes have to copy.
+                'bytesview': lambda s, length, start: s._readbytesview(length, start),
                 'ue': Bits._readue,
                 'se': Bits._readse,
                 'uie': Bits._readuie,
@@ -2929,13 +4519,21 @@ class BitArray(Bits):
     endswith() -- Return whether the bitstring ends with a sub-string.
     find() -- Find a sub-bitstring in the current bitstring.
     findall() -- Find all occurrences of a sub-bitstring in the current bitstring.
+    from_numpy() -- Create a bitstring from a NumPy array of packed fields.
+    iter_set() -- Create generator of the positions of bits set to 1 or 0.
     join() -- Join bitstrings together using current bitstring.
+    rank() -- Count the number of 1 bits before a position.
     rfind() -- Seek backwards to find a sub-bitstring.
+    select() -- Find the position of the nth 1 bit.
     split() -- Create generator of chunks split by a delimiter.
     startswith() -- Return whether the bitstring starts with a sub-bitstring.
+    to_numpy() -- Interpret bits as packed fields and return a NumPy array.
     tobytes() -- Return bitstring as bytes, padding if needed.
+    tomemoryview() -- Return a read-only memoryview of the bitstring as bytes.
     tofile() -- Write bitstring to file, padding if needed.
     unpack() -- Interpret bits using format string.
+    unpack_array() -- Interpret bits as consecutive items of one fixed-length token.
+    unpack_many() -- Interpret bits as repeated records, returning arrays of fields.
 
     Special methods:
 
@@ -3004,6 +4602,7 @@ class BitArray(Bits):
         uie -- an unsigned interleaved exponential-Golomb code.
         bool -- a boolean (True or False).
         filename -- a file which will be opened in binary read-only mode.
+                    Files ending in .gz, .bz2 or .xz are decompressed.
 
         Other keyword arguments:
         length -- length of the bitstring in bits, if needed and appropriate.
@@ -3011,6 +4610,8 @@ class BitArray(Bits):
         offset -- bit offset to the data. These offset bits are
                   ignored and this is intended for use when
                   initialising using 'bytes' or 'filename'.
+        sparse -- if True, create a bitstring of zeros that only stores
+                  its nonzero bytes. Use with just a length.
 
         """
         # For mutable BitArrays we always read in files to memory:
@@ -3424,54 +5025,124 @@ class BitArray(Bits):
         """Set one or many bits to 1 or 0.
 
         value -- If True bits are set to 1, otherwise they are set to 0.
-        pos -- Either a single bit position or an iterable of bit positions.
-               Negative numbers are treated in the same way as slice indices.
-               Defaults to the entire bitstring.
+        pos -- Either a single bit position, a slice or an iterable of bit
+               positions. Negative numbers are treated in the same way as
+               slice indices. Defaults to the entire bitstring.
 
         Raises IndexError if pos < -self.len or pos >= self.len.
 
         """
-        f = self._set if value else self._unset
-        if pos is None:
-            pos = xrange(self.len)
-        try:
+        if isinstance(pos, numbers.Integral):
+            # A single bit is the most common case, so skip the general code.
             length = self.len
-            for p in pos:
-                if p < 0:
-                    p += length
-                if not 0 <= p < length:
-                    raise IndexError("Bit position {0} out of range.".format(p))
-                f(p)
-        except TypeError:
-            # Single pos
             if pos < 0:
-                pos += self.len
+                pos += length
             if not 0 <= pos < length:
                 raise IndexError("Bit position {0} out of range.".format(pos))
-            f(pos)
+            if value:
+                self._set(pos)
+            else:
+                self._unset(pos)
+            return
+        start, end, positions = self._bitpositions(pos)
+        if positions is None:
+            self._setrange(value, start, end)
+        elif value:
+            self._datastore.setbits(positions)
+        else:
+            self._datastore.unsetbits(positions)
 
     def invert(self, pos=None):
         """Invert one or many bits from 0 to 1 or vice versa.
 
-        pos -- Either a single bit position or an iterable of bit positions.
-               Negative numbers are treated in the same way as slice indices.
+        pos -- Either a single bit position, a slice or an iterable of bit
+               positions. Negative numbers are treated in the same way as
+               slice indices. Defaults to the entire bitstring.
 
         Raises IndexError if pos < -self.len or pos >= self.len.
 
         """
-        if pos is None:
-            self._invert_all()
+        if isinstance(pos, numbers.Integral):
+            length = self.len
+            if pos < 0:
+                pos += length
+            if not 0 <= pos < length:
+                raise IndexError("Bit position {0} out of range.".format(pos))
+            self._invert(pos)
             return
-        if not isinstance(pos, collections.Iterable):
-            pos = (pos,)
+        start, end, positions = self._bitpositions(pos)
+        if positions is None:
+            self._invertrange(start, end)
+        else:
+            self._datastore.invertbits(positions)
+
+    def _bitpositions(self, pos):
+        """Return (start, end, positions) for the bit positions in pos.
+
+        pos can be None (all bits), a single position, a slice, a range or
+        any other iterable of positions such as a list or an array.array.
+
+        If the positions form a contiguous run then positions is None and the
+        run is [start, end), which can be filled a byte at a time. Otherwise
+        positions is an iterable of non-negative positions that are known to
+        be in range.
+
+        Raises IndexError if any position is out of range.
+
+        """
         length = self.len
+        if pos is None:
+            return 0, length, None
+        if isinstance(pos, numbers.Integral):
+            if pos < 0:
+                pos += length
+            if not 0 <= pos < length:
+                raise IndexError("Bit position {0} out of range.".format(pos))
+            return pos, pos + 1, None
+        if isinstance(pos, slice):
+            start, stop, step = pos.indices(length)
+            if step == 1:
+                return start, max(start, stop), None
+            return 0, 0, xrange(start, stop, step)
+        if isinstance(pos, xrange):
+            if not pos:
+                return 0, 0, None
+            first, last = min(pos[0], pos[-1]), max(pos[0], pos[-1])
+            if last < 0:
+                # All negative, so they are all relative to the end.
+                first += length
+                last += length
+            if 0 <= first and last < length:
+                if last - first + 1 == len(pos):
+                    return first, last + 1, None
+                return 0, 0, xrange(first, last + 1, (last - first) // (len(pos) - 1))
+        else:
+            # For sequences (lists, tuples, arrays etc.) a min and max check done
+            # at C speed lets us skip the check for each position.
+            try:
+                if not len(pos):
+                    return 0, 0, None
+                if min(pos) >= 0 and max(pos) < length:
+                    return 0, 0, pos
+            except TypeError:
+                # Not a sequence, e.g. a generator, which we can only iterate over once.
+                pass
+        try:
+            iter(pos)
+        except TypeError:
+            raise TypeError("Bit positions must be an integer, slice or iterable, "
+                            "not {0}.".format(type(pos)))
+        return 0, 0, self._checkedpositions(pos, length)
 
+    @staticmethod
+    def _checkedpositions(pos, length):
+        """Generator of bit positions, made non-negative and checked against length."""
         for p in pos:
             if p < 0:
                 p += length
             if not 0 <= p < length:
                 raise IndexError("Bit position {0} out of range.".format(p))
-            self._invert(p)
+            yield p
 
     def ror(self, bits, start=None, end=None):
         """Rotate bits to the right in-place.
@@ -3585,6 +5256,19 @@ class BitArray(Bits):
         """Return a copy of the bitstring."""
         return self._copy()
 
+    def _readbytesview(self, length, start):
+        """Read bytes and return them as a read-only memoryview of a copy.
+
+        Unlike for the immutable classes the data is always copied, as the
+        bitstring couldn't change length while a view of it was held.
+
+        """
+        return memoryview(self._readbytes(length, start))
+
+    def _getrankindex(self):
+        """Return None, as an index can't be kept when we're mutable."""
+        return None
+
     int = property(Bits._getint, Bits._setint,
                    doc="""The bitstring as a two's complement signed int. Read and write.
                       """)
@@ -3665,13 +5349,21 @@ class ConstBitStream(Bits):
     endswith() -- Return whether the bitstring ends with a sub-string.
     find() -- Find a sub-bitstring in the current bitstring.
     findall() -- Find all occurrences of a sub-bitstring in the current bitstring.
+    from_numpy() -- Create a bitstring from a NumPy array of packed fields.
+    iter_set() -- Create generator of the positions of bits set to 1 or 0.
     join() -- Join bitstrings together using current bitstring.
+    rank() -- Count the number of 1 bits before a position.
     rfind() -- Seek backwards to find a sub-bitstring.
+    select() -- Find the position of the nth 1 bit.
     split() -- Create generator of chunks split by a delimiter.
     startswith() -- Return whether the bitstring starts with a sub-bitstring.
+    to_numpy() -- Interpret bits as packed fields and return a NumPy array.
     tobytes() -- Return bitstring as bytes, padding if needed.
+    tomemoryview() -- Return a read-only memoryview of the bitstring as bytes.
     tofile() -- Write bitstring to file, padding if needed.
     unpack() -- Interpret bits using format string.
+    unpack_array() -- Interpret bits as consecutive items of one fixed-length token.
+    unpack_many() -- Interpret bits as repeated records, returning arrays of fields.
 
     Other methods:
 
@@ -3679,6 +5371,7 @@ class ConstBitStream(Bits):
     peek() -- Peek at and interpret next bits as a single item.
     peeklist() -- Peek at and interpret next bits as a list of items.
     read() -- Read and interpret next bits as a single item.
+    readarray() -- Read and interpret next bits as consecutive items of one token.
     readlist() -- Read and interpret next bits as a list of items.
 
     Special methods:
@@ -3687,6 +5380,7 @@ class ConstBitStream(Bits):
 
     Properties:
 
+    accesspattern -- How the file the bitstring was created from will be read.
     bin -- The bitstring as a binary string.
     bool -- For single bit bitstrings, interpret as True or False.
     bytepos -- The current byte position in the bitstring.
@@ -3714,7 +5408,7 @@ class ConstBitStream(Bits):
 
     """
 
-    __slots__ = ('_pos')
+    __slots__ = ('_pos', '_access', '_readahead')
 
     def __init__(self, auto=None, length=None, offset=None, **kwargs):
         """Either specify an 'auto' initialiser:
@@ -3744,6 +5438,7 @@ class ConstBitStream(Bits):
         uie -- an unsigned interleaved exponential-Golomb code.
         bool -- a boolean (True or False).
         filename -- a file which will be opened in binary read-only mode.
+                    Files ending in .gz, .bz2 or .xz are decompressed.
 
         Other keyword arguments:
         length -- length of the bitstring in bits, if needed and appropriate.
@@ -3751,6 +5446,8 @@ class ConstBitStream(Bits):
         offset -- bit offset to the data. These offset bits are
                   ignored and this is intended for use when
                   initialising using 'bytes' or 'filename'.
+        sparse -- if True, create a bitstring of zeros that only stores
+                  its nonzero bytes. Use with just a length.
 
         """
         self._pos = 0
@@ -3758,6 +5455,8 @@ class ConstBitStream(Bits):
     def __new__(cls, auto=None, length=None, offset=None, **kwargs):
         x = super(ConstBitStream, cls).__new__(cls)
         x._initialise(auto, length, offset, **kwargs)
+        x._access = 'normal'
+        x._readahead = None
         return x
 
     def _setbytepos(self, bytepos):
@@ -3782,6 +5481,31 @@ class ConstBitStream(Bits):
         """Return the current position in the stream in bits."""
         return self._pos
 
+    def _setaccesspattern(self, pattern):
+        """Tell the OS how the file the stream was created from will be read."""
+        if pattern not in ACCESS_PATTERNS:
+            raise ValueError("Access pattern must be one of {0}, not '{1}'.".format(
+                ', '.join(sorted(ACCESS_PATTERNS)), pattern))
+        self._access = pattern
+        self._readahead = None
+        rawarray = self._datastore._rawarray
+        if isinstance(rawarray, MmapByteArray) and rawarray.advise(pattern):
+            if pattern == 'sequential':
+                self._readahead = rawarray
+
+    def _getaccesspattern(self):
+        """Return how the stream has been said to be read."""
+        return self._access
+
+    def _hintreadahead(self):
+        """Ask for the part of the file after the current position to be read in."""
+        rawarray = self._readahead
+        if rawarray is not self._datastore._rawarray:
+            # The bitstring has been changed, so is no longer read from the file.
+            self._readahead = None
+            return
+        rawarray.readahead((self._pos + self._datastore.offset) // 8)
+
     def _clear(self):
         Bits._clear(self)
         self._pos = 0
@@ -3831,10 +5555,12 @@ class ConstBitStream(Bits):
                         'sie'       : next bits as signed interleaved exp-Golomb code
                         'bits:5'    : 5 bits as a bitstring
                         'bytes:10'  : 10 bytes as a bytes object
+                        'bytesview:4': 4 bytes as a read-only memoryview
                         'bool'      : 1 bit as a bool
                         'pad:3'     : 3 bits of padding to ignore - returns None
 
-        fmt may also be an integer, which will be treated like the 'bits' token.
+        fmt may also be an integer, which will be treated like the 'bits' token,
+        or a VLCTable, which will read a single code from the table.
 
         The position in the bitstring is advanced to after the read items.
 
@@ -3842,6 +5568,8 @@ class ConstBitStream(Bits):
         Raises ValueError if the format is not understood.
 
         """
+        if self._readahead is not None:
+            self._hintreadahead()
         if isinstance(fmt, numbers.Integral):
             if fmt < 0:
                 raise ValueError("Cannot read negative amount.")
@@ -3851,6 +5579,9 @@ class ConstBitStream(Bits):
             bs = self._slice(self._pos, self._pos + fmt)
             self._pos += fmt
             return bs
+        if isinstance(fmt, VLCTable):
+            value, self._pos = fmt._decode(self, self._pos)
+            return value
         p = self._pos
         _, token = tokenparser(fmt)
         if len(token) != 1:
@@ -3863,6 +5594,45 @@ class ConstBitStream(Bits):
         value, self._pos = self._readtoken(name, self._pos, length)
         return value
 
+    def readarray(self, fmt, count=None):
+        """Interpret next bits as consecutive items of a single token.
+
+        fmt -- A single fixed-length token such as 'uint:12' or 'floatle:32',
+               an exponential-Golomb code such as 'ue', or a VLCTable.
+        count -- The number of items to read. Defaults to as many as are
+                 available.
+
+        Integers of up to 64 bits and 32 or 64 bit floats are returned as an
+        array.array, and other tokens as a list. This is much faster than
+        using readlist with a repeated token.
+
+        The position in the bitstring is advanced to after the read items.
+
+        Raises ValueError if the format is not a single suitable token.
+        Raises ReadError if not enough bits are available.
+
+        """
+        if count is not None and count < 0:
+            raise ValueError("Cannot read a negative number of items.")
+        if self._readahead is not None:
+            self._hintreadahead()
+        if isinstance(fmt, VLCTable):
+            values, self._pos = fmt._decodearray(self, self._pos, count)
+            return values
+        name, length = self._arraytoken(fmt)
+        if length is None:
+            values, self._pos = self._readcodearray(name, self._pos, count)
+            return values
+        available = self.len - self._pos
+        if count is None:
+            count = available // length
+        if count * length > available:
+            raise ReadError("Cannot read {0} items of {1} bits, only {2} bits available.",
+                            count, length, available)
+        values = self._readarray(name, length, self._pos, count)
+        self._pos += count * length
+        return values
+
     def readlist(self, fmt, **kwargs):
         """Interpret next bits according to format string(s) and return list.
 
@@ -3884,6 +5654,8 @@ class ConstBitStream(Bits):
         >>> i, bs1, bs2 = s.readlist(['uint:12', 10, 10])
 
         """
+        if self._readahead is not None:
+            self._hintreadahead()
         value, self._pos = self._readlist(fmt, self._pos, **kwargs)
         return value
 
@@ -3901,6 +5673,8 @@ class ConstBitStream(Bits):
         if isinstance(bs, numbers.Integral):
             raise ValueError("Integers cannot be searched for")
         bs = Bits(bs)
+        if self._readahead is not None:
+            self._hintreadahead()
         oldpos = self._pos
         p = self.find(bs, self._pos, bytealigned=bytealigned)
         if not p:
@@ -3970,6 +5744,10 @@ class ConstBitStream(Bits):
     bytepos = property(_getbytepos, _setbytepos,
                        doc="""The position in the bitstring in bytes. Read and write.
                       """)
+    accesspattern = property(_getaccesspattern, _setaccesspattern,
+                             doc="""How the file the bitstring was created from will be read.
+                             One of 'normal', 'sequential' or 'random'. Read and write.
+                             """)
 
 
 
@@ -3993,26 +5771,35 @@ class BitStream(ConstBitStream, BitArray):
     endswith() -- Return whether the bitstring ends with a sub-string.
     find() -- Find a sub-bitstring in the current bitstring.
     findall() -- Find all occurrences of a sub-bitstring in the current bitstring.
+    from_numpy() -- Create a bitstring from a NumPy array of packed fields.
     insert() -- Insert a bitstring.
     invert() -- Flip bit(s) between one and zero.
+    iter_set() -- Create generator of the positions of bits set to 1 or 0.
     join() -- Join bitstrings together using current bitstring.
     overwrite() -- Overwrite a section with a new bitstring.
     peek() -- Peek at and interpret next bits as a single item.
     peeklist() -- Peek at and interpret next bits as a list of items.
     prepend() -- Prepend a bitstring.
+    rank() -- Count the number of 1 bits before a position.
     read() -- Read and interpret next bits as a single item.
+    readarray() -- Read and interpret next bits as consecutive items of one token.
     readlist() -- Read and interpret next bits as a list of items.
     replace() -- Replace occurrences of one bitstring with another.
     reverse() -- Reverse bits in-place.
     rfind() -- Seek backwards to find a sub-bitstring.
     rol() -- Rotate bits to the left.
     ror() -- Rotate bits to the right.
+    select() -- Find the position of the nth 1 bit.
     set() -- Set bit(s) to 1 or 0.
     split() -- Create generator of chunks split by a delimiter.
     startswith() -- Return whether the bitstring starts with a sub-bitstring.
+    to_numpy() -- Interpret bits as packed fields and return a NumPy array.
     tobytes() -- Return bitstring as bytes, padding if needed.
+    tomemoryview() -- Return a read-only memoryview of the bitstring as bytes.
     tofile() -- Write bitstring to file, padding if needed.
     unpack() -- Interpret bits using format string.
+    unpack_array() -- Interpret bits as consecutive items of one fixed-length token.
+    unpack_many() -- Interpret bits as repeated records, returning arrays of fields.
 
     Special methods:
 
@@ -4021,6 +5808,7 @@ class BitStream(ConstBitStream, BitArray):
 
     Properties:
 
+    accesspattern -- How the file the bitstring was created from will be read.
     bin -- The bitstring as a binary string.
     bool -- For single bit bitstrings, interpret as True or False.
     bytepos -- The current byte position in the bitstring.
@@ -4081,6 +5869,7 @@ class BitStream(ConstBitStream, BitArray):
         uie -- an unsigned interleaved exponential-Golomb code.
         bool -- a boolean (True or False).
         filename -- a file which will be opened in binary read-only mode.
+                    Files ending in .gz, .bz2 or .xz are decompressed.
 
         Other keyword arguments:
         length -- length of the bitstring in bits, if needed and appropriate.
@@ -4088,6 +5877,8 @@ class BitStream(ConstBitStream, BitArray):
         offset -- bit offset to the data. These offset bits are
                   ignored and this is intended for use when
                   initialising using 'bytes' or 'filename'.
+        sparse -- if True, create a bitstring of zeros that only stores
+                  its nonzero bytes. Use with just a length.
 
         """
         self._pos = 0
@@ -4159,6 +5950,22 @@ def pack(fmt, *values, **kwargs):
     >>> t = pack(['bits', 'bin:3'], s, '111')
     >>> u = pack('uint:8=a, uint:8=b, uint:55=a', a=6, b=44)
 
+    """
+    # The values are written straight into a single buffer, which then
+    # becomes the new BitStream's store without being copied.
+    w = BitWriter()
+    w._writetokens(packtokens(fmt, values, kwargs), strict=False)
+    s = BitStream()
+    s._datastore = w._getstore(copy=False)
+    return s
+
+
+def packtokens(fmt, values, kwargs):
+    """Return a list of the name, length and value of each token to pack.
+
+    The values and keyword arguments are substituted into the tokens as
+    for pack(). Not part of public interface.
+
     """
     tokens = []
     if isinstance(fmt, basestring):
@@ -4170,7 +5977,7 @@ def pack(fmt, *values, **kwargs):
     except ValueError as e:
         raise CreationError(*e.args)
     value_iter = iter(values)
-    s = Bits()
+    resolved = []
     try:
         for name, length, value in tokens:
             # If the value is in the kwd dictionary then it takes precedence.
@@ -4181,14 +5988,14 @@ def pack(fmt, *values, **kwargs):
                 length = kwargs[length]
             # Also if we just have a dictionary name then we want to use it
             if name in kwargs and length is None and value is None:
-                s._append(Bits(kwargs[name]))
+                resolved.append(('bits', None, Bits(kwargs[name])))
                 continue
             if length is not None:
                 length = int(length)
             if value is None and name != 'pad':
                 # Take the next value from the ones provided
                 value = next(value_iter)
-            s._append(Bits._init_with_token(name, length, value))
+            resolved.append((name, length, value))
     except StopIteration:
         raise CreationError("Not enough parameters present to pack according to the "
                             "format. {0} values are needed.", len(tokens))
@@ -4196,10 +6003,1376 @@ def pack(fmt, *values, **kwargs):
         next(value_iter)
     except StopIteration:
         # Good, we've used up all the *values.
-        return BitStream(s)
+        return resolved
     raise CreationError("Too many parameters present to pack according to the format.")
 
 
+def packtoken(name, length, value, cache={}):
+    """Return a Bits for a single token to pack.
+
+    Results for numbers and strings are cached, so tokens with literal values
+    such as 'uint:8=5' are only converted the first time. Not part of public
+    interface.
+
+    """
+    if name in ('bits', 'bytes', 'bytesview') or not isinstance(value, (numbers.Number, basestring)):
+        # These could be large, and a bits value could be mutable.
+        return Bits._init_with_token(name, length, value)
+    # Equal values can pack differently, such as 0.0 and -0.0, or 1 and True.
+    key = (name, length, type(value), repr(value))
+    try:
+        return cache[key]
+    except KeyError:
+        b = Bits._init_with_token(name, length, value)
+        if len(cache) < CACHE_SIZE:
+            cache[key] = b
+        return b
+
+
+def pack_ue(values):
+    """Pack the values as consecutive unsigned exponential-Golomb codes and return a new BitStream.
+
+    values -- An iterable of non-negative integers.
+
+    This gives the same result as pack() with a 'ue' token for each value,
+    but writes the codes straight to a BitWriter so is much faster for long
+    sequences.
+
+    >>> s = pack_ue([0, 1, 2, 3])
+    >>> s.bin
+    '101001100100'
+
+    """
+    w = BitWriter()
+    writeuint = w._writeuint
+    for v in values:
+        if v < 0:
+            raise CreationError("Cannot use negative initialiser for unsigned "
+                                "exponential-Golomb.")
+        writeuint(*uecode(v))
+    s = BitStream()
+    s._datastore = w._getstore(copy=False)
+    return s
+
+
+class BitWriter(object):
+    """Writes bits one value at a time, optionally streaming them to a file.
+
+    Bits are gathered in an integer and moved into a growing buffer as
+    whole bytes, which is much quicker than appending to a BitStream.
+
+    Methods:
+
+    bytealign() -- Write zero bits up to the next byte boundary.
+    close() -- Pad to a whole byte and send everything to the file.
+    flush() -- Send all the complete bytes to the file.
+    getvalue() -- Return everything written as a BitStream.
+    write() -- Write values according to a format string.
+    write_bits() -- Write a bitstring.
+    write_int() -- Write a signed integer.
+    write_se() -- Write a signed exponential-Golomb code.
+    write_ue() -- Write an unsigned exponential-Golomb code.
+    write_uint() -- Write an unsigned integer.
+
+    Special methods:
+
+    Supports len() to give the number of bits written, and the with
+    statement, which calls close() at the end.
+
+    Properties:
+
+    len -- The number of bits written.
+
+    """
+
+    __slots__ = ('_acc', '_accbits', '_buffer', '_buffersize', '_send', '_sent')
+
+    def __init__(self, f=None, buffersize=BITWRITER_BUFFER_SIZE):
+        """Create a new BitWriter.
+
+        f -- An optional file object opened in binary mode, or a socket.
+             Whole bytes are sent to it as the buffer fills up, otherwise
+             they are kept in memory until getvalue() is called.
+        buffersize -- The number of bytes to buffer before sending them to
+                      the file. Defaults to 1MB.
+
+        >>> w = BitWriter()
+        >>> w.write_uint(244, 12)
+        >>> w.write('float:32, ue', 0.4, 3)
+        >>> s = w.getvalue()
+
+        """
+        self._acc = 0
+        self._accbits = 0
+        self._buffer = bytearray()
+        self._buffersize = buffersize
+        self._sent = 0
+        if f is None:
+            self._send = None
+        else:
+            try:
+                self._send = f.write
+            except AttributeError:
+                self._send = f.sendall
+
+    def __len__(self):
+        return self.len
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Don't send partial output, or hide the exception, if the block failed.
+        if exc_type is None and self._send is not None:
+            self.close()
+
+    def _writeuint(self, value, length):
+        """Write an unsigned integer that is known to fit in length bits."""
+        self._acc = (self._acc << length) | value
+        self._accbits += length
+        if self._accbits >= BITWRITER_FLUSH_BITS:
+            self._flushacc()
+
+    def _flushacc(self):
+        """Move the whole bytes of the integer into the buffer."""
+        leftover = self._accbits % 8
+        nbytes = self._accbits // 8
+        if nbytes:
+            self._buffer += binascii.unhexlify('{0:0{1}x}'.format(self._acc >> leftover, 2 * nbytes))
+            self._acc &= (1 << leftover) - 1
+            self._accbits = leftover
+            if self._send is not None and len(self._buffer) >= self._buffersize:
+                self._sendbuffer()
+
+    def _sendbuffer(self):
+        """Send the buffer to the file and empty it."""
+        self._send(bytes(self._buffer))
+        self._sent += len(self._buffer)
+        del self._buffer[:]
+
+    def write_uint(self, value, length):
+        """Write an unsigned integer.
+
+        value -- The non-negative integer to write.
+        length -- The number of bits to write it in.
+
+        Raises CreationError if the value doesn't fit in the length.
+
+        """
+        if length <= 0:
+            raise CreationError("A positive length must be given to write a uint, not {0}.", length)
+        if not 0 <= value < (1 << length):
+            raise CreationError("{0} can't be written as an unsigned integer of length {1}. "
+                                "The allowed range is [0, {2}].", value, length, (1 << length) - 1)
+        self._writeuint(value, length)
+
+    def write_int(self, value, length):
+        """Write a two's complement signed integer.
+
+        value -- The integer to write.
+        length -- The number of bits to write it in.
+
+        Raises CreationError if the value doesn't fit in the length.
+
+        """
+        if length <= 0:
+            raise CreationError("A positive length must be given to write an int, not {0}.", length)
+        if not -(1 << (length - 1)) <= value < (1 << (length - 1)):
+            raise CreationError("{0} can't be written as a signed integer of length {1}. "
+                                "The allowed range is [{2}, {3}].", value, length,
+                                -(1 << (length - 1)), (1 << (length - 1)) - 1)
+        self._writeuint(value & ((1 << length) - 1), length)
+
+    def write_ue(self, value):
+        """Write an unsigned exponential-Golomb code.
+
+        Raises CreationError if the value is negative.
+
+        """
+        if value < 0:
+            raise CreationError("Cannot use negative initialiser for unsigned "
+                                "exponential-Golomb.")
+        self._writeuint(*uecode(value))
+
+    def write_se(self, value):
+        """Write a signed exponential-Golomb code."""
+        self._writeuint(*uecode(2 * value - 1 if value > 0 else -2 * value))
+
+    def write_bits(self, bs):
+        """Write a bitstring.
+
+        bs -- The bitstring to write, or anything that can be used to
+              create one, for example '0b110'.
+
+        """
+        if not isinstance(bs, Bits):
+            bs = Bits(bs)
+        length = bs.len
+        if length > BITWRITER_FLUSH_BITS and not self._accbits % 8:
+            wholebits = length - length % 8
+            self._writebytes(bs._slice(0, wholebits).tobytes())
+            if wholebits < length:
+                self._writeuint(bs._readuint(length - wholebits, wholebits), length - wholebits)
+        elif length:
+            self._writeuint(bs._readuint(length, 0), length)
+
+    def write(self, fmt, *values, **kwargs):
+        """Write values according to a format string.
+
+        fmt -- A single string or a list of strings with comma separated
+               tokens, as for the pack() function.
+        values -- Zero or more values to write according to the format.
+        kwargs -- A dictionary or keyword-value pairs - the keywords used in
+                  the format string will be replaced with their given value.
+
+        Nothing is written if the values don't match the format. Unlike
+        pack(), values of integer tokens that aren't whole numbers raise
+        CreationError rather than being truncated.
+
+        >>> w.write('uint:12=244, float:32=0.4')
+        >>> w.write('int:8, ue', -3, 10)
+
+        """
+        self._writetokens(packtokens(fmt, values, kwargs))
+
+    def _writetokens(self, tokens, strict=True):
+        """Write a list of names, lengths and values from packtokens().
+
+        If strict is False then values of integer tokens that aren't whole
+        numbers are truncated, as pack() has always done, rather than raising.
+
+        """
+        # Convert everything before writing anything.
+        items = []
+        i = 0
+        ntokens = len(tokens)
+        while i < ntokens:
+            name, length, value = tokens[i]
+            code = structcode(name, length) if length else None
+            if code is not None:
+                # Try to pack a run of tokens that the struct module understands in one go.
+                endian, codes = code[0], [code[1]]
+                j = i + 1
+                while j < ntokens:
+                    code = structcode(tokens[j][0], tokens[j][1]) if tokens[j][1] else None
+                    if code is None or (code[0] is not None and endian is not None and
+                                        code[0] != endian):
+                        break
+                    endian = endian or code[0]
+                    codes.append(code[1])
+                    j += 1
+                if j - i > 1 or name not in ('uint', 'int', 'pad'):
+                    data = self._structpack((endian or '>') + ''.join(codes), tokens[i:j],
+                                            strict)
+                    if data is not None:
+                        items.append(data)
+                        i = j
+                        continue
+            items.append(self._convert(name, length, value, strict))
+            i += 1
+        for item in items:
+            if isinstance(item, Bits):
+                self.write_bits(item)
+            elif isinstance(item, bytes):
+                self._writebytes(item)
+            else:
+                self._writeuint(*item)
+
+    @staticmethod
+    def _structpack(fmt, tokens, strict):
+        """Return the values of the tokens packed with the struct format, or None if they can't be."""
+        values = []
+        for name, length, value in tokens:
+            if name == 'pad':
+                continue
+            if name == 'bytes':
+                if not isinstance(value, bytes) or len(value) * 8 != length:
+                    return None
+            elif name.startswith('float'):
+                value = float(value)
+            else:
+                value = BitWriter._toint(name, value, strict)
+            values.append(value)
+        try:
+            return struct.pack(fmt, *values)
+        except (struct.error, OverflowError):
+            # Out of range, so let the usual conversion give the error.
+            return None
+
+    @staticmethod
+    def _toint(name, value, strict):
+        """Return the value of an integer token as an int.
+
+        If strict is True, raises CreationError if it isn't a whole number
+        rather than truncating it.
+
+        """
+        try:
+            i = int(value)
+        except (TypeError, ValueError):
+            raise CreationError("{0!r} can't be written as a {1} token.", value, name)
+        if strict and i != value and not isinstance(value, basestring):
+            raise CreationError("{0!r} isn't a whole number so can't be written as a {1} token.",
+                                value, name)
+        return i
+
+    @staticmethod
+    def _convert(name, length, value, strict):
+        """Return a token as an integer and length, or as a Bits."""
+        if name == 'uint' and length:
+            value = BitWriter._toint(name, value, strict)
+            if not 0 <= value < (1 << length):
+                raise CreationError("{0} can't be written as an unsigned integer of length {1}. "
+                                    "The allowed range is [0, {2}].", value, length,
+                                    (1 << length) - 1)
+            return value, length
+        if name in ('ue', 'se'):
+            value = BitWriter._toint(name, value, strict)
+            if name == 'se':
+                value = 2 * value - 1 if value > 0 else -2 * value
+            elif value < 0:
+                raise CreationError("Cannot use negative initialiser for unsigned "
+                                    "exponential-Golomb.")
+            return uecode(value)
+        if name == 'int' and length:
+            value = BitWriter._toint(name, value, strict)
+            if not -(1 << (length - 1)) <= value < (1 << (length - 1)):
+                raise CreationError("{0} can't be written as a signed integer of length {1}. "
+                                    "The allowed range is [{2}, {3}].", value, length,
+                                    -(1 << (length - 1)), (1 << (length - 1)) - 1)
+            return value & ((1 << length) - 1), length
+        return packtoken(name, length, value)
+
+    def _writebytes(self, data):
+        """Write the bits of a bytes object."""
+        if not data:
+            return
+        if not self._accbits % 8:
+            # On a byte boundary, so the bytes can go straight into the buffer.
+            self._flushacc()
+            self._buffer += data
+            if self._send is not None and len(self._buffer) >= self._buffersize:
+                self._sendbuffer()
+        else:
+            self._writeuint(int(binascii.hexlify(data), 16), 8 * len(data))
+
+    def bytealign(self):
+        """Write zero bits up to the next byte boundary and return the number written."""
+        skipped = -self._accbits % 8
+        if skipped:
+            self._writeuint(0, skipped)
+        return skipped
+
+    def flush(self):
+        """Send all the complete bytes to the file.
+
+        Any bits at the end that don't make up a whole byte are kept until
+        more are written. Use bytealign() first to send everything.
+
+        Raises Error if no file was given when the BitWriter was created.
+
+        """
+        if self._send is None:
+            raise Error("There's no file to flush to.")
+        self._flushacc()
+        if self._buffer:
+            self._sendbuffer()
+
+    def close(self):
+        """Pad with zero bits to a whole byte and send everything to the file.
+
+        Up to seven zero bits will be added at the end to byte align, as
+        for tofile(). The file itself isn't closed.
+
+        Raises Error if no file was given when the BitWriter was created.
+
+        """
+        if self._send is None:
+            raise Error("There's no file to close.")
+        self.bytealign()
+        self.flush()
+
+    def getvalue(self):
+        """Return everything written as a new BitStream.
+
+        Raises Error if the bits are being sent to a file.
+
+        """
+        if self._send is not None:
+            raise Error("The bits have been sent to a file so can't be returned.")
+        s = BitStream()
+        s._datastore = self._getstore()
+        return s
+
+    def _getstore(self, copy=True):
+        """Return a ByteStore holding everything written.
+
+        If copy is False then the buffer is used for the store, and the
+        BitWriter mustn't be used afterwards.
+
+        """
+        data = bytearray(self._buffer) if copy else self._buffer
+        length = 8 * len(data) + self._accbits
+        if self._accbits:
+            # Pad the remaining bits out to whole bytes.
+            padding = -self._accbits % 8
+            data += binascii.unhexlify('{0:0{1}x}'.format(self._acc << padding,
+                                                          (self._accbits + padding) // 4))
+        return ByteStore(data, length, 0)
+
+    @property
+    def len(self):
+        """The number of bits written. Read only."""
+        return 8 * (self._sent + len(self._buffer)) + self._accbits
+
+
+class PackedArray(object):
+    """A mutable array of fixed-width integers packed end to end in a BitArray.
+
+    Methods:
+
+    append() -- Append a single integer to the end of the array.
+    extend() -- Append integers from an iterable to the end of the array.
+    frombytes() -- Append integers packed in a bytes object.
+    tobytes() -- Return the packed integers as bytes, padded with zero bits.
+    toarray() -- Return the integers as an array.array.
+    tolist() -- Return the integers as a list.
+
+    Special methods:
+
+    Supports indexing and slicing with [], len(), iteration, equality
+    testing and deletion with del.
+
+    Properties:
+
+    bits -- The packed integers as a Bits object.
+    signed -- True if the integers are two's complement signed.
+    width -- The number of bits used for each integer.
+
+    """
+
+    __slots__ = ('_bits', '_width', '_signed', '_min', '_max')
+
+    def __init__(self, width, signed=False, values=None):
+        """Create a new PackedArray.
+
+        width -- The number of bits used to store each integer.
+        signed -- If True the integers are stored as two's complement signed
+                  integers, otherwise they are unsigned.
+        values -- An optional iterable of integers to initialise with.
+
+        >>> a = PackedArray(12, values=[1, 2, 4095])
+        >>> a.tobytes()
+        b'\\x00\\x10\\x02\\xff\\xf0'
+
+        """
+        if not isinstance(width, numbers.Integral) or width <= 0:
+            raise ValueError("width must be a positive integer, not {0}.".format(width))
+        self._width = width
+        self._signed = bool(signed)
+        if self._signed:
+            self._min, self._max = -(1 << (width - 1)), (1 << (width - 1)) - 1
+        else:
+            self._min, self._max = 0, (1 << width) - 1
+        self._bits = BitArray()
+        if values is not None:
+            self.extend(values)
+
+    def __len__(self):
+        return self._bits.len // self._width
+
+    def __getitem__(self, key):
+        length = len(self)
+        try:
+            start, stop, step = key.indices(length)
+        except AttributeError:
+            if key < 0:
+                key += length
+            if not 0 <= key < length:
+                raise IndexError("PackedArray index out of range.")
+            return self._readvalue(key)
+        a = self._empty()
+        if step == 1:
+            if start < stop:
+                w = self._width
+                a._bits = self._bits._slice(start * w, stop * w)
+        else:
+            a.extend(self._readvalue(i) for i in xrange(start, stop, step))
+        return a
+
+    def __setitem__(self, key, value):
+        length = len(self)
+        try:
+            start, stop, step = key.indices(length)
+        except AttributeError:
+            if key < 0:
+                key += length
+            if not 0 <= key < length:
+                raise IndexError("PackedArray index out of range.")
+            self._checkvalue(value)
+            self._writevalue(key, value)
+            return
+        w = self._width
+        if step == 1:
+            stop = max(start, stop)
+            self._bits[start * w:stop * w] = self._pack(value)
+            return
+        positions = xrange(start, stop, step)
+        values = list(value)
+        if len(values) != len(positions):
+            raise ValueError("Attempt to assign sequence of size {0} to extended slice "
+                             "of size {1}.".format(len(values), len(positions)))
+        for v in values:
+            self._checkvalue(v)
+        for i, v in zip(positions, values):
+            self._writevalue(i, v)
+
+    def __delitem__(self, key):
+        length = len(self)
+        w = self._width
+        try:
+            start, stop, step = key.indices(length)
+        except AttributeError:
+            if key < 0:
+                key += length
+            if not 0 <= key < length:
+                raise IndexError("PackedArray index out of range.")
+            del self._bits[key * w:(key + 1) * w]
+            return
+        if step == 1:
+            if start < stop:
+                del self._bits[start * w:stop * w]
+            return
+        keep = set(xrange(length)) - set(xrange(start, stop, step))
+        self._bits = self._pack(self._readvalue(i) for i in sorted(keep))
+
+    def __iter__(self):
+        return iter(self._readall())
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedArray):
+            return NotImplemented
+        return (self._width == other._width and self._signed == other._signed and
+                self._bits == other._bits)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{0}({1}, signed={2}, values={3})".format(self.__class__.__name__, self._width,
+                                                         self._signed, self.tolist())
+
+    def _empty(self):
+        """Return a new empty PackedArray of the same type."""
+        return PackedArray(self._width, self._signed)
+
+    def _checkvalue(self, value):
+        if not self._min <= value <= self._max:
+            raise ValueError("{0} is out of range for a {1}-bit {2} integer. The allowed range "
+                             "is [{3}, {4}].".format(value, self._width,
+                                                     'signed' if self._signed else 'unsigned',
+                                                     self._min, self._max))
+
+    def _readall(self):
+        """Return all of the integers in an array.array, or a list if they're too large."""
+        return self._bits._readintarray(self._width, 0, len(self), self._signed,
+                                        array_typecode(self._width, self._signed))
+
+    def _readvalue(self, index):
+        """Return the integer at index, without checks."""
+        if self._signed:
+            return self._bits._readint(self._width, index * self._width)
+        return self._bits._readuint(self._width, index * self._width)
+
+    def _writevalue(self, index, value):
+        """Overwrite the integer at index, without checks."""
+        w = self._width
+        bits = self._bits
+        start = bits._offset + index * w
+        startbyte = start // 8
+        endbyte = (start + w - 1) // 8
+        shift = 8 * (endbyte + 1) - (start + w)
+        store = bits._datastore
+        old = int(binascii.hexlify(bytes(store.getbyteslice(startbyte, endbyte + 1))), 16)
+        mask = ((1 << w) - 1) << shift
+        new = (old & ~mask) | ((value << shift) & mask)
+        data = binascii.unhexlify('{0:0{1}x}'.format(new, 2 * (endbyte - startbyte + 1)))
+        store.setbyteslice(startbyte, endbyte + 1, bytearray(data))
+
+    def _pack(self, values):
+        """Return a BitArray with the values packed end to end."""
+        w = self._width
+        mask = (1 << w) - 1
+        check = self._checkvalue
+        # Collecting a multiple of 8 values gives whole bytes, and
+        # smallish chunks keep the integer arithmetic cheap.
+        chunksize = 256
+        chunks = []
+        acc = n = 0
+        for v in values:
+            check(v)
+            acc = (acc << w) | (v & mask)
+            n += 1
+            if n == chunksize:
+                chunks.append('{0:0{1}x}'.format(acc, n * w // 4))
+                acc = n = 0
+        bits = BitArray(bytes=binascii.unhexlify(''.join(chunks)))
+        if n:
+            bits._append(Bits(uint=acc, length=n * w))
+        return bits
+
+    def append(self, value):
+        """Append a single integer to the end of the array.
+
+        Raises ValueError if the value doesn't fit in the width.
+
+        """
+        self._checkvalue(value)
+        if self._signed and value < 0:
+            value += 1 << self._width
+        self._bits._append(Bits(uint=value, length=self._width))
+
+    def extend(self, values):
+        """Append integers from an iterable to the end of the array.
+
+        values -- An iterable of integers, for example a list, an array.array
+                  or another PackedArray.
+
+        Raises ValueError if any of the values don't fit in the width.
+
+        """
+        if isinstance(values, PackedArray) and values._width == self._width \
+                and values._signed == self._signed:
+            self._bits._append(values._bits)
+            return
+        self._bits._append(self._pack(values))
+
+    def frombytes(self, data):
+        """Append integers packed in a bytes object.
+
+        data -- Packed integers of the same width. Any bits at the end
+                that don't make a whole integer are ignored.
+
+        """
+        bits = Bits(bytes=data)
+        self._bits._append(bits[:bits.len - bits.len % self._width])
+
+    def tobytes(self):
+        """Return the packed integers as bytes.
+
+        Up to seven zero bits will be added at the end to byte align.
+
+        """
+        return self._bits.tobytes()
+
+    def tolist(self):
+        """Return the integers as a list."""
+        return list(self._readall())
+
+    def toarray(self, typecode=None):
+        """Return the integers as an array.array.
+
+        typecode -- The array.array type code to use. Defaults to the
+                    smallest type that can hold the integers.
+
+        Raises ValueError if no type code is given and the width is too
+        large for any of the array types.
+
+        """
+        if typecode is not None:
+            return array.array(typecode, self._readall())
+        if array_typecode(self._width, self._signed) is None:
+            raise ValueError("No array type can hold {0}-bit integers.".format(self._width))
+        return self._readall()
+
+    @property
+    def bits(self):
+        """The packed integers as a Bits object. Read only."""
+        return Bits(self._bits)
+
+    @property
+    def signed(self):
+        """True if the integers are two's complement signed. Read only."""
+        return self._signed
+
+    @property
+    def width(self):
+        """The number of bits used for each integer. Read only."""
+        return self._width
+
+
+class VLCTable(object):
+    """A prefix code compiled into lookup tables for fast decoding.
+
+    A VLCTable can be used in place of a format string in the read(),
+    peek() and readarray() methods of ConstBitStream and in unpack_array().
+
+    Special methods:
+
+    Supports len() to give the number of codes.
+
+    Properties:
+
+    codes -- A dictionary of the codes as Bits objects and their values.
+    levelbits -- The number of bits looked up at each level of the tables.
+    maxlength -- The length in bits of the longest code.
+
+    """
+
+    __slots__ = ('_codes', '_levelbits', '_maxlength', '_root')
+
+    def __init__(self, codes, levelbits=8):
+        """Compile a prefix code into lookup tables.
+
+        codes -- A dictionary with a bitstring for each code, for example
+                 '0b01', and the value to return when it is read.
+        levelbits -- The number of bits looked up at each level of the
+                     tables, up to the length of the longest code. Codes
+                     longer than this are found by following one table into
+                     another.
+
+        Raises ValueError if there are no codes, or if a code is empty,
+        repeated or is a prefix of another code.
+
+        >>> t = VLCTable({'0b1': 0, '0b01': 1, '0b001': 2, '0b000': 3})
+        >>> ConstBitStream('0b01001').readarray(t, 2)
+        [1, 2]
+
+        """
+        if not isinstance(levelbits, numbers.Integral) or levelbits <= 0:
+            raise ValueError("levelbits must be a positive integer, not {0}.".format(levelbits))
+        self._codes = {}
+        for code, value in codes.items():
+            code = Bits(code)
+            if not code.len:
+                raise ValueError("A code can't be empty.")
+            if code in self._codes:
+                raise ValueError("Code '{0}' appears more than once.".format(code))
+            self._codes[code] = value
+        if not self._codes:
+            raise ValueError("A VLCTable needs at least one code.")
+        binary = sorted((code.bin, value) for code, value in self._codes.items())
+        # If a code is a prefix of another it sorts directly before one that it's a prefix of.
+        for (a, _), (b, _) in zip(binary, binary[1:]):
+            if b.startswith(a):
+                raise ValueError("Code '0b{0}' is a prefix of code '0b{1}'.".format(a, b))
+        self._maxlength = max(len(code) for code, _ in binary)
+        # There's no point in tables that are wider than the longest code.
+        self._levelbits = max(1, min(levelbits, self._maxlength))
+        self._root = self._build(binary)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __repr__(self):
+        return "{0}({1!r}, levelbits={2})".format(self.__class__.__name__,
+                                                  dict((str(c), v) for c, v in self._codes.items()),
+                                                  self._levelbits)
+
+    def _build(self, codes):
+        """Return a lookup table for a list of binary strings and values.
+
+        Each table has an entry for every possible value of the next
+        levelbits bits. An entry is a tuple of the code length and its value,
+        or of 0 and a table for the bits after levelbits, or None if no code
+        matches.
+
+        """
+        levelbits = self._levelbits
+        table = [None] * (1 << levelbits)
+        subcodes = {}
+        for code, value in codes:
+            length = len(code)
+            if length <= levelbits:
+                # Every entry that starts with the code decodes to it.
+                first = int(code, 2) << (levelbits - length)
+                entry = (length, value)
+                for i in xrange(first, first + (1 << (levelbits - length))):
+                    table[i] = entry
+            else:
+                subcodes.setdefault(int(code[:levelbits], 2), []).append((code[levelbits:], value))
+        for i, sub in subcodes.items():
+            table[i] = (0, self._build(sub))
+        return table
+
+    def _decode(self, bs, pos):
+        """Read a single code from bs at pos and return its value and the new position."""
+        levelbits = self._levelbits
+        table = self._root
+        start = pos
+        end = bs.len
+        while True:
+            available = end - pos
+            if available >= levelbits:
+                entry = table[bs._readuint(levelbits, pos)]
+            else:
+                if available <= 0:
+                    raise ReadError("Not enough bits to read a code at position {0}.", start)
+                # Pad the last few bits out to a full lookup.
+                entry = table[bs._readuint(available, pos) << (levelbits - available)]
+                if entry is not None and not 0 < entry[0] <= available:
+                    raise ReadError("Not enough bits to read a code at position {0}.", start)
+            if entry is None:
+                raise ReadError("No code in the table matches the bits at position {0}.", start)
+            length, value = entry
+            if length:
+                return value, pos + length
+            table = value
+            pos += levelbits
+
+    def _decodearray(self, bs, pos, count):
+        """Read count consecutive codes from bs at pos.
+
+        If count is None then codes are read up to the end of the bitstring.
+        Returns a list of the values and the new position.
+
+        """
+        end = bs.len
+        if count is None:
+            count = end - pos
+            toend = True
+        else:
+            toend = False
+        levelbits = self._levelbits
+        mask = (1 << levelbits) - 1
+        root = self._root
+        # Enough bits to follow the tables down to the longest code.
+        guard = -(-self._maxlength // levelbits) * levelbits
+        blocksize = max(VLC_BLOCK_SIZE, 4 * guard)
+        values = []
+        append = values.append
+        n = 0
+        while n < count and not (toend and pos == end):
+            blockbits = min(blocksize, end - pos)
+            if blockbits < guard:
+                # Close to the end, so read the last codes one at a time.
+                value, pos = self._decode(bs, pos)
+                append(value)
+                n += 1
+                continue
+            block = bs._readuint(blockbits, pos)
+            left = blockbits
+            while n < count and left >= guard:
+                codestart = left
+                entry = root[(block >> (left - levelbits)) & mask]
+                while entry is not None and not entry[0]:
+                    left -= levelbits
+                    entry = entry[1][(block >> (left - levelbits)) & mask]
+                if entry is None:
+                    raise ReadError("No code in the table matches the bits at position {0}.",
+                                    pos + blockbits - codestart)
+                left -= entry[0]
+                append(entry[1])
+                n += 1
+            pos += blockbits - left
+        return values, pos
+
+    @property
+    def codes(self):
+        """A dictionary of the codes as Bits objects and their values. Read only."""
+        return dict(self._codes)
+
+    @property
+    def levelbits(self):
+        """The number of bits looked up at each level of the tables. Read only."""
+        return self._levelbits
+
+    @property
+    def maxlength(self):
+        """The length in bits of the longest code. Read only."""
+        return self._maxlength
+
+
+class Record(object):
+    """Base class for records with a fixed layout of named fields.
+
+    Calling Record with a type name and a format string creates a new
+    subclass, with a decoder and encoder compiled for that layout.
+
+    >>> Header = Record('Header', 'sync:uint:12, id:uint:4, pad:2, flag:bool')
+    >>> h = Header.frombits('0xfff3, 0b001')
+    >>> h.id
+    3
+
+    Methods:
+
+    frombits() -- Create a record from the bits at a position in a bitstring.
+    read() -- Create a record from the bits at the current position of a ConstBitStream.
+    tobits() -- Return the record as a Bits object.
+
+    Class attributes:
+
+    fields -- The names of the fields in order.
+    length -- The length of a record in bits.
+
+    """
+
+    __slots__ = ()
+
+    fields = ()
+    length = 0
+
+    def __new__(cls, *args, **kwargs):
+        if cls is not Record:
+            return object.__new__(cls)
+        return Record._makeclass(*args, **kwargs)
+
+    @staticmethod
+    def _makeclass(typename, fmt):
+        """Return a new Record subclass for a format string of 'name:token' fields."""
+        if isinstance(fmt, basestring):
+            fmt = fmt.split(',')
+        fields = []
+        layout = []
+        position = 0
+        for item in fmt:
+            item = ''.join(item.split())
+            if not item:
+                continue
+            fieldname, _, token = item.partition(':')
+            if fieldname == 'pad':
+                fieldname, token = None, item
+            elif not RECORD_FIELD_RE.match(fieldname) or not token:
+                raise ValueError("Record fields should be 'name:token', not '{0}'.".format(item))
+            elif (fieldname in fields or hasattr(Record, fieldname) or fieldname == 'tobits' or
+                  keyword.iskeyword(fieldname)):
+                raise ValueError("Can't use '{0}' as a field name.".format(fieldname))
+            _, tokens = tokenparser(token)
+            if len(tokens) != 1:
+                raise ValueError("Field '{0}' should be a single token.".format(item))
+            name, length, value = tokens[0]
+            if value is not None:
+                raise ValueError("Field '{0}' shouldn't have a value.".format(item))
+            if not isinstance(length, numbers.Integral):
+                raise ValueError("Field '{0}' doesn't have a fixed length.".format(item))
+            if fieldname is not None:
+                fields.append(fieldname)
+                layout.append((fieldname, name, length, position))
+            position += length
+        total = position
+        # The uint, int and bool fields are all found from one int that
+        # spans them, and anything else uses the usual read functions.
+        intfields = [f for f in layout if f[1] in ('uint', 'int', 'bool')]
+        if intfields:
+            spanstart = intfields[0][3]
+            spanend = intfields[-1][3] + intfields[-1][2]
+        namespace = {'_new': object.__new__, 'ReadError': ReadError,
+                     'CreationError': CreationError, 'Bits': Bits}
+        args = ', '.join(fields)
+        init = ['def __init__(self{0}):'.format(', ' + args if args else '')]
+        init.extend('    self.{0} = {0}'.format(f) for f in fields)
+        if not fields:
+            init.append('    pass')
+        decode = ['def _decode(cls, s, pos):',
+                  '    if pos < 0 or pos + {0} > s.len:'.format(total),
+                  '        raise ReadError("Not enough bits for a {0} record at position {{0}}.", pos)'
+                  .format(typename),
+                  '    self = _new(cls)']
+        encode = ['def tobits(self):',
+                  '    """Return the record as a Bits object.',
+                  '',
+                  '    Raises CreationError if a field\'s value doesn\'t fit in its token.',
+                  '',
+                  '    """',
+                  '    x = 0']
+        if intfields:
+            decode.append('    x = s._readuint({0}, pos + {1})'.format(spanend - spanstart, spanstart))
+        for i, (fieldname, name, length, start) in enumerate(layout):
+            mask = (1 << length) - 1
+            shift = total - start - length
+            if name in ('uint', 'int', 'bool'):
+                spanshift = spanend - start - length
+                if name == 'uint':
+                    decode.append('    self.{0} = (x >> {1}) & {2}'.format(fieldname, spanshift, mask))
+                    encode.extend(['    v = self.{0}'.format(fieldname),
+                                   '    if not 0 <= v <= {0}:'.format(mask)])
+                elif name == 'int':
+                    signbit = 1 << (length - 1)
+                    decode.append('    self.{0} = ((x >> {1}) & {2} ^ {3}) - {3}'
+                                  .format(fieldname, spanshift, mask, signbit))
+                    encode.extend(['    v = self.{0}'.format(fieldname),
+                                   '    if not {0} <= v < {1}:'.format(-signbit, signbit)])
+                else:
+                    decode.append('    self.{0} = bool((x >> {1}) & 1)'.format(fieldname, spanshift))
+                    encode.append('    v = 1 if self.{0} else 0'.format(fieldname))
+                if name != 'bool':
+                    encode.append('        raise CreationError("{0} is out of range for field \'{1}\' '
+                                  '({2}:{3}).", v)'.format('{0}', fieldname, name, length))
+                encode.append('    x |= (v & {0}) << {1}'.format(mask, shift))
+            else:
+                namespace['_read{0}'.format(i)] = name_to_read[name]
+                namespace['_token{0}'.format(i)] = (name, length)
+                decode.append('    self.{0} = _read{1}(s, {2}, pos + {3})'.format(fieldname, i, length, start))
+                encode.append('    x |= _tokenbits(_token{0}, self.{1}) << {2}'.format(i, fieldname, shift))
+        decode.append('    return self')
+        encode.append('    return Bits(uint=x, length={0})'.format(total) if total else '    return Bits()')
+        namespace['_tokenbits'] = lambda token, value: packtoken(token[0], token[1], value)._readuint(token[1], 0)
+        exec('\n'.join(init + decode + encode), namespace)
+        cls = type(typename, (Record,), {'__slots__': tuple(fields),
+                                         '__init__': namespace['__init__'],
+                                         '_decode': classmethod(namespace['_decode']),
+                                         'tobits': namespace['tobits'],
+                                         'fields': tuple(fields),
+                                         'length': total})
+        try:
+            # Let the class be pickled by giving it the module it was created in.
+            cls.__module__ = sys._getframe(2).f_globals.get('__name__', '__main__')
+        except (AttributeError, ValueError):
+            pass
+        return cls
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__,
+                                 ', '.join('{0}={1!r}'.format(f, getattr(self, f)) for f in self.fields))
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.fields)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    @classmethod
+    def frombits(cls, bs, pos=0):
+        """Create a record from the bits of a bitstring.
+
+        bs -- The bitstring, or anything that can be used to create one.
+        pos -- The bit position of the start of the record.
+
+        Raises ReadError if there aren't enough bits.
+
+        """
+        if not isinstance(bs, Bits):
+            bs = Bits(bs)
+        return cls._decode(bs, pos)
+
+    @classmethod
+    def read(cls, s):
+        """Create a record from the bits at the current position of a ConstBitStream.
+
+        The position is advanced to after the record.
+
+        Raises ReadError if there aren't enough bits.
+
+        """
+        record = cls._decode(s, s._pos)
+        s._pos += cls.length
+        return record
+
+
+class BufferedConstBitStream(object):
+    """Reads bits from a file-like source that can't be mapped or seeked.
+
+    Bytes are pulled from the source as they are needed into a buffer, and
+    are discarded once they have been read past, so the whole source never
+    has to be held in memory.
+
+    Methods:
+
+    bytealign() -- Skip to the next byte boundary.
+    find() -- Skip forward to the next occurrence of a bitstring.
+    peek() -- Interpret the next bits without advancing the position.
+    peeklist() -- Interpret the next bits as a list without advancing the position.
+    read() -- Interpret the next bits and advance the position.
+    readlist() -- Interpret the next bits as a list and advance the position.
+    readto() -- Read up to and including the next occurrence of a bitstring.
+
+    Properties:
+
+    pos -- The number of bits read from the start of the source.
+
+    """
+
+    __slots__ = ('_recv', '_data', '_start', '_pos', '_eof', '_chunksize', '_maxbuffer', '_view')
+
+    def __init__(self, source, chunksize=STREAM_CHUNK_SIZE, maxbuffer=None):
+        """Create a new BufferedConstBitStream.
+
+        source -- Anything with a read() method that returns bytes, such as
+                  a pipe, sys.stdin.buffer, a gzip.GzipFile or an HTTP
+                  response, or a socket.
+        chunksize -- The number of bytes to ask the source for at a time.
+        maxbuffer -- The most bytes to hold in the buffer. Reads that would
+                     need more raise Error. Defaults to no limit.
+
+        """
+        try:
+            self._recv = source.read
+        except AttributeError:
+            self._recv = source.recv
+        self._data = bytearray()
+        # The byte position in the source of the start of the buffer.
+        self._start = 0
+        # The bit position in the source.
+        self._pos = 0
+        self._eof = False
+        self._chunksize = chunksize
+        self._maxbuffer = maxbuffer
+        self._view = None
+
+    def _getview(self):
+        """Return a ConstBitStream of the buffer, positioned at the current bit."""
+        if self._view is None:
+            view = ConstBitStream()
+            view._datastore = BufferByteStore(self._data, len(self._data) * 8, 0)
+            self._view = view
+        self._view._pos = self._pos - self._start * 8
+        return self._view
+
+    def _discard(self, force=False):
+        """Remove bytes that have been read past from the buffer."""
+        consumed = self._pos // 8 - self._start
+        # Only shuffle the buffer down once enough has been used.
+        if consumed and (force or (consumed >= self._chunksize and 2 * consumed >= len(self._data))):
+            del self._data[:consumed]
+            self._start += consumed
+            self._view = None
+
+    def _wanted(self):
+        """Return the number of bytes to ask the source for, checking the buffer limit."""
+        self._discard(force=True)
+        # Asking for as much again as is buffered keeps long reads from retrying too often.
+        nbytes = max(self._chunksize, len(self._data))
+        if self._maxbuffer is not None:
+            nbytes = min(nbytes, self._maxbuffer - len(self._data))
+            if nbytes <= 0:
+                raise Error("Can't buffer more than {0} bytes from the source.".format(self._maxbuffer))
+        return nbytes
+
+    def _received(self, data):
+        """Add bytes from the source to the buffer. Empty data means there's no more."""
+        if data:
+            self._data += data
+            self._view = None
+        else:
+            self._eof = True
+
+    def _run(self, steps):
+        """Run one of the step generators below, fetching from the source when asked.
+
+        The generators yield None when they need more bytes from the source,
+        and then a single item tuple holding the result.
+
+        """
+        for step in steps:
+            if step is not None:
+                return step[0]
+            self._received(self._recv(self._wanted()))
+
+    def _reading(self, op, toend=False, advance=True, enough=None):
+        """Step generator for reading from the buffer.
+
+        op -- A function taking a ConstBitStream of the buffer and returning a value.
+        toend -- If True, the whole source has to be buffered first.
+        advance -- If False, the position is left unchanged.
+        enough -- A number of bits after the position that op never needs more
+                  than, so a ReadError with that many buffered isn't from
+                  running out. If None, every ReadError is taken to be.
+
+        """
+        while toend and not self._eof:
+            yield None
+        while True:
+            view = self._getview()
+            try:
+                value = op(view)
+            except ReadError:
+                if self._eof or (enough is not None and view.len - view._pos >= enough):
+                    raise
+                yield None
+                continue
+            if advance:
+                self._pos = self._start * 8 + view._pos
+                self._discard()
+            yield (value,)
+            return
+
+    def _searching(self, bs, bytealigned, skip):
+        """Step generator for finding bs, with the position as the result.
+
+        skip -- If True, the bits searched are discarded as the search goes.
+
+        """
+        bs = Bits(bs)
+        if not bs.len:
+            raise ValueError("Cannot find an empty bitstring.")
+        if bytealigned is None:
+            bytealigned = settings._bytealigned
+        searchfrom = self._pos
+        while True:
+            view = self._getview()
+            base = self._start * 8
+            p = Bits.find(view, bs, start=searchfrom - base, bytealigned=bytealigned)
+            if p:
+                yield (p[0] + base,)
+                return
+            if self._eof:
+                yield (None,)
+                return
+            # Start the next search where bs could still begin.
+            searchfrom = max(searchfrom, base + view.len - bs.len + 1)
+            if bytealigned:
+                searchfrom += -searchfrom % 8
+            if skip:
+                self._pos = searchfrom
+            yield None
+
+    def _finding(self, bs, bytealigned):
+        """Step generator for find()."""
+        for step in self._searching(bs, bytealigned, True):
+            if step is not None:
+                p = step[0]
+                if p is None:
+                    self._pos = (self._start + len(self._data)) * 8
+                    self._discard()
+                    yield ((),)
+                else:
+                    self._pos = p
+                    self._discard()
+                    yield ((p,),)
+                return
+            yield None
+
+    def _readingto(self, bs, bytealigned):
+        """Step generator for readto()."""
+        bs = Bits(bs)
+        for step in self._searching(bs, bytealigned, False):
+            if step is not None:
+                p = step[0]
+                if p is None:
+                    raise ReadError("Substring not found")
+                length = p + bs.len - self._pos
+                for step in self._reading(lambda view: view.read(length)):
+                    yield step
+                return
+            yield None
+
+    @staticmethod
+    def _isstretchy(fmt, kwargs={}):
+        """Return whether a format has a token without a length, which needs the whole source."""
+        if isinstance(fmt, (numbers.Integral, VLCTable)):
+            return False
+        if isinstance(fmt, basestring):
+            fmt = [fmt]
+        keys = tuple(sorted(kwargs.keys()))
+        return any(tokenparser(f, keys)[0] for f in fmt if isinstance(f, basestring))
+
+    @staticmethod
+    def _enough(fmt):
+        """Return the most bits a VLCTable code can need, or None for other formats."""
+        # A code that isn't in the table is the only ReadError that more bits can't fix.
+        if isinstance(fmt, VLCTable):
+            return fmt._maxlength
+        return None
+
+    def read(self, fmt):
+        """Interpret next bits according to the format string and return result.
+
+        fmt -- Token string describing how to interpret the next bits, an
+               integer number of bits or a VLCTable, as for ConstBitStream.read().
+
+        Raises ReadError if the source ends before the bits are all read.
+        Raises ValueError if the format is not understood.
+
+        """
+        return self._run(self._reading(lambda view: view.read(fmt), self._isstretchy(fmt),
+                                       enough=self._enough(fmt)))
+
+    def readlist(self, fmt, **kwargs):
+        """Interpret next bits according to format string(s) and return list.
+
+        fmt -- A single string or list of strings with comma separated tokens,
+               as for ConstBitStream.readlist().
+        kwargs -- A dictionary or keyword-value pairs - the keywords used in the
+                  format string will be replaced with their given value.
+
+        Raises ReadError if the source ends before the bits are all read.
+        Raises ValueError if the format is not understood.
+
+        """
+        return self._run(self._reading(lambda view: view.readlist(fmt, **kwargs),
+                                       self._isstretchy(fmt, kwargs)))
+
+    def peek(self, fmt):
+        """Interpret next bits according to the format string and return result.
+
+        The position is not changed. See read() for the format.
+
+        """
+        return self._run(self._reading(lambda view: view.read(fmt), self._isstretchy(fmt),
+                                       advance=False, enough=self._enough(fmt)))
+
+    def peeklist(self, fmt, **kwargs):
+        """Interpret next bits according to format string(s) and return list.
+
+        The position is not changed. See readlist() for the format.
+
+        """
+        return self._run(self._reading(lambda view: view.readlist(fmt, **kwargs),
+                                       self._isstretchy(fmt, kwargs), advance=False))
+
+    def bytealign(self):
+        """Skip to the next byte boundary and return the number of bits skipped.
+
+        Raises ReadError if the source ends first.
+
+        """
+        skipped = -self._pos % 8
+
+        def skip(view):
+            view.read(skipped)
+            return skipped
+        return self._run(self._reading(skip))
+
+    def find(self, bs, bytealigned=None):
+        """Skip forward to the next occurrence of bs.
+
+        Returns a single item tuple with the new bit position if found, or an
+        empty tuple if not found.
+
+        bs -- The bitstring to find.
+        bytealigned -- If True the bitstring will only be found on byte boundaries.
+
+        As the bits searched are discarded, if bs isn't found then the
+        position is left at the end of the source.
+
+        Raises ValueError if bs is empty.
+
+        """
+        return self._run(self._finding(bs, bytealigned))
+
+    def readto(self, bs, bytealigned=None):
+        """Read up to and including next occurrence of bs and return result.
+
+        bs -- The bitstring to find.
+        bytealigned -- If True the bitstring will only be found on byte boundaries.
+
+        Everything from the current position to the end of bs has to fit in
+        the buffer.
+
+        Raises ValueError if bs is empty.
+        Raises ReadError if bs is not found.
+
+        """
+        return self._run(self._readingto(bs, bytealigned))
+
+    @property
+    def pos(self):
+        """The number of bits read from the start of the source. Read only."""
+        return self._pos
+
+
 # Aliases for backward compatibility
 ConstBitArray = Bits
 BitString = BitStream
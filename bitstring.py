@@ -73,5 +73,12 @@ except ImportError:
     __pure__ = True
 
 __all__ = ['ConstBitArray', 'ConstBitStream', 'BitStream', 'BitArray',
-           'Bits', 'BitString', 'pack', 'Error', 'ReadError',
-           'InterpretError', 'ByteAlignError', 'CreationError', 'settings']
+           'Bits', 'BitString', 'pack', 'pack_ue', 'Error', 'ReadError',
+           'InterpretError', 'ByteAlignError', 'CreationError', 'settings',
+           'PackedArray', 'VLCTable', 'BitWriter', 'Record',
+           'BufferedConstBitStream']
+
+import sys
+if sys.version_info >= (3, 5):
+    from _asyncbitstring import AsyncConstBitStream
+    __all__.append('AsyncConstBitStream')
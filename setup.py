@@ -36,7 +36,7 @@ setup(name='bitstring',
       license='The MIT License: http://www.opensource.org/licenses/mit-license.php',
       cmdclass = cmdclass,
       ext_modules = ext_modules,
-      py_modules=['bitstring', '_pybitstring'],
+      py_modules=['bitstring', '_pybitstring', '_asyncbitstring'],
       platforms='all',
       classifiers = [
         'Development Status :: 5 - Production/Stable',
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Unit tests for the AsyncConstBitStream class.
+"""
+
+import unittest
+import sys
+
+sys.path.insert(0, '..')
+import bitstring
+from bitstring import ConstBitStream
+
+try:
+    import asyncio
+    from bitstring import AsyncConstBitStream
+except ImportError:
+    AsyncConstBitStream = None
+
+DATA = bytes(bytearray(range(256))) * 40
+
+
+@unittest.skipIf(AsyncConstBitStream is None, "asyncio needs Python 3.5 or later")
+class Reading(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def reader(self, data, pieces=1):
+        """Return a StreamReader that gets data in a number of pieces as the loop runs."""
+        reader = asyncio.StreamReader(loop=self.loop)
+        step = -(-len(data) // pieces)
+        for i, start in enumerate(range(0, len(data), step)):
+            self.loop.call_later(0.001 * i, reader.feed_data, data[start:start + step])
+        self.loop.call_later(0.001 * pieces, reader.feed_eof)
+        return reader
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def testRead(self):
+        s = AsyncConstBitStream(self.reader(DATA, pieces=50), chunksize=16)
+        c = ConstBitStream(bytes=DATA)
+        for fmt in ['uint:3', 'bytes:500', 'int:17', 'ue', 'bits:4000', 'hex:12', 7]:
+            self.assertEqual(self.wait(s.read(fmt)), c.read(fmt))
+            self.assertEqual(s.pos, c.pos)
+
+    def testReadList(self):
+        s = AsyncConstBitStream(self.reader(DATA, pieces=10))
+        self.assertEqual(self.wait(s.readlist('uint:a, 2*bytes:2', a=8)), [0, b'\x01\x02', b'\x03\x04'])
+        self.assertEqual(self.wait(s.peeklist('2*uint:8')), [5, 6])
+        self.assertEqual(self.wait(s.peek('uint:8')), 5)
+        self.assertEqual(s.pos, 40)
+
+    def testReadTo(self):
+        s = AsyncConstBitStream(self.reader(DATA, pieces=20), chunksize=8)
+        self.wait(s.read(4))
+        self.assertEqual(self.wait(s.readto('0xfeff', bytealigned=True)),
+                         ConstBitStream(bytes=DATA[:256])[4:])
+        self.assertEqual(s.pos, 256 * 8)
+        self.assertEqual(self.wait(s.find('0x80', bytealigned=True)), (384 * 8,))
+        self.assertEqual(self.wait(s.bytealign()), 0)
+
+    def testReadPastEnd(self):
+        s = AsyncConstBitStream(self.reader(b'\x12\x34', pieces=2))
+        self.assertRaises(bitstring.ReadError, self.wait, s.read('uint:17'))
+        self.assertEqual(self.wait(s.read('hex:16')), '1234')
+        self.assertRaises(bitstring.ReadError, self.wait, s.readto('0x12'))
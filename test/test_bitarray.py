@@ -299,4 +299,254 @@ class ModifiedByAddingBug(unittest.TestCase):
         c = a + b
         self.assertEqual(c, '0b011')
         self.assertEqual(a, '0b0')
-        self.assertEqual(b, '0b11')
\ No newline at end of file
+        self.assertEqual(b, '0b11')
+
+class BulkSet(unittest.TestCase):
+
+    def testSetRange(self):
+        s = BitArray(30)
+        s.set(1, range(3, 21))
+        self.assertEqual(s.bin, '0' * 3 + '1' * 18 + '0' * 9)
+        s.set(0, range(4, 20))
+        self.assertEqual(s.bin, '0001' + '0' * 16 + '1' + '0' * 9)
+
+    def testSetRangeWithOffset(self):
+        s = BitArray(bytes=b'\x00\x00\x00\x00', offset=3)
+        s.set(True, range(2, 27))
+        self.assertEqual(s.bin, '00' + '1' * 25 + '00')
+        s.set(False, range(5, 6))
+        self.assertEqual(s.bin, '00111' + '0' + '1' * 21 + '00')
+
+    def testSetSteppedAndNegativeRange(self):
+        s = BitArray(16)
+        s.set(1, range(0, 16, 3))
+        self.assertEqual(s.bin, '1001001001001001')
+        s = BitArray(16)
+        s.set(1, range(-4, 0))
+        self.assertEqual(s.bin, '0000000000001111')
+        s = BitArray(16)
+        s.set(1, range(-2, 2))
+        self.assertEqual(s.bin, '1100000000000011')
+        s.set(1, range(5, 3, -1))
+        self.assertEqual(s.bin, '1100110000000011')
+
+    def testSetSlice(self):
+        s = BitArray(20)
+        s.set(1, slice(4, 12))
+        self.assertEqual(s.bin, '0000' + '1' * 8 + '0' * 8)
+        s.set(1, slice(None, None, 5))
+        self.assertEqual(s.bin, '10001111111100010000')
+        s.set(0, slice(-3, None))
+        self.assertEqual(s.bin, '10001111111100010000')
+        s.set(1, slice(10, 5))
+        self.assertEqual(s.bin, '10001111111100010000')
+
+    def testSetArray(self):
+        import array
+        s = BitArray(64)
+        s.set(1, array.array('H', [0, 9, 63]))
+        self.assertEqual(list(s.findall('0b1')), [0, 9, 63])
+        positions = array.array('b', [-1, 9])
+        if sys.version_info >= (3,):
+            # Python 2 can't make a memoryview of an array.
+            positions = memoryview(positions)
+        s.set(0, positions)
+        self.assertEqual(list(s.findall('0b1')), [0])
+
+    def testSetGenerator(self):
+        s = BitArray(10)
+        s.set(1, (x * 2 for x in range(5)))
+        self.assertEqual(s.bin, '1010101010')
+
+    def testSetAll(self):
+        s = BitArray(bytes=b'\x00\x00', offset=1, length=13)
+        s.set(1)
+        self.assertTrue(s.all(1))
+        s.set(0)
+        self.assertFalse(s.any(1))
+
+    def testSetErrors(self):
+        s = BitArray(10)
+        self.assertRaises(IndexError, s.set, 1, range(5, 11))
+        self.assertRaises(IndexError, s.set, 1, [0, -11])
+        self.assertRaises(IndexError, s.set, 1, (x for x in [10]))
+        self.assertRaises(IndexError, s.set, 1, 10)
+        self.assertRaises(TypeError, s.set, 1, 2.0)
+
+    def testSetSingleBit(self):
+        s = BitArray(bytes=b'\x00\x00', offset=3, length=12)
+        s.set(1, 0)
+        s.set(True, -1)
+        self.assertEqual(s.bin, '100000000001')
+        s.set(0, -12)
+        s.invert(5)
+        s.invert(-1)
+        self.assertEqual(s.bin, '000001000000')
+        self.assertRaises(IndexError, s.set, 0, -13)
+        self.assertRaises(IndexError, s.invert, 12)
+
+
+class BulkInvert(unittest.TestCase):
+
+    def testInvertRange(self):
+        s = BitArray('0b0011001100110011')
+        s.invert(range(2, 14))
+        self.assertEqual(s.bin, '0000110011001111')
+        s.invert(range(0, 16, 2))
+        self.assertEqual(s.bin, '1010011001100101')
+
+    def testInvertSlice(self):
+        s = BitArray(bytes=b'\xf0\x0f\xf0', offset=4, length=16)
+        s.invert(slice(1, 15))
+        self.assertEqual(s.bin, '0111111100000001')
+        s.invert(slice(None, None, -4))
+        self.assertEqual(s.bin, '0110111000010000')
+
+    def testInvertArray(self):
+        import array
+        s = BitArray(12)
+        s.invert(array.array('i', [1, 2, -1]))
+        self.assertEqual(s.bin, '011000000001')
+
+    def testInvertAll(self):
+        s = BitArray(bytes=b'\x0f\xf0', offset=3, length=10)
+        s.invert()
+        self.assertEqual(s.bin, '1000000001')
+
+
+class Sparse(unittest.TestCase):
+    def testCreation(self):
+        s = BitArray(1000, sparse=True)
+        self.assertEqual(type(s._datastore), bitstring.SparseByteStore)
+        self.assertEqual(s, BitArray(1000))
+        s = BitArray(length=12, sparse=True)
+        self.assertEqual(s.bin, '000000000000')
+        self.assertFalse(BitArray(sparse=True))
+
+    def testCreationErrors(self):
+        self.assertRaises(bitstring.CreationError, BitArray, hex='0xf', sparse=True)
+        self.assertRaises(bitstring.CreationError, BitArray, 10, offset=2, sparse=True)
+        self.assertRaises(bitstring.CreationError, BitArray, -1, sparse=True)
+
+    def testSetAndCount(self):
+        s = BitArray(2 ** 32, sparse=True)
+        s.set(1, [5, 10 ** 9, 2 ** 32 - 1])
+        self.assertEqual(s.count(1), 3)
+        self.assertEqual(s.count(0), 2 ** 32 - 3)
+        self.assertTrue(s.any(1))
+        self.assertFalse(s.all(1))
+        self.assertTrue(s.any(0))
+        self.assertEqual(s.find('0b1', start=6), (10 ** 9,))
+        self.assertEqual(list(s.iter_set()), [5, 10 ** 9, 2 ** 32 - 1])
+        s.set(0, 5)
+        s.invert(6)
+        self.assertEqual(list(s.iter_set(True, 0, 100)), [6])
+        s.set(0)
+        self.assertFalse(s.any(1))
+        self.assertEqual(type(s._datastore), bitstring.SparseByteStore)
+
+    def testLogicalOperators(self):
+        a = BitArray(2 ** 30, sparse=True)
+        b = BitArray(2 ** 30, sparse=True)
+        a.set(1, [1, 100, 2 ** 29])
+        b.set(1, [100, 2 ** 29 + 1])
+        self.assertEqual(list((a & b).iter_set()), [100])
+        self.assertEqual(list((a | b).iter_set()), [1, 100, 2 ** 29, 2 ** 29 + 1])
+        self.assertEqual(list((a ^ b).iter_set()), [1, 2 ** 29, 2 ** 29 + 1])
+        self.assertEqual(type((a | b)._datastore), bitstring.SparseByteStore)
+        a &= b
+        self.assertEqual(list(a.iter_set()), [100])
+
+    def testLogicalOperatorsIgnorePadding(self):
+        b = BitArray(7996, sparse=True)
+        b.set(1, 7992)
+        # Bits after the end of b in its last byte.
+        b._datastore.rawbytes[999] |= 0x0f
+        for a in (BitArray(7996), BitArray(7996, sparse=True)):
+            a |= b
+            a ^= b
+            a.set(1, 7993)
+            a |= b
+            self.assertEqual(list(a.iter_set()), [7992, 7993])
+            self.assertEqual(a._datastore.rawbytes[999], 0xc0)
+
+    def testLogicalWithDense(self):
+        a = BitArray(80, sparse=True)
+        a.set(1, [3, 70])
+        b = BitArray('0xf000000000000000000f')
+        self.assertEqual(a & b, BitArray(80, sparse=False) | '0b0001' + BitArray(76))
+        self.assertEqual((a | b).bin, (BitArray(a) | b).bin)
+        self.assertEqual((b ^ a).bin, (b ^ BitArray(a)).bin)
+
+    def testBecomesDense(self):
+        s = BitArray(80000, sparse=True)
+        s.set(1, range(0, 800, 8))
+        self.assertEqual(type(s._datastore), bitstring.SparseByteStore)
+        s.set(1, range(800, 3200, 8))
+        self.assertEqual(type(s._datastore), bitstring.ByteStore)
+        self.assertEqual(s.count(1), 400)
+        t = BitArray(8000, sparse=True)
+        t.invert()
+        self.assertEqual(type(t._datastore), bitstring.ByteStore)
+        self.assertTrue(t.all(1))
+
+    def testJoining(self):
+        s = BitArray(37, sparse=True)
+        s.set(1, 5)
+        s.append('0b101')
+        s.prepend('0xf')
+        self.assertEqual(s, '0xf, 0b000001, 31*0b0, 0b101')
+        self.assertEqual(s[4:12].bin, '00000100')
+
+    def testReverse(self):
+        s = BitArray(4096, sparse=True)
+        s.set(1, [0, 10, 4000])
+        s.reverse()
+        self.assertEqual(list(s.iter_set()), [95, 4085, 4095])
+        t = BitArray(13, sparse=True)
+        t.set(1, 1)
+        t.reverse()
+        self.assertEqual(t.bin, '0000000000010')
+
+    def testIteratingBytes(self):
+        s = BitArray(24, sparse=True)
+        s.set(1, 15)
+        self.assertEqual(list(s._datastore.rawbytes), [0, 1, 0])
+        self.assertRaises(IndexError, s._datastore.rawbytes.__getitem__, 3)
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "NumPy is not available")
+class FromNumpy(unittest.TestCase):
+    def testWholeBytes(self):
+        s = BitArray.from_numpy(numpy.array([1, -256], dtype=numpy.int16))
+        self.assertEqual(type(s), BitArray)
+        self.assertEqual(s, '0x0001ff00')
+
+    def testOddWidths(self):
+        self.assertEqual(BitArray.from_numpy(numpy.array([1, 2, 4095], dtype=numpy.uint16), 12),
+                         '0x001002fff')
+        self.assertEqual(BitArray.from_numpy(numpy.array([1, 2, -1]), 12), '0x001002fff')
+        s = BitArray.from_numpy(numpy.arange(20, dtype=numpy.uint8), 5)
+        self.assertEqual(list(s.unpack_array('uint:5')), list(range(20)))
+
+    def testRoundTrip(self):
+        a = numpy.arange(-1000, 1000, 3, dtype=numpy.int32)
+        self.assertEqual(list(BitArray.from_numpy(a, 11).to_numpy('int32', 11)), list(a))
+
+    def testBoolAndFloat(self):
+        self.assertEqual(BitArray.from_numpy(numpy.array([True, False, True])), '0b101')
+        self.assertEqual(BitArray.from_numpy(numpy.array([[0.5], [2.0]])),
+                         'float:64=0.5, float:64=2.0')
+
+    def testErrors(self):
+        self.assertRaises(bitstring.CreationError, BitArray.from_numpy, numpy.array([8]), 3)
+        self.assertRaises(bitstring.CreationError, BitArray.from_numpy, numpy.array([-5]), 3)
+        self.assertRaises(bitstring.CreationError, BitArray.from_numpy,
+                          numpy.array([1.0], dtype=numpy.float32), 16)
+        self.assertRaises(bitstring.CreationError, BitArray.from_numpy, numpy.array(['a']))
@@ -2,6 +2,8 @@
 
 import unittest
 import sys
+import array
+import os
 
 sys.path.insert(0, '..')
 import bitstring
@@ -282,6 +284,51 @@ class Mmap(unittest.TestCase):
         self.assertEqual(a[0], 0x67)
         self.assertEqual(a[:], bytearray([0x67, 0x89, 0xab]))
 
+    def testSlicesAreViews(self):
+        a = MmapByteArray(self.f, 3, 3)
+        if a.view is None:
+            return
+        v = a[1:3]
+        self.assertTrue(isinstance(v, memoryview))
+        self.assertTrue(v.readonly)
+        self.assertEqual(v.tobytes(), b'\x89\xab')
+
+    def testFind(self):
+        a = MmapByteArray(self.f, None, 2)
+        self.assertEqual(a.find(b'\x89\xab', 0, 6), 2)
+        self.assertEqual(a.find(b'\x89\xab', 3, 6), -1)
+        self.assertEqual(a.find(b'\x01', 0, 6), -1)
+
+    def testOnlyRangeMapped(self):
+        a = MmapByteArray(self.f, 3, 3)
+        self.assertEqual(len(a.filemap), 6)
+        a = MmapByteArray(self.f, 0, 0)
+        self.assertEqual(len(a.filemap), 0)
+        self.assertEqual(a[:], b'')
+
+    def testLargeOffset(self):
+        granularity = bitstring.bs.mmap.ALLOCATIONGRANULARITY
+        with open('temp_bitstring_unit_testing_file', 'wb') as f:
+            f.seek(3 * granularity + 10)
+            f.write(b'\x12\x34\x56')
+        s = Bits(filename='temp_bitstring_unit_testing_file', offset=8 * (3 * granularity + 10), length=20)
+        self.assertEqual(s, '0x12345')
+        self.assertEqual(len(s._datastore._rawarray.filemap), 13)
+        self.assertRaises(bitstring.CreationError, Bits, filename='temp_bitstring_unit_testing_file',
+                          offset=8 * (3 * granularity + 10), length=25)
+        del s
+        os.remove('temp_bitstring_unit_testing_file')
+
+    def testFileBasedBits(self):
+        s = Bits(self.f)
+        self.assertEqual(s.find('0xabcd', bytealigned=True), (40,))
+        self.assertEqual(s[8:24].tobytes(), b'\x23\x45')
+        self.assertEqual(s.tomemoryview().tobytes(), b'\x01\x23\x45\x67\x89\xab\xcd\xef')
+        a = BitArray(s)
+        a[0:8] = '0xff'
+        self.assertEqual(a[:16], '0xff23')
+        self.assertEqual(s[:16], '0x0123')
+
 
 class Comparisons(unittest.TestCase):
     def testUnorderable(self):
@@ -389,6 +436,255 @@ class ModifiedByAddingBug(unittest.TestCase):
         self.assertEqual(c, 201)
 
 
+class IterSet(unittest.TestCase):
+
+    def testIterSet(self):
+        s = Bits('0b0010010000000001')
+        self.assertEqual(list(s.iter_set()), [2, 5, 15])
+        self.assertEqual(list(s.iter_set(True, 3, 15)), [5])
+        self.assertEqual(list(s.iter_set(False, 0, 6)), [0, 1, 3, 4])
+
+    def testIterSetWithOffset(self):
+        s = Bits(bytes=b'\xff\x00\x00\x81', offset=5, length=26)
+        self.assertEqual(list(s.iter_set()), [0, 1, 2, 19])
+        self.assertEqual(list(s.iter_set(0, 1, 5)), [3, 4])
+
+    def testIterSetSkipsEmptyBytes(self):
+        s = BitArray(200000)
+        s.set(1, [0, 7, 8, 99999, 199999])
+        self.assertEqual(list(s.iter_set()), [0, 7, 8, 99999, 199999])
+        self.assertEqual(list(s.iter_set(1, 8, 199999)), [8, 99999])
+        self.assertEqual(list(s.iter_set(0, 6, 10)), [6, 9])
+
+    def testIterSetEmpty(self):
+        self.assertEqual(list(Bits().iter_set()), [])
+        self.assertEqual(list(Bits('0xff').iter_set(False)), [])
+        self.assertEqual(list(Bits('0xff').iter_set(True, 4, 4)), [])
+
+    def testIterSetErrors(self):
+        s = Bits(10)
+        self.assertRaises(ValueError, list, s.iter_set(True, 0, 11))
+        self.assertRaises(ValueError, list, s.iter_set(True, 5, 4))
+
+
+class Iteration(unittest.TestCase):
+
+    def testIterBools(self):
+        s = Bits('0b1101')
+        self.assertEqual(list(s), [True, True, False, True])
+
+    def testIterWithOffset(self):
+        s = Bits(bytes=b'\x0f\xf0', offset=3, length=7)
+        self.assertEqual(list(s), [False, True, True, True, True, True, True])
+        self.assertEqual(list(Bits()), [])
+
+    def testIterMatchesGetItem(self):
+        s = Bits('0x1234567890abcdef, 0b101')[5:]
+        self.assertEqual(list(s), [s[i] for i in range(s.len)])
+
+
+class RankSelect(unittest.TestCase):
+
+    def testRank(self):
+        s = Bits('0b1011001')
+        self.assertEqual([s.rank(i) for i in range(8)], [0, 1, 1, 2, 3, 3, 3, 4])
+        self.assertEqual(s.rank(-1), 3)
+        self.assertRaises(IndexError, s.rank, 8)
+        self.assertRaises(IndexError, s.rank, -8)
+
+    def testSelect(self):
+        s = Bits('0b1011001')
+        self.assertEqual([s.select(i) for i in range(4)], [0, 2, 3, 6])
+        self.assertEqual(s.select(-1), 6)
+        self.assertRaises(IndexError, s.select, 4)
+        self.assertRaises(IndexError, Bits(100).select, 0)
+
+    def testAcrossBlocks(self):
+        s = Bits(bytes=b'\x5a\xc3\x01' * 100, offset=5, length=2000)
+        b = s.bin
+        ones = [i for i, c in enumerate(b) if c == '1']
+        for p in (0, 1, 511, 512, 513, 1023, 1024, 1999, 2000):
+            self.assertEqual(s.rank(p), b[:p].count('1'))
+        for n in (0, 1, len(ones) // 2, len(ones) - 1):
+            self.assertEqual(s.select(n), ones[n])
+            self.assertEqual(s.rank(s.select(n)), n)
+
+    def testIndexIsKept(self):
+        s = Bits('0xf0') * 200
+        self.assertEqual(s.rank(1600), 800)
+        index = s._rankindex
+        self.assertEqual(s.select(799), 1595)
+        self.assertTrue(s._rankindex is index)
+
+    def testMutableIsNotCached(self):
+        s = BitArray(1000)
+        self.assertEqual(s.rank(1000), 0)
+        s.set(1, [10, 600])
+        self.assertEqual(s.rank(1000), 2)
+        self.assertEqual(s.select(1), 600)
+        self.assertEqual(s.select(-2), 10)
+        self.assertRaises(IndexError, s.select, 2)
+
+    def testMutableAcrossChunks(self):
+        s = BitArray(bytes=b'\x5a\xc3\x01' * 50000, offset=3, length=1100000)
+        t = Bits(s)
+        for p in (0, 7, 524288, 524289, 1100000):
+            self.assertEqual(s.rank(p), t.rank(p))
+        for n in (0, 1, 200000, t.count(1) - 1):
+            self.assertEqual(s.select(n), t.select(n))
+
+
+class UnpackArray(unittest.TestCase):
+    def testUnpack(self):
+        s = Bits('0x001002003')
+        self.assertEqual(list(s.unpack_array('uint:12')), [1, 2, 3])
+        self.assertEqual(list(s.unpack_array('uint:12', 2)), [1, 2])
+        self.assertEqual(list(s.unpack_array('int:4')), [0, 0, 1, 0, 0, 2, 0, 0, 3])
+        self.assertEqual(s.unpack_array('uint:12').typecode, 'H')
+
+    def testUnpackSigned(self):
+        s = Bits(', '.join('int:9={0}'.format(i) for i in range(-256, 256, 7)))
+        self.assertEqual(list(s.unpack_array('int:9')), list(range(-256, 256, 7)))
+        self.assertEqual(s.unpack_array('int:9').typecode, 'h')
+
+    def testUnpackOffset(self):
+        s = Bits('0xf001002003f')[4:-4]
+        self.assertEqual(list(s.unpack_array('uint:12')), [1, 2, 3])
+        self.assertEqual(list(s.unpack_array('uint:8')), [0, 16, 2, 0])
+
+    def testUnpackTooMany(self):
+        self.assertRaises(bitstring.ReadError, Bits('0x001002').unpack_array, 'uint:12', 3)
+
+    def testUnpackExpGolomb(self):
+        s = Bits('ue=3, ue=0, ue=12')
+        self.assertEqual(s.unpack_array('ue'), [3, 0, 12])
+        self.assertEqual(s.unpack_array('ue', 2), [3, 0])
+        self.assertEqual(s.unpack_array('se'), [2, 0, -6])
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "NumPy is not available")
+class ToNumpy(unittest.TestCase):
+    def testWholeBytes(self):
+        a = Bits('0x0001ff00').to_numpy('uint16')
+        self.assertEqual(a.dtype, numpy.uint16)
+        self.assertEqual(list(a), [1, 0xff00])
+        self.assertEqual(list(Bits('0x0001ff00').to_numpy('int16')), [1, -256])
+
+    def testOddWidths(self):
+        s = Bits('0x001002fff')
+        self.assertEqual(list(s.to_numpy('uint16', 12)), [1, 2, 4095])
+        self.assertEqual(list(s.to_numpy('int16', 12)), [1, 2, -1])
+        self.assertEqual(list(s.to_numpy('uint8', 5)), [0, 0, 8, 0, 5, 31, 31])
+
+    def testOffset(self):
+        s = Bits('0b1, 0x001002fff')[1:]
+        self.assertEqual(list(s.to_numpy('uint16', 12)), [1, 2, 4095])
+        self.assertEqual(list(s.to_numpy('uint16')), [0x0010, 0x02ff])
+
+    def testBool(self):
+        self.assertEqual(list(Bits('0b1011').to_numpy('bool')), [True, False, True, True])
+        self.assertEqual(list(Bits('0b001100').to_numpy('bool', 2)), [False, True, False])
+
+    def testFloat(self):
+        s = Bits('float:32=0.5, float:32=-3.0')
+        self.assertEqual(list(s.to_numpy('float32')), [0.5, -3.0])
+        self.assertEqual(list(s.to_numpy('float64')), [s.float])
+
+    def testEmpty(self):
+        self.assertEqual(len(Bits().to_numpy('uint16', 12)), 0)
+        self.assertEqual(len(Bits('0xf').to_numpy('uint16', 12)), 0)
+
+    def testBadWidth(self):
+        s = Bits('0xff')
+        self.assertRaises(ValueError, s.to_numpy, 'uint8', 9)
+        self.assertRaises(ValueError, s.to_numpy, 'uint8', 0)
+        self.assertRaises(ValueError, s.to_numpy, 'float32', 16)
+
+
+class UnpackMany(unittest.TestCase):
+
+    def testFields(self):
+        s = Bits('0x1a2b3c')
+        self.assertEqual(s.unpack_many('hex:4, uint:4'), [['1', '2', '3'], array.array('B', [10, 11, 12])])
+        self.assertEqual(s.unpack_many('hex:4, uint:4', astuples=True), [('1', 10), ('2', 11), ('3', 12)])
+        self.assertEqual(s.unpack_many('hex:4, uint:4', count=2), [['1', '2'], array.array('B', [10, 11])])
+
+    def testMatchesUnpack(self):
+        fmt = 'uint:12, int:4, pad:3, uintle:16, floatle:32, bool, bytes:1, int:4'
+        s = Bits().join(bitstring.pack(fmt, i, -i % 8 - 8, 200 * i, i / 4.0, i % 3 == 0, b'x', -1)
+                        for i in range(300))
+        records = s.unpack_many(fmt, astuples=True)
+        self.assertEqual(records, [tuple(r.unpack(fmt)) for r in s.cut(s.len // 300)])
+        columns = s.unpack_many(fmt)
+        self.assertEqual(len(columns), 7)
+        self.assertEqual(columns[0], array.array('H', range(300)))
+        self.assertEqual(columns[3][:3], array.array('f', [0.0, 0.25, 0.5]))
+
+    def testStride(self):
+        s = Bits('uint:8=1, uintle:16=2, pad:40, uint:8=3, uintle:16=4, pad:40, uint:8=5, uintle:16=6')
+        self.assertEqual(s.unpack_many('uint:8, uintle:16', stride=64, astuples=True),
+                         [(1, 2), (3, 4), (5, 6)])
+        self.assertEqual(s[1:].unpack_many('bin:7, bits:16', stride=64),
+                         [['0000001', '0000011', '0000101'],
+                          [Bits('0x0200'), Bits('0x0400'), Bits('0x0600')]])
+        self.assertEqual(s.unpack_many('pad:8, intle:16', stride=64, count=2), [array.array('h', [2, 4])])
+        t = Bits().join(Bits(uint=i, length=9) + Bits(5) for i in range(100))
+        self.assertEqual(list(t.unpack_many('uint:9', stride=14)[0]), list(range(100)))
+        self.assertEqual(list(t[:-5].unpack_many('uint:9', stride=14)[0]), list(range(100)))
+
+    def testEmpty(self):
+        self.assertEqual(Bits().unpack_many('uint:8'), [array.array('B')])
+        self.assertEqual(Bits('0xf').unpack_many('uint:8, bool', astuples=True), [])
+        self.assertEqual(Bits('0xff').unpack_many('pad:4', astuples=True), [(), ()])
+
+    def testErrors(self):
+        s = Bits('0x123456')
+        self.assertRaises(ValueError, s.unpack_many, 'uint:8, ue')
+        self.assertRaises(ValueError, s.unpack_many, 'uint:8, bits')
+        self.assertRaises(ValueError, s.unpack_many, 'uint:8=3')
+        self.assertRaises(ValueError, s.unpack_many, 'uint:8, uint:8', stride=12)
+        self.assertRaises(ValueError, s.unpack_many, 'uint:8', count=-1)
+        self.assertRaises(bitstring.ReadError, s.unpack_many, 'uint:8', count=4)
+        self.assertRaises(bitstring.ReadError, s.unpack_many, 'uint:8', count=2, stride=17)
+
+
+class ToMemoryView(unittest.TestCase):
+
+    def testAligned(self):
+        s = Bits('0x0123456789')[8:32]
+        v = s.tomemoryview()
+        self.assertEqual(v.tobytes(), b'\x23\x45\x67')
+        self.assertEqual(len(v), 3)
+        if sys.version_info >= (3, 8):
+            self.assertTrue(v.readonly)
+        # The view is of the original data, not a copy.
+        s._datastore._rawarray[s._datastore.byteoffset] = 0xff
+        self.assertEqual(v.tobytes(), b'\xff\x45\x67')
+
+    def testUnaligned(self):
+        self.assertEqual(Bits('0x1234')[4:12].tomemoryview().tobytes(), b'\x23')
+        self.assertEqual(Bits('0b1011').tomemoryview().tobytes(), b'\xb0')
+        self.assertEqual(Bits().tomemoryview().tobytes(), b'')
+
+    def testBitArrayIsCopied(self):
+        a = BitArray('0x0102')
+        v = a.tomemoryview()
+        a.append('0x03')
+        a[0:8] = '0xff'
+        self.assertEqual(v.tobytes(), b'\x01\x02')
+
+    def testToBytesAligned(self):
+        s = Bits('0x0123456789')
+        self.assertEqual(s[16:].tobytes(), b'\x45\x67\x89')
+        self.assertEqual(s[16:36].tobytes(), b'\x45\x67\x80')
+
+
 # class FindPaddingBits(unittest.TestCase):
 #
 #     def testFindJustPadding(self):
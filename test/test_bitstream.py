@@ -6,7 +6,9 @@ sys.path.insert(0, '..')
 import bitstring
 import copy
 import os
+import io
 import collections
+import struct
 from bitstring import BitStream, ConstBitStream, pack
 from bitstring import ByteStore, offsetcopy
 
@@ -583,6 +585,10 @@ class Pack(unittest.TestCase):
     def testPackDefualtUintErrors(self):
         self.assertRaises(bitstring.CreationError, BitStream, '5=-1')
 
+    def testPackTruncatesNonIntegralValues(self):
+        s = pack('uint:8, int:8, ue, se, uintle:16', 2.5, -2.5, 2.5, 1.5, 2.7)
+        self.assertEqual(s, 'uint:8=2, int:8=-2, ue=2, se=1, uintle:16=2')
+
     def testPackingLongKeywordBitstring(self):
         s = pack('bits=b', b=BitStream(128000))
         self.assertEqual(s, BitStream(128000))
@@ -2295,6 +2301,26 @@ class Split(unittest.TestCase):
         self.assertEqual(b, '0x222222')
         os.remove('temp_bitstring_unit_testing_file')
 
+    def testToFileUnaligned(self):
+        a = BitStream(bytes=bytes(bytearray(range(256))) * 5000)
+        for start, end in ((3, 8 * 1200000 - 5), (9, None), (1, 8 * 1000 + 1)):
+            f = io.BytesIO()
+            a[start:end].tofile(f)
+            self.assertEqual(f.getvalue(), a[start:end].tobytes())
+
+    def testToFileFromFile(self):
+        with open('test.m1v', 'rb') as source:
+            a = ConstBitStream(source)
+            for start, end in ((8 * 1000, -8 * 5), (8 * 1000 + 3, -8 * 5 - 1), (0, None)):
+                with open('temp_bitstring_unit_testing_file', 'wb') as f:
+                    f.write(b'abc')
+                    a[start:end].tofile(f)
+                    f.write(b'def')
+                with open('temp_bitstring_unit_testing_file', 'rb') as f:
+                    self.assertEqual(f.read(), b'abc' + a[start:end].tobytes() + b'def')
+            self.assertEqual(bitstring.bs.copyfilerange(source, io.BytesIO(), 0, 10), 0)
+        os.remove('temp_bitstring_unit_testing_file')
+
     #def testToFileWithLargerFile(self):
     #    a = BitStream(length=16000000)
     #    a[1] = '0b1'
@@ -3937,4 +3963,110 @@ class BytesProblems(unittest.TestCase):
 
     def testBinProperty(self):
         b = BitStream(bytes=b'\x00\xaa', offset=8, length=4)
-        self.assertEqual(b.bin, '1010')
\ No newline at end of file
+        self.assertEqual(b.bin, '1010')
+
+
+class PackUe(unittest.TestCase):
+
+    def testCreation(self):
+        self.assertEqual(BitStream(ue=0).bin, '1')
+        self.assertEqual(BitStream(ue=3).bin, '00100')
+        self.assertEqual(BitStream(se=-2).bin, '00101')
+        self.assertEqual(BitStream(se=3).bin, '00110')
+        for i in range(-300, 300):
+            self.assertEqual(BitStream(se=i).se, i)
+            self.assertEqual(BitStream(ue=abs(i)).ue, abs(i))
+        self.assertEqual(BitStream(ue=2**70).ue, 2**70)
+
+    def testPackUe(self):
+        s = bitstring.pack_ue([0, 1, 2, 3])
+        self.assertTrue(isinstance(s, BitStream))
+        self.assertEqual(s.bin, '101001100100')
+        self.assertEqual(s.pos, 0)
+        self.assertEqual(bitstring.pack_ue([]), BitStream())
+
+    def testPackUeMatchesPack(self):
+        values = list(range(3000)) + [2**40, 7, 2**64 + 3] + list(range(0, 10**6, 997))
+        s = bitstring.pack_ue(values)
+        self.assertEqual(s, pack(','.join(['ue'] * len(values)), *values))
+        self.assertEqual(s.readlist('{0}*ue'.format(len(values))), values)
+        self.assertEqual(s.pos, s.len)
+
+    def testPackUeErrors(self):
+        self.assertRaises(bitstring.CreationError, bitstring.pack_ue, [3, -1])
+
+
+class PackIntoBuffer(unittest.TestCase):
+
+    def testLiteralsAreIndependent(self):
+        a = pack('uint:8=5, float:32=0.4')
+        b = pack('uint:8=5, float:32=0.4')
+        self.assertEqual(a, b)
+        a.overwrite('0x00', 0)
+        self.assertEqual(b[:8].uint, 5)
+        a.append('0b1')
+        self.assertEqual(b.len, 40)
+
+    def testMixedTokens(self):
+        fmt = 'uint:3, int:13, 0xf, ue, se, bool, bits, bytes:2, floatle:32, pad:5, intle:16, uint:70'
+        s = pack(fmt, 5, -1000, 17, -4, True, '0b1011', b'ab', 1.5, -2, 2**69 + 3)
+        self.assertEqual(s.pos, 0)
+        t = BitStream()
+        for piece in ['uint:3=5', 'int:13=-1000', '0xf', 'ue=17', 'se=-4', '0b1', '0b1011',
+                      '0x6162', 'floatle:32=1.5', '0b00000', 'intle:16=-2', 'uint:70=590295810358705651715']:
+            t.append(piece)
+        self.assertEqual(s, t)
+        self.assertEqual(s.unpack('uint:3, int:13, hex:4, ue'), [5, -1000, 'f', 17])
+
+    def testMutableBitsValue(self):
+        b = bitstring.BitArray('0xab')
+        s = pack('bits, bits', b, b)
+        b.append('0x1')
+        self.assertEqual(s, '0xabab')
+
+    def testRangeErrors(self):
+        self.assertRaises(bitstring.CreationError, pack, 'uint:4', 16)
+        self.assertRaises(bitstring.CreationError, pack, 'int:4', 8)
+        self.assertRaises(bitstring.CreationError, pack, 'int:4', -9)
+        self.assertRaises(bitstring.CreationError, pack, 'ue', -1)
+
+
+class StructRuns(unittest.TestCase):
+
+    def testReadAlignedAndUnaligned(self):
+        data = pack('<4h, >2LdB, bytes:3, pad:8, uintle:16', -1, 2, -3, 4, 5, 6, 0.25, 7, b'abc', 513)
+        fmt = '<4h, >2LdB, bytes:3, pad:8, uintle:16'
+        expected = [-1, 2, -3, 4, 5, 6, 0.25, 7, b'abc', 513]
+        self.assertEqual(data.unpack(fmt), expected)
+        for offset in range(1, 8):
+            s = BitStream(bitstring.Bits(offset) + data)
+            s.pos = offset
+            self.assertEqual(s.readlist(fmt), expected)
+            self.assertEqual(s.pos, s.len)
+            s = BitStream(bytes=(bitstring.Bits(offset) + data).tobytes(), offset=offset)
+            self.assertEqual(s.readlist(fmt), expected)
+
+    def testRunsBrokenByOtherTokens(self):
+        s = BitStream('uint:8=1, uintle:16=2, uint:4=3, uint:4=4, intbe:16=-5, ue=6, floatle:32=0.5')
+        self.assertEqual(s.readlist('uint:8, uintle:16, uint:4, uint:4, intbe:16, ue, floatle:32'),
+                         [1, 2, 3, 4, -5, 6, 0.5])
+        self.assertEqual(s.unpack('uint:8, bits:16, uint:8, hex:16, bits'),
+                         [1, bitstring.Bits('0x0200'), 0x34, 'fffb', bitstring.Bits('ue=6, floatle:32=0.5')])
+
+    def testReadPastEnd(self):
+        s = ConstBitStream('0x0102')
+        self.assertRaises(bitstring.ReadError, s.readlist, '<hh')
+        self.assertEqual(s.pos, 0)
+
+    def testPackRuns(self):
+        s = pack('<4h, >2LdB, bytes:3, pad:8', -1, 2, -3, 4, 5, 6, 0.25, 7, b'abc')
+        self.assertEqual(s.bytes, struct.pack('<4h', -1, 2, -3, 4) + struct.pack('>2LdB', 5, 6, 0.25, 7) +
+                         b'abc\x00')
+        s = pack('uint:3, <2h, uint:5, floatle:32', 5, 1, -1, 3, 1.5)
+        self.assertEqual(s, '0b101, 0x0100ffff, 0b00011, floatle:32=1.5')
+
+    def testPackRunErrors(self):
+        self.assertRaises(bitstring.CreationError, pack, '<2h', 1, 40000)
+        self.assertRaises(bitstring.CreationError, pack, 'uintle:16, uintle:16', 1, -1)
+        self.assertRaises(bitstring.CreationError, pack, 'bytes:2, uint:8', b'abc', 1)
+        self.assertEqual(pack('uint:8, uintle:16=a', 1, a='7'), '0x01, 0x0700')
@@ -16,8 +16,12 @@ class ModuleData(unittest.TestCase):
 
     def testAll(self):
         exported = ['ConstBitArray', 'ConstBitStream', 'BitStream', 'BitArray',
-                    'Bits', 'BitString', 'pack', 'Error', 'ReadError',
-                    'InterpretError', 'ByteAlignError', 'CreationError', 'settings']
+                    'Bits', 'BitString', 'pack', 'pack_ue', 'Error', 'ReadError',
+                    'InterpretError', 'ByteAlignError', 'CreationError', 'settings',
+                    'PackedArray', 'VLCTable', 'BitWriter', 'Record',
+                    'BufferedConstBitStream']
+        if sys.version_info >= (3, 5):
+            exported.append('AsyncConstBitStream')
         self.assertEqual(set(bitstring.__all__), set(exported))
 
     def testReverseDict(self):
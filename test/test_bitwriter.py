@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Unit tests for the BitWriter class.
+"""
+
+import unittest
+import sys
+import io
+
+sys.path.insert(0, '..')
+import bitstring
+from bitstring import BitWriter, Bits, BitStream, pack
+
+
+class Writing(unittest.TestCase):
+
+    def testEmpty(self):
+        w = BitWriter()
+        self.assertEqual(w.len, 0)
+        self.assertEqual(len(w), 0)
+        s = w.getvalue()
+        self.assertTrue(isinstance(s, BitStream))
+        self.assertEqual(s, BitStream())
+
+    def testWriteUint(self):
+        w = BitWriter()
+        w.write_uint(244, 12)
+        w.write_uint(1, 1)
+        self.assertEqual(w.len, 13)
+        self.assertEqual(w.getvalue(), '0x0f4, 0b1')
+        self.assertRaises(bitstring.CreationError, w.write_uint, 4096, 12)
+        self.assertRaises(bitstring.CreationError, w.write_uint, -1, 12)
+        self.assertRaises(bitstring.CreationError, w.write_uint, 0, 0)
+        self.assertEqual(w.len, 13)
+
+    def testWriteInt(self):
+        w = BitWriter()
+        w.write_int(-1, 3)
+        w.write_int(5, 8)
+        w.write_int(-128, 8)
+        self.assertEqual(w.getvalue(), '0b111, 0x05, 0x80')
+        self.assertRaises(bitstring.CreationError, w.write_int, 4, 3)
+        self.assertRaises(bitstring.CreationError, w.write_int, -5, 3)
+
+    def testWriteExpGolomb(self):
+        w = BitWriter()
+        for i in range(100):
+            w.write_ue(i)
+            w.write_se(i - 50)
+        s = w.getvalue()
+        for i in range(100):
+            self.assertEqual(s.readlist('ue, se'), [i, i - 50])
+        self.assertRaises(bitstring.CreationError, w.write_ue, -1)
+
+    def testWriteBits(self):
+        w = BitWriter()
+        w.write_bits('0b1')
+        w.write_bits(Bits())
+        w.write_bits(Bits(uint=3, length=5000))
+        w.bytealign()
+        w.write_bits(Bits(uint=5, length=3003))
+        self.assertEqual(w.getvalue(), Bits('0b1, uint:5000=3, 0b0000000, uint:3003=5'))
+
+    def testWrite(self):
+        w = BitWriter()
+        w.write('uint:12=244, float:32=0.4')
+        w.write('int:8, ue, se', -3, 10, -2)
+        w.write('hex=h, bin:3', '0b101', h='ff')
+        w.write(['bits', 'pad:2'], '0o7')
+        self.assertEqual(w.getvalue(), pack('uint:12=244, float:32=0.4, int:8=-3, ue=10, se=-2, '
+                                            '0xff, 0b101, 0o7, pad:2'))
+
+    def testWriteErrors(self):
+        w = BitWriter()
+        w.write_uint(1, 1)
+        self.assertRaises(bitstring.CreationError, w.write, 'uint:8', 1, 2)
+        self.assertRaises(bitstring.CreationError, w.write, 'uint:8, uint:8', 1)
+        self.assertRaises(bitstring.CreationError, w.write, 'uint:8, uint:8', 1, 256)
+        self.assertRaises(bitstring.CreationError, w.write, 'uint:8, ue', 1, -1)
+        self.assertEqual(w.getvalue(), '0b1')
+
+    def testNonIntegralValues(self):
+        w = BitWriter()
+        for fmt in ('uint:8', 'int:8', 'ue', 'se', 'uintle:16', 'uint:8, uint:8'):
+            self.assertRaises(bitstring.CreationError, w.write, fmt, *[2.5] * len(fmt.split(',')))
+        self.assertRaises(bitstring.CreationError, w.write, 'uint:8', 'x')
+        w.write('uint:8, int:8=-3, ue', 2.0, True)
+        self.assertEqual(w.getvalue(), '0x02fd, 0b010')
+
+    def testByteAlign(self):
+        w = BitWriter()
+        self.assertEqual(w.bytealign(), 0)
+        w.write_uint(1, 3)
+        self.assertEqual(w.bytealign(), 5)
+        self.assertEqual(w.bytealign(), 0)
+        self.assertEqual(w.getvalue(), '0x20')
+
+    def testManyWrites(self):
+        w = BitWriter()
+        s = BitStream()
+        for i in range(5000):
+            w.write_uint(i, 13)
+            s.append(Bits(uint=i, length=13))
+        self.assertEqual(w.len, 65000)
+        self.assertEqual(w.getvalue(), s)
+
+
+class Streaming(unittest.TestCase):
+
+    def testFile(self):
+        f = io.BytesIO()
+        w = BitWriter(f)
+        for i in range(1000):
+            w.write_uint(i & 0xfff, 12)
+        self.assertEqual(f.getvalue(), b'')
+        w.write_bits(Bits(bytes=b'\x01' * (1 << 20)))
+        self.assertTrue(len(f.getvalue()) > 0)
+        w.write_uint(1, 1)
+        w.flush()
+        self.assertEqual(len(f.getvalue()), 1500 + (1 << 20))
+        self.assertEqual(w.len, 8 * (1500 + (1 << 20)) + 1)
+        w.bytealign()
+        w.flush()
+        data = f.getvalue()
+        self.assertEqual(len(data), 1501 + (1 << 20))
+        self.assertEqual(data[:3], Bits('uint:12=0, uint:12=1').tobytes())
+        self.assertEqual(data[-2:], b'\x01\x80')
+        self.assertRaises(bitstring.Error, w.getvalue)
+
+    def testFlushWithoutFile(self):
+        w = BitWriter()
+        self.assertRaises(bitstring.Error, w.flush)
+        self.assertRaises(bitstring.Error, w.close)
+
+    def testBufferSize(self):
+        f = io.BytesIO()
+        w = BitWriter(f, buffersize=100)
+        for i in range(10000):
+            w.write_uint(i & 0xff, 9)
+            self.assertTrue(len(w._buffer) < 250)
+        self.assertTrue(len(f.getvalue()) > 10000)
+
+    def testClose(self):
+        f = io.BytesIO()
+        w = BitWriter(f, buffersize=10)
+        w.write('0xabcde, 0b1')
+        w.close()
+        self.assertEqual(f.getvalue(), Bits('0xabcde, 0b1').tobytes())
+        self.assertEqual(w.len, 24)
+        w.close()
+        self.assertEqual(f.getvalue(), b'\xab\xcd\xe8')
+        self.assertFalse(f.closed)
+
+    def testWithStatement(self):
+        f = io.BytesIO()
+        with BitWriter(f) as w:
+            w.write_ue(3)
+        self.assertEqual(f.getvalue(), b'\x20')
+
+    def testWithStatementException(self):
+        f = io.BytesIO()
+        try:
+            with BitWriter(f) as w:
+                w.write('0xabc')
+                raise KeyError('x')
+        except KeyError:
+            pass
+        else:
+            self.fail("KeyError not raised")
+        self.assertEqual(f.getvalue(), b'')
+        with BitWriter() as w:
+            w.write('0b1')
+        self.assertEqual(w.getvalue(), '0b1')
+        self.assertRaises(KeyError, self.writeAndFail)
+
+    def writeAndFail(self):
+        with BitWriter() as w:
+            w.write('0b1')
+            raise KeyError('x')
+
+    def testSocket(self):
+        class FakeSocket(object):
+            def __init__(self):
+                self.sent = []
+            def sendall(self, data):
+                self.sent.append(data)
+        sock = FakeSocket()
+        w = BitWriter(sock)
+        w.write('0xabc, 0b1111')
+        w.flush()
+        self.assertEqual(b''.join(sock.sent), b'\xab\xcf')
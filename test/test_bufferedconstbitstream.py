@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Unit tests for the BufferedConstBitStream class.
+"""
+
+import unittest
+import sys
+import io
+import gzip
+import random
+
+sys.path.insert(0, '..')
+import bitstring
+from bitstring import BufferedConstBitStream, ConstBitStream, Bits
+
+random.seed(41)
+DATA = bytes(bytearray(random.getrandbits(8) for _ in range(20000)))
+
+
+class TrickleReader(object):
+    """A non-seekable source that returns at most a few bytes at a time."""
+
+    def __init__(self, data, most=7):
+        self.f = io.BytesIO(data)
+        self.most = most
+        self.requests = 0
+
+    def read(self, n):
+        self.requests += 1
+        return self.f.read(min(n, self.most))
+
+
+class FakeSocket(object):
+
+    def __init__(self, data):
+        self.f = io.BytesIO(data)
+
+    def recv(self, n):
+        return self.f.read(min(n, 100))
+
+
+class Reading(unittest.TestCase):
+
+    def testReadMatchesConstBitStream(self):
+        b = BufferedConstBitStream(TrickleReader(DATA), chunksize=16)
+        c = ConstBitStream(bytes=DATA)
+        fmts = ['uint:3', 'bytes:5', 'int:17', 'ue', 'bits:40', 'hex:12', 'bool', 7]
+        for i in range(2000):
+            f = fmts[i % len(fmts)]
+            self.assertEqual(b.read(f), c.read(f))
+            self.assertEqual(b.pos, c.pos)
+
+    def testReadList(self):
+        b = BufferedConstBitStream(TrickleReader(DATA))
+        c = ConstBitStream(bytes=DATA)
+        self.assertEqual(b.readlist('uint:a, 3*int:5, bytes:2', a=12),
+                         c.readlist('uint:a, 3*int:5, bytes:2', a=12))
+        self.assertEqual(b.readlist(['se', 'hex:8']), c.readlist(['se', 'hex:8']))
+        self.assertEqual(b.pos, c.pos)
+
+    def testStretchyToken(self):
+        b = BufferedConstBitStream(TrickleReader(b'\x01\x02\x03'))
+        self.assertEqual(b.readlist('uint:4, bits'), [0, Bits('0x10203')])
+        self.assertEqual(b.pos, 24)
+        self.assertRaises(bitstring.ReadError, b.read, 1)
+
+    def testReadPastEnd(self):
+        b = BufferedConstBitStream(TrickleReader(b'\xff\x00'))
+        b.read(4)
+        self.assertRaises(bitstring.ReadError, b.read, 'uint:13')
+        self.assertEqual(b.pos, 4)
+        self.assertEqual(b.read('uint:12'), 0xf00)
+
+    def testPeek(self):
+        b = BufferedConstBitStream(TrickleReader(b'\x01\x02\x03'))
+        self.assertEqual(b.peek(12), '0x010')
+        self.assertEqual(b.peeklist('2*uint:4'), [0, 1])
+        self.assertEqual(b.pos, 0)
+        self.assertEqual(b.read('uint:8'), 1)
+
+    def testByteAlign(self):
+        b = BufferedConstBitStream(io.BytesIO(b'\x0f\xf0'))
+        self.assertEqual(b.bytealign(), 0)
+        b.read(3)
+        self.assertEqual(b.bytealign(), 5)
+        self.assertEqual(b.pos, 8)
+        self.assertEqual(b.read('hex:8'), 'f0')
+
+    def testReadResultsAreCopies(self):
+        b = BufferedConstBitStream(io.BytesIO(DATA), chunksize=16)
+        x = b.read('bits:64')
+        b.read('bytes:10000')
+        self.assertEqual(x.bytes, DATA[:8])
+
+    def testBytesViewIsCopied(self):
+        b = BufferedConstBitStream(io.BytesIO(DATA), chunksize=16)
+        views = [b.read('bytesview:100') for i in range(100)]
+        self.assertEqual(b''.join(v.tobytes() for v in views), DATA[:10000])
+
+    def testVLCTable(self):
+        t = bitstring.VLCTable({'0b1': 0, '0b01': 1, '0b001': 2})
+        source = TrickleReader(b'\xa4' + b'\x00' * 10000, most=1)
+        b = BufferedConstBitStream(source, chunksize=1)
+        self.assertEqual([b.read(t) for i in range(3)], [0, 1, 2])
+        # 0b000 isn't in the table, which is found without reading the rest of the source.
+        self.assertRaises(bitstring.ReadError, b.read, t)
+        self.assertRaises(bitstring.ReadError, b.peek, t)
+        self.assertTrue(source.requests < 10)
+        self.assertEqual(b.read('uint:2'), 0)
+
+    def testSocket(self):
+        b = BufferedConstBitStream(FakeSocket(DATA))
+        self.assertEqual(b.read('bytes:1000'), DATA[:1000])
+
+    def testGzip(self):
+        compressed = io.BytesIO()
+        g = gzip.GzipFile(fileobj=compressed, mode='wb')
+        g.write(DATA)
+        g.close()
+        compressed.seek(0)
+        b = BufferedConstBitStream(gzip.GzipFile(fileobj=compressed, mode='rb'))
+        b.read(4)
+        self.assertEqual(b.read('bits:800'), Bits(bytes=DATA)[4:804])
+
+
+class Buffering(unittest.TestCase):
+
+    def testConsumedDataDiscarded(self):
+        b = BufferedConstBitStream(TrickleReader(DATA, most=64), chunksize=64)
+        for i in range(len(DATA) // 4):
+            b.read('uint:32')
+        self.assertTrue(len(b._data) <= 256)
+
+    def testMaxBuffer(self):
+        b = BufferedConstBitStream(io.BytesIO(DATA), chunksize=100, maxbuffer=1000)
+        self.assertEqual(b.read('bytes:1000'), DATA[:1000])
+        self.assertRaises(bitstring.Error, b.read, 'bytes:1001')
+        self.assertEqual(b.read('bytes:900'), DATA[1000:1900])
+
+    def testLongReadFetchesInFewRequests(self):
+        source = TrickleReader(DATA, most=len(DATA))
+        b = BufferedConstBitStream(source, chunksize=16)
+        b.read('bytes:16000')
+        self.assertTrue(source.requests < 15)
+
+
+class Finding(unittest.TestCase):
+
+    def testFindMatchesConstBitStream(self):
+        for bytealigned in (False, True):
+            b = BufferedConstBitStream(TrickleReader(DATA), chunksize=32)
+            c = ConstBitStream(bytes=DATA)
+            while True:
+                found = b.find('0xab', bytealigned=bytealigned)
+                self.assertEqual(found, c.find('0xab', start=c.pos, bytealigned=bytealigned))
+                if not found:
+                    break
+                b.read(1)
+                c.read(1)
+
+    def testFindAcrossChunks(self):
+        data = b'\x00' * 99 + b'\x12\x34' + b'\x00' * 10
+        b = BufferedConstBitStream(TrickleReader(data), chunksize=10)
+        self.assertEqual(b.find('0x1234'), (99 * 8,))
+        self.assertEqual(b.read('hex:16'), '1234')
+
+    def testFindNotFound(self):
+        b = BufferedConstBitStream(TrickleReader(b'\x00' * 50), chunksize=10)
+        self.assertEqual(b.find('0b1'), ())
+        self.assertEqual(b.pos, 400)
+        self.assertRaises(ValueError, b.find, '')
+
+    def testReadTo(self):
+        data = b'\x01\x02' * 10 + b'\xff\xfe' + b'\x00' * 5
+        b = BufferedConstBitStream(TrickleReader(data), chunksize=4)
+        b.read(8)
+        self.assertEqual(b.readto('0xfffe', bytealigned=True).bytes, data[1:22])
+        self.assertEqual(b.pos, 22 * 8)
+        self.assertRaises(bitstring.ReadError, b.readto, '0xff')
+        self.assertEqual(b.pos, 22 * 8)
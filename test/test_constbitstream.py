@@ -2,10 +2,22 @@
 
 import unittest
 import sys
+import os
+import gzip
+import json
 sys.path.insert(0, '..')
 import bitstring
 from bitstring import ConstBitStream as CBS
 
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
 class All(unittest.TestCase):
     def testFromFile(self):
         s = CBS(filename='test.m1v')
@@ -25,6 +37,20 @@ class InterleavedExpGolomb(unittest.TestCase):
         u = s.unpack('uie, 2*sie, uie')
         self.assertEqual(u, [12, -9, 9, 1000000])
 
+    def testCreation(self):
+        self.assertEqual(CBS(uie=0).bin, '1')
+        self.assertEqual(CBS(uie=1).bin, '001')
+        self.assertEqual(CBS(uie=4).bin, '00011')
+        self.assertEqual(CBS(uie=5).bin, '01001')
+        self.assertEqual(CBS(sie=0).bin, '1')
+        self.assertEqual(CBS(sie=1).bin, '0010')
+        self.assertEqual(CBS(sie=-4).bin, '000111')
+        for i in range(-300, 300):
+            self.assertEqual(CBS(sie=i).sie, i)
+            self.assertEqual(CBS(uie=abs(i)).uie, abs(i))
+        self.assertEqual(CBS(uie=2**70 + 5).uie, 2**70 + 5)
+        self.assertRaises(bitstring.CreationError, CBS, uie=-1)
+
     def testReadingErrors(self):
         s = CBS(10)
         self.assertRaises(bitstring.ReadError, s.read, 'uie')
@@ -119,3 +145,309 @@ class ReadingBytes(unittest.TestCase):
         t = s.unpack('pad:a, bytes:b, bytes, pad:a', a=4, b=6)
         self.assertEqual(t, [b'\x55'*6, b'\x55'*3])
 
+
+
+class ReadArray(unittest.TestCase):
+    def testReadUint(self):
+        s = CBS('0x001002003004')
+        a = s.readarray('uint:12', 3)
+        self.assertEqual(a.typecode, 'H')
+        self.assertEqual(list(a), [1, 2, 3])
+        self.assertEqual(s.pos, 36)
+        self.assertEqual(list(s.readarray('uint:12')), [4])
+        self.assertEqual(list(s.readarray('uint:12')), [])
+
+    def testReadUnaligned(self):
+        s = CBS('0b1, int:7=-3, int:7=63, int:7=-64, 0b1')
+        s.pos = 1
+        self.assertEqual(list(s.readarray('int:7', 3)), [-3, 63, -64])
+        self.assertEqual(s.pos, 22)
+
+    def testReadManyMatchesReadlist(self):
+        s = CBS(bytes=bytearray(range(256)) * 3, offset=5)
+        expected = s.readlist('{0}*uint:13'.format(s.len // 13))
+        s.pos = 0
+        self.assertEqual(list(s.readarray('uint:13')), expected)
+        s.pos = 0
+        expected = s.readlist('{0}*int:13'.format(s.len // 13))
+        s.pos = 0
+        self.assertEqual(list(s.readarray('int:13')), expected)
+
+    def testReadWholeBytes(self):
+        s = CBS('0x0001ff00, 0x0100feff')
+        self.assertEqual(list(s.readarray('uint:16', 2)), [1, 0xff00])
+        self.assertEqual(list(s.readarray('intle:16', 2)), [1, -2])
+        s.pos = 40
+        self.assertEqual(list(s.readarray('uintle:16')), [0xfe00])
+        s.pos = 36
+        self.assertEqual(list(s.readarray('uintle:16')), [0x0f10])
+
+    def testReadFloats(self):
+        s = CBS('float:32=0.5, float:32=-2.0, floatle:64=1.25')
+        self.assertEqual(list(s.readarray('float:32', 2)), [0.5, -2.0])
+        self.assertEqual(list(s.readarray('floatle:64', 1)), [1.25])
+
+    def testReadOtherTokens(self):
+        s = CBS('0b1011, 0xabc')
+        self.assertEqual(s.readarray('bool', 4), [True, False, True, True])
+        self.assertEqual(s.readarray('hex:4'), ['a', 'b', 'c'])
+
+    def testLargeWidth(self):
+        s = CBS('uint:100=5, uint:100=6')
+        self.assertEqual(s.readarray('uint:100'), [5, 6])
+
+    def testErrors(self):
+        s = CBS('0x001002')
+        self.assertRaises(bitstring.ReadError, s.readarray, 'uint:12', 3)
+        self.assertEqual(s.pos, 0)
+        self.assertRaises(ValueError, s.readarray, 'uint:12, uint:12')
+        self.assertRaises(ValueError, s.readarray, 'uint:12=3')
+        self.assertRaises(ValueError, s.readarray, 'bin')
+        self.assertRaises(ValueError, s.readarray, 'uint:12', -1)
+
+    def testReadExpGolomb(self):
+        s = CBS('ue=0, ue=5, ue=1000000, se=-3, se=0, se=7, uie=12, 0b000111, 0b1')
+        self.assertEqual(s.readarray('ue', 3), [0, 5, 1000000])
+        self.assertEqual(s.readarray('se', 3), [-3, 0, 7])
+        self.assertEqual(s.readarray('uie', 1), [12])
+        self.assertEqual(s.readarray('sie', 1), [-4])
+        self.assertEqual(s.readarray('ue'), [0])
+        self.assertEqual(s.pos, s.len)
+
+    def testReadManyExpGolomb(self):
+        values = [i * i for i in range(1000)]
+        s = CBS('0b1') + bitstring.pack(', '.join(['se'] * 1000), *values)
+        s.pos = 1
+        self.assertEqual(s.readarray('se', 1000), values)
+        s.pos = 1
+        self.assertRaises(bitstring.ReadError, s.readarray, 'se', 1001)
+        self.assertEqual(s.pos, 1)
+        self.assertRaises(bitstring.ReadError, CBS('0x000001').readarray, 'ue')
+
+
+class ReadBytesView(unittest.TestCase):
+
+    def testAligned(self):
+        s = CBS(bytes=b'\x00abcdefgh')
+        s.pos = 8
+        v = s.read('bytesview:4')
+        self.assertTrue(isinstance(v, memoryview))
+        self.assertEqual(v.tobytes(), b'abcd')
+        # A view of the bitstring's data, not a copy.
+        s._datastore._rawarray[s._datastore.byteoffset + 1] = ord('A')
+        self.assertEqual(v.tobytes(), b'Abcd')
+        self.assertEqual(s.pos, 40)
+        v, rest = s.readlist('bytesview:n, bits', n=2)
+        self.assertEqual(v.tobytes(), b'ef')
+        self.assertEqual(rest, '0x6768')
+
+    def testUnaligned(self):
+        s = CBS('0b1, 0x123456')
+        s.pos = 1
+        self.assertEqual(s.read('bytesview:2').tobytes(), b'\x12\x34')
+        self.assertEqual(s.peek('bytesview'), b'\x56')
+        self.assertRaises(bitstring.ReadError, s.read, 'bytesview:2')
+
+    def testBitStreamIsCopied(self):
+        s = bitstring.BitStream(bytes=b'abc')
+        v = s.read('bytesview:2')
+        s.append('0x64')
+        self.assertEqual(v.tobytes(), b'ab')
+
+    def testPack(self):
+        s = bitstring.pack('bytesview:3, uint:8', b'xyz', 3)
+        self.assertEqual(s, '0x78797a03')
+        self.assertEqual(s.unpack('bytesview:3, uint:8')[0].tobytes(), b'xyz')
+
+
+class AccessPattern(unittest.TestCase):
+
+    def testDefault(self):
+        s = CBS(filename='test.m1v')
+        self.assertEqual(s.accesspattern, 'normal')
+        self.assertEqual(CBS('0x1').accesspattern, 'normal')
+
+    def testSetting(self):
+        s = CBS(filename='test.m1v')
+        for pattern in ('sequential', 'random', 'normal'):
+            s.accesspattern = pattern
+            self.assertEqual(s.accesspattern, pattern)
+        self.assertRaises(ValueError, setattr, s, 'accesspattern', 'backwards')
+        t = CBS('0xabc')
+        t.accesspattern = 'sequential'
+        self.assertEqual(t.read('hex:12'), 'abc')
+
+    def testSequentialReads(self):
+        mmap = bitstring.bs.mmap
+        s = CBS(filename='test.m1v')
+        c = CBS(bytes=open('test.m1v', 'rb').read())
+        old = bitstring.bs.READAHEAD_SIZE
+        bitstring.bs.READAHEAD_SIZE = 4 * mmap.PAGESIZE
+        try:
+            s.accesspattern = 'sequential'
+            s.pos = c.pos = 4
+            while s.len - s.pos > 3000:
+                self.assertEqual(s.read('bytes:100'), c.read('bytes:100'))
+                self.assertEqual(s.readlist('uint:7, ue'), c.readlist('uint:7, ue'))
+                self.assertEqual(s.readarray('uint:8', 10), c.readarray('uint:8', 10))
+            rawarray = s._datastore._rawarray
+            if s._readahead is not None:
+                self.assertTrue(rawarray.advisedfrom <= s.pos // 8 < rawarray.nextadvice)
+                self.assertEqual(rawarray.advisedfrom % mmap.PAGESIZE, 0)
+                self.assertTrue(rawarray.droppedto > 0)
+            # Going back is fine, the pages are just read in again.
+            s.pos = c.pos = 8
+            self.assertEqual(s.read('bytes:5000'), c.read('bytes:5000'))
+            self.assertEqual(s.readto('0x000001', bytealigned=True),
+                             c.readto('0x000001', bytealigned=True))
+        finally:
+            bitstring.bs.READAHEAD_SIZE = old
+        self.assertEqual(list(s.cut(10000)), list(c.cut(10000)))
+        self.assertEqual(list(s.findall('0x000001', bytealigned=True)),
+                         list(c.findall('0x000001', bytealigned=True)))
+
+
+class CompressedFile(unittest.TestCase):
+
+    def setUp(self):
+        with open('test.m1v', 'rb') as f:
+            self.data = f.read()
+        self.names = []
+
+    def tearDown(self):
+        for name in self.names:
+            for n in (name, name + '.bsidx'):
+                if os.path.exists(n):
+                    os.remove(n)
+
+    def write(self, extension, pieces):
+        """Write the pieces to a compressed file, each as a separate stream."""
+        name = 'temp_bitstring_unit_testing_file' + extension
+        self.names.append(name)
+        with open(name, 'wb') as f:
+            for piece in pieces:
+                if extension == '.gz':
+                    g = gzip.GzipFile(fileobj=f, mode='wb')
+                    g.write(piece)
+                    g.close()
+                elif extension == '.bz2':
+                    f.write(bz2.compress(piece))
+                else:
+                    f.write(lzma.compress(piece))
+        return name
+
+    def check(self, name, data):
+        s = CBS(filename=name)
+        c = CBS(bytes=data)
+        self.assertEqual(s.len, c.len)
+        self.assertEqual(s.read('bytes:1000'), c.read('bytes:1000'))
+        s.pos = c.pos = 8 * 90000 + 3
+        self.assertEqual(s.readlist('uint:13, hex:40, ue'), c.readlist('uint:13, hex:40, ue'))
+        s.pos = c.pos = 8 * 20000 + 1
+        self.assertEqual(s.read('bits:8000'), c.read('bits:8000'))
+        self.assertEqual(s.find('0x000001b3', start=s.pos), c.find('0x000001b3', start=c.pos))
+        self.assertEqual(list(s.findall('0x000001b8', bytealigned=True)),
+                         list(c.findall('0x000001b8', bytealigned=True)))
+        self.assertEqual(s[-100:], c[-100:])
+        self.assertEqual(s.tobytes(), data)
+
+    def testGzip(self):
+        self.check(self.write('.gz', [self.data]), self.data)
+
+    def testGzipMembers(self):
+        pieces = [self.data[:50000], b'', self.data[50000:100000], self.data[100000:]]
+        name = self.write('.gz', pieces)
+        self.check(name, self.data)
+        s = CBS(filename=name)
+        self.assertEqual(s._datastore._rawarray.pointpos, [0, 50000, 100000])
+
+    def testGzipSeekPoints(self):
+        old = bitstring.bs.SEEK_POINT_SPACING, bitstring.bs.DECOMPRESS_CHUNK_SIZE
+        bitstring.bs.SEEK_POINT_SPACING = 10000
+        bitstring.bs.DECOMPRESS_CHUNK_SIZE = 1000
+        try:
+            name = self.write('.gz', [self.data])
+            s = CBS(filename=name)
+            self.assertTrue(len(s._datastore._rawarray.pointpos) > 4)
+            self.check(name, self.data)
+        finally:
+            bitstring.bs.SEEK_POINT_SPACING, bitstring.bs.DECOMPRESS_CHUNK_SIZE = old
+
+    @unittest.skipIf(bz2 is None, "bz2 module not available")
+    def testBz2(self):
+        self.check(self.write('.bz2', [self.data[:70000], self.data[70000:]]), self.data)
+
+    @unittest.skipIf(lzma is None, "lzma module not available")
+    def testXz(self):
+        self.check(self.write('.xz', [self.data]), self.data)
+
+    def testOffsetAndLength(self):
+        name = self.write('.gz', [self.data[:10], self.data[10:]])
+        s = CBS(filename=name, offset=8 * 60000 + 3, length=100)
+        self.assertEqual(s, CBS(bytes=self.data, offset=8 * 60000 + 3, length=100))
+        self.assertRaises(bitstring.CreationError, CBS, filename=name, offset=8 * len(self.data), length=1)
+        t = bitstring.BitStream(filename=name, offset=4)
+        t.append('0x1')
+        self.assertEqual(t[:-4], CBS(bytes=self.data, offset=4))
+
+    def testIndexCache(self):
+        name = self.write('.gz', [self.data[:40000], self.data[40000:]])
+        bitstring.settings.cacheindex = True
+        try:
+            s = CBS(filename=name)
+        finally:
+            bitstring.settings.cacheindex = False
+        self.assertTrue(os.path.exists(name + '.bsidx'))
+        t = CBS(filename=name)
+        self.assertEqual(t._datastore._rawarray.pointpos, [0, 40000])
+        # Made from the index, so nothing has been decompressed yet.
+        self.assertEqual(t._datastore._rawarray.outpos, 0)
+        t.pos = 8 * 40001
+        self.assertEqual(t.read('bytes:10'), self.data[40001:40011])
+        self.assertEqual(t, s)
+
+    def testIndexIgnoredIfStale(self):
+        name = self.write('.gz', [self.data])
+        with open(name + '.bsidx', 'w') as f:
+            f.write('{"size": 1, "mtime": 0, "length": 5, "points": [[0, 0]]}')
+        self.assertEqual(CBS(filename=name).len, 8 * len(self.data))
+        with open(name + '.bsidx', 'w') as f:
+            f.write('not an index')
+        self.assertEqual(CBS(filename=name).len, 8 * len(self.data))
+
+    @unittest.skipIf(sys.version_info < (3, 3), "truncation can't be detected before Python 3.3")
+    def testTruncated(self):
+        name = self.write('.gz', [self.data])
+        with open(name, 'rb') as f:
+            compressed = f.read()
+        with open(name, 'wb') as f:
+            f.write(compressed[:-100])
+        self.assertRaises(bitstring.CreationError, CBS, filename=name)
+
+    def testIndexMalformed(self):
+        name = self.write('.gz', [self.data])
+        stat = os.stat(name)
+        for points, length in [(None, None), ('[[0, 0]]', None), ('[[0]]', '5'), ('5', '5')]:
+            index = {'size': stat.st_size, 'mtime': stat.st_mtime}
+            if points is not None:
+                index['points'] = json.loads(points)
+            if length is not None:
+                index['length'] = json.loads(length)
+            with open(name + '.bsidx', 'w') as f:
+                json.dump(index, f)
+            self.assertEqual(CBS(filename=name).len, 8 * len(self.data))
+
+    def testNotCompressed(self):
+        for extension in ('.gz', '.bz2', '.xz'):
+            if extension == '.bz2' and bz2 is None or extension == '.xz' and lzma is None:
+                continue
+            name = 'temp_bitstring_unit_testing_file' + extension
+            self.names.append(name)
+            with open(name, 'wb') as f:
+                f.write(self.data[:1000])
+            self.assertRaises(bitstring.CreationError, CBS, filename=name)
+
+    def testFileObjectNotDecompressed(self):
+        name = self.write('.gz', [self.data])
+        with open(name, 'rb') as f:
+            self.assertEqual(CBS(f)[:16], '0x1f8b')
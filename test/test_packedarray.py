@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Unit tests for the PackedArray class.
+"""
+
+import unittest
+import sys
+import array
+
+sys.path.insert(0, '..')
+import bitstring
+from bitstring import PackedArray, Bits
+
+
+class Creation(unittest.TestCase):
+    def testEmpty(self):
+        a = PackedArray(12)
+        self.assertEqual(len(a), 0)
+        self.assertEqual(a.width, 12)
+        self.assertFalse(a.signed)
+        self.assertEqual(a.tolist(), [])
+        self.assertEqual(a.tobytes(), b'')
+
+    def testFromList(self):
+        a = PackedArray(12, values=[1, 2, 4095])
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a.bits, '0x001002fff')
+        self.assertEqual(a.tobytes(), b'\x00\x10\x02\xff\xf0')
+
+    def testSigned(self):
+        a = PackedArray(5, signed=True, values=[-16, -1, 0, 15])
+        self.assertEqual(a.tolist(), [-16, -1, 0, 15])
+        self.assertEqual(a.bits.bin, '10000111110000001111')
+
+    def testFromArray(self):
+        a = PackedArray(10, values=array.array('H', [1000, 3, 7]))
+        self.assertEqual(a.tolist(), [1000, 3, 7])
+
+    def testBadWidth(self):
+        self.assertRaises(ValueError, PackedArray, 0)
+        self.assertRaises(ValueError, PackedArray, -3)
+
+    def testOutOfRange(self):
+        self.assertRaises(ValueError, PackedArray, 4, values=[16])
+        self.assertRaises(ValueError, PackedArray, 4, values=[-1])
+        self.assertRaises(ValueError, PackedArray, 4, True, [8])
+        self.assertRaises(ValueError, PackedArray, 4, True, [-9])
+
+
+class Indexing(unittest.TestCase):
+    def testGetItem(self):
+        a = PackedArray(7, values=range(0, 120, 3))
+        self.assertEqual(a[0], 0)
+        self.assertEqual(a[5], 15)
+        self.assertEqual(a[-1], 117)
+        self.assertRaises(IndexError, a.__getitem__, 40)
+        self.assertRaises(IndexError, a.__getitem__, -41)
+
+    def testSetItem(self):
+        a = PackedArray(12, values=[0, 0, 0])
+        a[1] = 0xabc
+        self.assertEqual(a.bits, '0x000abc000')
+        a[-1] = 1
+        self.assertEqual(a.tolist(), [0, 0xabc, 1])
+        self.assertRaises(ValueError, a.__setitem__, 0, 4096)
+        self.assertRaises(IndexError, a.__setitem__, 3, 0)
+
+    def testSetItemSigned(self):
+        a = PackedArray(3, signed=True, values=[0] * 5)
+        a[2] = -4
+        a[4] = -1
+        self.assertEqual(a.tolist(), [0, 0, -4, 0, -1])
+
+    def testSlicing(self):
+        a = PackedArray(9, values=range(20))
+        self.assertEqual(a[3:7], PackedArray(9, values=[3, 4, 5, 6]))
+        self.assertEqual(a[::5].tolist(), [0, 5, 10, 15])
+        self.assertEqual(a[10:2].tolist(), [])
+        self.assertEqual(a[-2:].tolist(), [18, 19])
+
+    def testSetSlice(self):
+        a = PackedArray(9, values=range(10))
+        a[2:4] = [100, 101, 102]
+        self.assertEqual(a.tolist(), [0, 1, 100, 101, 102, 4, 5, 6, 7, 8, 9])
+        a[::2] = [0] * 6
+        self.assertEqual(a.tolist(), [0, 1, 0, 101, 0, 4, 0, 6, 0, 8, 0])
+        self.assertRaises(ValueError, a.__setitem__, slice(None, None, 2), [1, 2])
+
+    def testDelete(self):
+        a = PackedArray(5, values=range(10))
+        del a[0]
+        del a[2:4]
+        self.assertEqual(a.tolist(), [1, 2, 5, 6, 7, 8, 9])
+        del a[::3]
+        self.assertEqual(a.tolist(), [2, 5, 7, 8])
+
+
+class Methods(unittest.TestCase):
+    def testAppendExtend(self):
+        a = PackedArray(3)
+        a.append(5)
+        a.extend([1, 2])
+        a.extend(PackedArray(3, values=[7]))
+        self.assertEqual(a.tolist(), [5, 1, 2, 7])
+        self.assertEqual(list(a), [5, 1, 2, 7])
+        self.assertRaises(ValueError, a.append, 8)
+
+    def testFromBytes(self):
+        a = PackedArray(12)
+        a.frombytes(b'\x00\x10\x02\xff\xf0')
+        self.assertEqual(a.tolist(), [1, 2, 4095])
+
+    def testToArray(self):
+        self.assertEqual(PackedArray(12, values=[1, 2]).toarray().typecode, 'H')
+        self.assertEqual(PackedArray(8, True, [-1]).toarray().typecode, 'b')
+        self.assertEqual(PackedArray(12, values=[1, 2]).toarray('l'), array.array('l', [1, 2]))
+        self.assertRaises(ValueError, PackedArray(100).toarray)
+
+    def testEquality(self):
+        self.assertEqual(PackedArray(4, values=[1]), PackedArray(4, values=[1]))
+        self.assertNotEqual(PackedArray(4, values=[1]), PackedArray(4, True, [1]))
+        self.assertNotEqual(PackedArray(4, values=[1]), PackedArray(5, values=[1]))
+
+    def testRepr(self):
+        a = PackedArray(12, values=[1, 2])
+        self.assertEqual(repr(a), 'PackedArray(12, signed=False, values=[1, 2])')
+
+
+if __name__ == '__main__':
+    unittest.main()
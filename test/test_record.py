@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Unit tests for the Record class.
+"""
+
+import unittest
+import sys
+import pickle
+
+sys.path.insert(0, '..')
+import bitstring
+from bitstring import Record, Bits, ConstBitStream
+
+Header = Record('Header', 'sync:uint:12, id:uint:4, pad:3, flag:bool, delta:int:6, '
+                          'scale:floatle:32, tag:bytes:2, nibble:hex:4')
+
+HEADER_BITS = Bits('0xfff3, 0b000, 0b1, int:6=-3, floatle:32=0.5, 0x6162, 0xa')
+
+
+class Creation(unittest.TestCase):
+
+    def testClass(self):
+        self.assertTrue(issubclass(Header, Record))
+        self.assertEqual(Header.__name__, 'Header')
+        self.assertEqual(Header.fields, ('sync', 'id', 'flag', 'delta', 'scale', 'tag', 'nibble'))
+        self.assertEqual(Header.length, 78)
+        self.assertEqual(Header.__slots__, Header.fields)
+
+    def testInit(self):
+        h = Header(1, 2, True, -1, 1.0, b'zz', nibble='f')
+        self.assertEqual(h.sync, 1)
+        self.assertEqual(h.nibble, 'f')
+        self.assertTrue(isinstance(h, Record))
+        self.assertRaises(TypeError, Header, 1, 2)
+        self.assertRaises(AttributeError, setattr, h, 'other', 1)
+
+    def testRepr(self):
+        h = Header(1, 2, True, -1, 1.0, b'zz', 'f')
+        self.assertEqual(repr(h), "Header(sync=1, id=2, flag=True, delta=-1, scale=1.0, tag={0!r}, "
+                                  "nibble='f')".format(b'zz'))
+
+    def testEquality(self):
+        self.assertEqual(Header(1, 2, True, -1, 1.0, b'zz', 'f'), Header(1, 2, True, -1, 1.0, b'zz', 'f'))
+        self.assertNotEqual(Header(1, 2, True, -1, 1.0, b'zz', 'f'), Header(1, 2, True, -1, 1.0, b'zz', 'e'))
+        Other = Record('Other', 'a:uint:8')
+        self.assertNotEqual(Other(1), Record('Other', 'a:uint:8')(1))
+
+    def testBadFormats(self):
+        self.assertRaises(ValueError, Record, 'R', 'uint')
+        self.assertRaises(ValueError, Record, 'R', 'a:uint:8, a:uint:8')
+        self.assertRaises(ValueError, Record, 'R', 'a:ue')
+        self.assertRaises(ValueError, Record, 'R', 'a:bits')
+        self.assertRaises(ValueError, Record, 'R', 'a:uint:8=3')
+        self.assertRaises(ValueError, Record, 'R', 'a:2*uint:8')
+        self.assertRaises(ValueError, Record, 'R', 'length:uint:8')
+        self.assertRaises(ValueError, Record, 'R', 'tobits:uint:8')
+        self.assertRaises(ValueError, Record, 'R', '_a:uint:8')
+        self.assertRaises(ValueError, Record, 'R', 'class:uint:8')
+
+    def testPickle(self):
+        global Pickled
+        Pickled = Record('Pickled', 'a:uint:3, b:bytes:1')
+        p = Pickled(5, b'q')
+        self.assertEqual(pickle.loads(pickle.dumps(p, 2)), p)
+
+
+class Decoding(unittest.TestCase):
+
+    def testFromBits(self):
+        h = Header.frombits(HEADER_BITS)
+        self.assertEqual(h, Header(4095, 3, True, -3, 0.5, b'ab', 'a'))
+        h = Header.frombits('0b1' + HEADER_BITS, 1)
+        self.assertEqual(h.delta, -3)
+        self.assertRaises(bitstring.ReadError, Header.frombits, HEADER_BITS[:-1])
+        self.assertRaises(bitstring.ReadError, Header.frombits, HEADER_BITS, 1)
+
+    def testRead(self):
+        s = ConstBitStream(HEADER_BITS * 3 + '0b1')
+        self.assertEqual([Header.read(s).sync for _ in range(3)], [4095] * 3)
+        self.assertEqual(s.pos, 3 * 78)
+        self.assertRaises(bitstring.ReadError, Header.read, s)
+        self.assertEqual(s.pos, 3 * 78)
+
+    def testOnlyInts(self):
+        R = Record('R', 'a:uint:1, b:int:64, pad:7, c:bool, d:uint:100')
+        b = Bits('0b1, int:64=-5, 0b0000000, 0b0, uint:100=12345')
+        self.assertEqual(R.frombits(b), R(1, -5, False, 12345))
+        self.assertEqual(R.frombits(b).tobits(), b)
+
+    def testNoFields(self):
+        R = Record('R', 'pad:8')
+        self.assertEqual(R.length, 8)
+        self.assertEqual(R.frombits('0xff').tobits(), '0x00')
+        self.assertEqual(Record('E', '').frombits('').tobits(), Bits())
+
+
+class Encoding(unittest.TestCase):
+
+    def testToBits(self):
+        h = Header.frombits(HEADER_BITS)
+        self.assertEqual(h.tobits(), HEADER_BITS)
+        self.assertTrue(isinstance(h.tobits(), Bits))
+
+    def testRoundTrip(self):
+        R = Record('R', 'a:uintle:16, b:intbe:16, c:float:64, d:bin:3, e:oct:3, f:int:9, g:uint:9')
+        r = R(513, -2, 0.1, '101', '7', -256, 511)
+        self.assertEqual(R.frombits(r.tobits()), r)
+        self.assertEqual(r.tobits(), bitstring.pack('uintle:16=513, intbe:16=-2, float:64=0.1, '
+                                                    '0b101, 0o7, int:9=-256, uint:9=511'))
+
+    def testNegativeZero(self):
+        R = Record('R', 'a:float:32, b:uint:8')
+        self.assertEqual(R(0.0, 1).tobits(), '0x00000000, 0x01')
+        self.assertEqual(R(-0.0, 1).tobits(), '0x80000000, 0x01')
+
+    def testRangeErrors(self):
+        h = Header.frombits(HEADER_BITS)
+        h.sync = 4096
+        self.assertRaises(bitstring.CreationError, h.tobits)
+        h.sync = -1
+        self.assertRaises(bitstring.CreationError, h.tobits)
+        h.sync = 0
+        h.delta = 32
+        self.assertRaises(bitstring.CreationError, h.tobits)
+        h.delta = -33
+        self.assertRaises(bitstring.CreationError, h.tobits)
+        h.delta = -32
+        h.tag = b'abc'
+        self.assertRaises(bitstring.CreationError, h.tobits)
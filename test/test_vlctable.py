@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Unit tests for the VLCTable class.
+"""
+
+import unittest
+import sys
+import random
+
+sys.path.insert(0, '..')
+import bitstring
+from bitstring import VLCTable, Bits, ConstBitStream
+
+
+UNARY = {'0b1': 0, '0b01': 1, '0b001': 2, '0b000': 3}
+
+
+def randomcode(n, seed):
+    """Return a dictionary of n random prefix-free binary strings to their index."""
+    r = random.Random(seed)
+    codes = ['']
+    while len(codes) < n:
+        # Split a random code into two longer ones.
+        c = codes.pop(r.randrange(len(codes)))
+        codes.extend([c + '0', c + '1'])
+    return dict((c, i) for i, c in enumerate(codes))
+
+
+class Creation(unittest.TestCase):
+
+    def testCreation(self):
+        t = VLCTable(UNARY)
+        self.assertEqual(len(t), 4)
+        self.assertEqual(t.maxlength, 3)
+        self.assertEqual(t.levelbits, 3)
+        self.assertEqual(t.codes[Bits('0b001')], 2)
+
+    def testLevelBits(self):
+        codes = dict(('0b' + c, v) for c, v in randomcode(50, 1).items())
+        t = VLCTable(codes, levelbits=4)
+        self.assertEqual(t.levelbits, 4)
+        self.assertTrue(t.maxlength > 4)
+        t = VLCTable(codes, 1000)
+        self.assertEqual(t.levelbits, t.maxlength)
+
+    def testCodeTypes(self):
+        t = VLCTable({Bits('0b1'): 'x', '0x0': 'y', '0b01': 'z'})
+        s = ConstBitStream('0b1, 0x0, 0b01')
+        self.assertEqual(s.readarray(t), ['x', 'y', 'z'])
+
+    def testErrors(self):
+        self.assertRaises(ValueError, VLCTable, {'0b1': 0, '0b10': 1})
+        self.assertRaises(ValueError, VLCTable, {'0b1': 0, Bits('0b1'): 1})
+        self.assertRaises(ValueError, VLCTable, {'': 0})
+        self.assertRaises(ValueError, VLCTable, {})
+        self.assertRaises(ValueError, VLCTable, UNARY, 0)
+
+
+class Reading(unittest.TestCase):
+
+    def testRead(self):
+        t = VLCTable(UNARY)
+        s = ConstBitStream('0b1010010001')
+        self.assertEqual(s.read(t), 0)
+        self.assertEqual(s.pos, 1)
+        self.assertEqual(s.peek(t), 1)
+        self.assertEqual(s.pos, 1)
+        self.assertEqual(s.read(t), 1)
+        self.assertEqual(s.read(t), 2)
+        self.assertEqual(s.read(t), 3)
+        self.assertEqual(s.read(t), 0)
+        self.assertRaises(bitstring.ReadError, s.read, t)
+
+    def testReadArray(self):
+        t = VLCTable(UNARY)
+        s = ConstBitStream('0b1010010001')
+        self.assertEqual(s.readarray(t, 2), [0, 1])
+        self.assertEqual(s.pos, 3)
+        self.assertEqual(s.readarray(t), [2, 3, 0])
+        self.assertEqual(s.pos, 10)
+        self.assertEqual(s.readarray(t), [])
+        self.assertEqual(s.readarray(t, 0), [])
+        self.assertRaises(ValueError, s.readarray, t, -1)
+
+    def testUnpackArray(self):
+        t = VLCTable(UNARY)
+        b = Bits('0b1010010001')
+        self.assertEqual(b.unpack_array(t), [0, 1, 2, 3, 0])
+        self.assertEqual(b.unpack_array(t, 3), [0, 1, 2])
+
+    def testTruncated(self):
+        t = VLCTable({'0b1': 0, '0b0000000001': 1, '0b0000000000': 2}, levelbits=4)
+        s = ConstBitStream('0b1, 0b000000000')
+        self.assertRaises(bitstring.ReadError, s.readarray, t)
+        self.assertEqual(s.pos, 0)
+        s.pos = 1
+        self.assertRaises(bitstring.ReadError, s.read, t)
+        self.assertEqual(s.pos, 1)
+        s = ConstBitStream('0b10')
+        self.assertRaises(bitstring.ReadError, s.readarray, t, 2)
+
+    def testNoMatch(self):
+        t = VLCTable({'0b1': 0, '0b01': 1})
+        s = ConstBitStream('0b101100')
+        self.assertEqual(s.readarray(t, 3), [0, 1, 0])
+        self.assertRaises(bitstring.ReadError, s.read, t)
+        s.pos = 0
+        self.assertRaises(bitstring.ReadError, s.readarray, t)
+
+    def testRandomCodes(self):
+        r = random.Random(7)
+        for n, levelbits in ((2, 8), (40, 3), (300, 8), (300, 5), (1000, 1)):
+            codes = randomcode(n, n)
+            t = VLCTable(dict(('0b' + c, v) for c, v in codes.items()), levelbits)
+            byvalue = dict((v, c) for c, v in codes.items())
+            values = [r.randrange(n) for _ in range(3000)]
+            s = ConstBitStream(bin=''.join(byvalue[v] for v in values))
+            self.assertEqual(s.readarray(t), values)
+            self.assertEqual(s.pos, s.len)
+            s.pos = 0
+            self.assertEqual([s.read(t) for _ in range(100)], values[:100])
+            self.assertEqual(s.readarray(t, 1000), values[100:1100])
+            self.assertEqual(s[s.pos:].unpack_array(t), values[1100:])